@@ -0,0 +1,323 @@
+# Benchmark: compile synthetic programs of several shapes and report
+# per-stage throughput, peak memory and output sizes...
+#
+# Each shape stresses one part of the compiler: long straight-line
+# declaration blocks, deeply nested parentheses, deeply nested if/else, one
+# long while body, expressions wide enough to run out of registers, and the
+# mixed program from bench_lexer. Stage times are the best of --repeat runs
+# through compiler.compile_source with a profiling.Profiler; peaks come from one
+# more run with tracemalloc on. --save writes the results as sorted JSON so
+# two commits can be compared with --compare (or a plain diff).
+#
+# --operand-keys instead times the operand bookkeeping every back-end pass
+# does: one sweep over the -O2 TAC collecting the positions of each
+# operand, keyed by the interned operand strings, by dense integer IDs in
+# a dict, and by the same IDs indexing a list. It bounds what carrying
+# symbol IDs in Quads instead of strings could save.
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+
+from bench_lexer import make_source
+from compiler import compile_source
+from profiling import Profiler
+
+_STAGES = ('lex', 'parse', 'optimize', 'codegen', 'peephole', 'schedule')
+
+
+# -- program generators --
+
+def straight_line(n, rnd):
+    """n declarations, each initialized from earlier ones."""
+    out = ["int v0 = 1;"]
+    for i in range(1, n):
+        a, b = rnd.randrange(i), rnd.randrange(i)
+        out.append(f"int v{i} = v{a} * {rnd.randint(2, 9)} + v{b} - {rnd.randint(0, 99)};")
+    out.append(f"print(v{n - 1});")
+    return "\n".join(out) + "\n"
+
+
+def nested_parens(n, rnd):
+    """One assignment whose expression is n parentheses deep."""
+    e = "a"
+    for _ in range(n):
+        e = f"({e} {rnd.choice('+-*')} {rnd.choice(('a', 'b', str(rnd.randint(1, 9))))})"
+    return f"int a = 3, b = 4, x;\nx = {e};\nprint(x);\n"
+
+
+def nested_if(n, rnd):
+    """if/else statements nested n deep."""
+    out = ["int a = 0, b = 0;"]
+    for i in range(n):
+        out.append(f"{'  ' * i}if (a < {rnd.randint(0, n)}) {{")
+        out.append(f"{'  ' * i}  a = a + {rnd.randint(1, 3)};")
+    for i in reversed(range(n)):
+        out.append(f"{'  ' * i}}} else {{ b = b - {rnd.randint(1, 3)}; }}")
+    out.append("print(a); print(b);")
+    return "\n".join(out) + "\n"
+
+
+def long_while(n, rnd):
+    """One loop whose body is n assignments."""
+    names = [f"w{i}" for i in range(16)]
+    out = [f"int i = 0, {', '.join(names)};", "while (i < 10) {"]
+    for _ in range(n):
+        a, b, c = rnd.sample(names, 3)
+        out.append(f"  {a} = {b} {rnd.choice('+-*')} {c} + i;")
+    out += ["  i = i + 1;", "}", f"print({names[0]});"]
+    return "\n".join(out) + "\n"
+
+
+def register_pressure(n, rnd, width=16):
+    """n assignments, each a balanced tree of `width` leaves, so many temps
+    are live at once."""
+    names = [f"r{i}" for i in range(width)]
+    out = [f"int {', '.join(names)}, x;"]
+    for _ in range(n):
+        terms = rnd.sample(names, width)
+        while len(terms) > 1:
+            terms = [f"({terms[i]} {rnd.choice('+-*')} {terms[i + 1]})"
+                     for i in range(0, len(terms), 2)]
+        out.append(f"x = {terms[0]};")
+    out.append("print(x);")
+    return "\n".join(out) + "\n"
+
+
+def mixed(n, rnd):
+    """bench_lexer's program: declarations, expressions, ifs and loops."""
+    return make_source(n, seed=rnd.randrange(1 << 30))
+
+
+# shape -> (generator, default size)
+SHAPES = {
+    'straight': (straight_line, 10000),
+    'parens': (nested_parens, 2000),
+    'nested_if': (nested_if, 1000),
+    'while': (long_while, 10000),
+    'pressure': (register_pressure, 2000),
+    'mixed': (mixed, 5000),
+}
+
+
+def make_program(shape, size=None, seed=0):
+    gen, default = SHAPES[shape]
+    return gen(default if size is None else size, random.Random(seed))
+
+
+# -- measuring --
+
+def measure(src, opt_level=0, num_registers=4, allocator="linear", repeat=3):
+    """Best per-stage seconds over repeat compiles, plus counts and peaks."""
+    best = {}
+    counts = {}
+    for _ in range(repeat):
+        prof = Profiler()
+        compile_source(src, opt_level, num_registers, allocator, profiler=prof)
+        for st in prof.stages:
+            best[st.name] = min(best.get(st.name, st.seconds), st.seconds)
+            counts[st.name] = st.counts
+    prof = Profiler(memory=True)
+    compile_source(src, opt_level, num_registers, allocator, profiler=prof)
+    prof.close()
+    peaks = {st.name: st.peak_bytes for st in prof.stages}
+
+    last = 'peephole' if 'peephole' in counts else 'codegen'
+    asm = counts[last]['instructions_out' if last == 'peephole' else 'instructions']
+    r = {
+        'bytes': counts['lex']['bytes'],
+        'tokens': counts['lex']['tokens'],
+        'quads': counts['parse']['quads'],
+        'temps': counts['parse']['temps'],
+        'labels': counts['parse']['labels'],
+        'instructions': asm,
+        'spills': counts['codegen']['spills'],
+        'seconds': {s: best[s] for s in _STAGES if s in best},
+        'peak_kib': {s: round(peaks[s] / 1024, 1) for s in _STAGES if s in peaks},
+    }
+    r['tokens_per_s'] = round(r['tokens'] / best['lex'])
+    r['quads_per_s'] = round(r['quads'] / best['parse'])
+    r['instructions_per_s'] = round(counts['codegen']['instructions'] / best['codegen'])
+    return r
+
+
+def run(shapes, scale=1.0, opt_level=0, num_registers=4, allocator="linear", repeat=3, seed=0):
+    results = {}
+    for shape in shapes:
+        size = max(1, int(SHAPES[shape][1] * scale))
+        r = measure(make_program(shape, size, seed), opt_level, num_registers, allocator, repeat)
+        r['size'] = size
+        results[shape] = r
+    return {'meta': _meta(opt_level, num_registers, allocator, scale, seed),
+            'results': results}
+
+
+def _meta(opt_level, num_registers, allocator, scale, seed):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'opt_level': opt_level, 'registers': num_registers, 'allocator': allocator,
+            'scale': scale, 'seed': seed}
+
+
+# -- operand keys --
+
+def _positions_by_key(rows):
+    # operand -> positions it appears at, in a dict
+    out = {}
+    get = out.get
+    for i, row in enumerate(rows):
+        for x in row:
+            if x is not None:
+                ev = get(x)
+                if ev is None:
+                    ev = out[x] = []
+                ev.append(i)
+    return out
+
+
+def _positions_by_index(rows, n):
+    # the same with operands numbered 0..n-1 (None as -1), in a list
+    out = [None] * n
+    for i, row in enumerate(rows):
+        for x in row:
+            if x >= 0:
+                ev = out[x]
+                if ev is None:
+                    ev = out[x] = []
+                ev.append(i)
+    return out
+
+
+def _best(func, args, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def operand_keys(shapes, scale=1.0, repeat=5, seed=0):
+    """shape -> quads, compile seconds at -O2 and the seconds of one operand
+    sweep keyed by string, by integer ID and indexed by integer ID."""
+    results = {}
+    for shape in shapes:
+        size = max(1, int(SHAPES[shape][1] * scale))
+        src = make_program(shape, size, seed)
+        prof = Profiler()
+        code = compile_source(src, 2, profiler=prof).tac_code
+        names = [(q.arg1, q.arg2, q.dest) for q in code]
+        ids = {}
+        numbered = [tuple(-1 if x is None else ids.setdefault(x, len(ids)) for x in row)
+                    for row in names]
+        keyed = [tuple(None if x < 0 else x for x in row) for row in numbered]
+        results[shape] = {
+            'quads': len(code),
+            'compile': sum(st.seconds for st in prof.stages),
+            'str_dict': _best(_positions_by_key, (names,), repeat),
+            'id_dict': _best(_positions_by_key, (keyed,), repeat),
+            'id_list': _best(_positions_by_index, (numbered, len(ids)), repeat),
+        }
+    return results
+
+
+def report_operand_keys(results):
+    lines = [f"{'shape':<10}{'quads':>7}{'compile ms':>12}{'str dict':>10}{'id dict':>9}"
+             f"{'id list':>9}{'saved/sweep':>13}"]
+    for shape, r in results.items():
+        saved = (r['str_dict'] - r['id_list']) / r['compile'] * 100
+        lines.append(f"{shape:<10}{r['quads']:>7}{r['compile'] * 1e3:>12.0f}"
+                     f"{r['str_dict'] * 1e3:>10.2f}{r['id_dict'] * 1e3:>9.2f}"
+                     f"{r['id_list'] * 1e3:>9.2f}{saved:>12.2f}%")
+    return lines
+
+
+# -- reporting --
+
+def report(data):
+    lines = [f"{'shape':<10}{'size':>7}{'tokens/s':>12}{'quads/s':>11}{'instr/s':>11}"
+             f"{'instrs':>9}{'spills':>8}{'peak KiB':>10}"]
+    for shape, r in data['results'].items():
+        peak = max(r['peak_kib'].values())
+        lines.append(f"{shape:<10}{r['size']:>7}{r['tokens_per_s']:>12,}{r['quads_per_s']:>11,}"
+                     f"{r['instructions_per_s']:>11,}{r['instructions']:>9}{r['spills']:>8}"
+                     f"{peak:>10}")
+    return lines
+
+
+# metrics where higher is better; the rest (sizes, memory) are better lower
+_HIGHER = ('tokens_per_s', 'quads_per_s', 'instructions_per_s')
+_COMPARED = _HIGHER + ('quads', 'instructions', 'spills')
+
+
+def compare(old, new):
+    """Lines comparing two saved runs, shape by shape."""
+    lines = [f"old {old['meta'].get('commit')}  new {new['meta'].get('commit')}"]
+    for key in ('opt_level', 'registers', 'allocator', 'scale', 'seed'):
+        if old['meta'].get(key) != new['meta'].get(key):
+            lines.append(f"warning: {key} differs ({old['meta'].get(key)} vs {new['meta'].get(key)})")
+    for shape, n in new['results'].items():
+        o = old['results'].get(shape)
+        if o is None:
+            lines.append(f"{shape}: new")
+            continue
+        metrics = [(m, o[m], n[m]) for m in _COMPARED]
+        metrics.append(('peak_kib', max(o['peak_kib'].values()), max(n['peak_kib'].values())))
+        for m, a, b in metrics:
+            change = (b - a) / a * 100 if a else 0.0
+            better = b > a if m in _HIGHER else b < a
+            mark = '' if a == b else ('  better' if better else '  worse')
+            lines.append(f"{shape:<10}{m:<20}{a:>12,}{b:>12,}{change:>+9.1f}%{mark}")
+    return lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-stage compiler benchmark on synthetic programs.")
+    ap.add_argument('--shapes', nargs='+', choices=tuple(SHAPES), default=list(SHAPES))
+    ap.add_argument('--scale', type=float, default=1.0, help="multiply every default size")
+    ap.add_argument('-O', dest='opt_level', type=int, choices=(0, 1, 2), default=0)
+    ap.add_argument('--registers', type=int, default=4)
+    ap.add_argument('--allocator', choices=('linear', 'coloring'), default='linear')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--save', metavar='FILE', help="write the results as JSON")
+    ap.add_argument('--compare', metavar='FILE', help="compare against results saved earlier")
+    ap.add_argument('--dump', metavar='SHAPE', choices=tuple(SHAPES),
+                    help="print the generated program for SHAPE and exit")
+    ap.add_argument('--operand-keys', action='store_true',
+                    help="time operand lookups by string vs by integer ID (ms per sweep)")
+    args = ap.parse_args()
+
+    if args.dump:
+        size = max(1, int(SHAPES[args.dump][1] * args.scale))
+        print(make_program(args.dump, size, args.seed), end='')
+        return
+    if args.operand_keys:
+        for line in report_operand_keys(operand_keys(args.shapes, args.scale, args.repeat,
+                                                     args.seed)):
+            print(line)
+        return
+    data = run(args.shapes, args.scale, args.opt_level, args.registers, args.allocator,
+               args.repeat, args.seed)
+    for line in report(data):
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print()
+        for line in compare(old, data):
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Benchmark: table-driven scanner vs the reference regex alternation.
+
+import argparse
+import random
+import time
+
+import lexer as lexmod
+from lexer import lexer
+
+def make_source(statements, seed=0):
+    """Synthetic program mixing declarations, expressions, ifs and loops."""
+    rnd = random.Random(seed)
+    names = [f"v{i}" for i in range(64)]
+    out = [f"int {', '.join(names)};"]
+    for _ in range(statements):
+        a, b, c = rnd.sample(names, 3)
+        kind = rnd.randrange(4)
+        if kind == 0:
+            out.append(f"{a} = ({b} * {rnd.randint(1, 999)}) + {c} / 3.25 - -{b};")
+        elif kind == 1:
+            out.append(f"if ({a} <= {b}) {{ {c} = {a} + 1; }} else print({c});")
+        elif kind == 2:
+            out.append(f"while ({a} != {b}) {{\n\t{a} = {a} - 1;\n}}")
+        else:
+            out.append(f"char ch{len(out)} = 'q'; print({a} == {b});")
+    return "\n".join(out) + "\n"
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    return result, best
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare lexer scanner engines.")
+    ap.add_argument('--statements', type=int, default=50000)
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    src = make_source(args.statements)
+    n = len(src)
+    def discard(typ, val, line, col):
+        pass
+    timings = {}
+    streams = {}
+    for engine, scan in lexmod._ENGINES.items():
+        _, scan_dt = _best(lambda: scan(src, 0, 1, 1, n, discard), args.repeat)
+        toks, lex_dt = _best(lambda: lexer(src, engine), args.repeat)
+        streams[engine] = [(t.type, t.value, t.line, t.col) for t in toks]
+        timings[engine] = (scan_dt, lex_dt)
+        print(f"{engine:6s} {len(toks):9d} tokens  scan {len(toks)/scan_dt:12,.0f} tokens/s"
+              f"  lexer() {len(toks)/lex_dt:12,.0f} tokens/s")
+    if streams['regex'] != streams['table']:
+        raise SystemExit("token streams differ")
+    (rs, rl), (ts, tl) = timings['regex'], timings['table']
+    print(f"speedup: scan {rs/ts:.2f}x, lexer() {rl/tl:.2f}x (identical token streams)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Content-addressed on-disk cache of compile results...
+#
+# An entry is keyed by the SHA-256 of the source text, the compile options
+# and a digest of the compiler's own modules, so editing the compiler
+# invalidates everything it produced. Entries are marshal'ed plain tuples
+# (tokens, symbol table, raw and final TAC, asm), zlib-compressed, written
+# to a temp file and renamed into place, so concurrent writers never expose
+# a partial entry. A hit refreshes the file's mtime; pruning deletes the
+# least recently used entries until the cache fits in max_bytes.
+
+import hashlib
+import marshal
+import os
+import tempfile
+import zlib
+
+from lexer import Token
+from tac_generator import Quad
+
+FORMAT = 1
+_COMPILER_MODULES = ('lexer.py', 'parser.py', 'tac_generator.py', 'optimizer.py', 'cfg.py',
+                     'loops.py', 'register_allocator.py', 'machine_generator.py', 'peephole.py',
+                     'scheduler.py', 'compiler.py', 'irformat.py', 'symbols.py',
+                     'parallel.py')
+_digest = None
+
+
+def compiler_digest():
+    """Hash of the compiler sources; part of every cache key."""
+    global _digest
+    if _digest is None:
+        h = hashlib.sha256(str(FORMAT).encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in _COMPILER_MODULES:
+            with open(os.path.join(here, name), 'rb') as f:
+                h.update(f.read())
+        _digest = h.hexdigest()
+    return _digest
+
+
+def cache_key(src, options):
+    h = hashlib.sha256(compiler_digest().encode())
+    h.update(repr(tuple(options)).encode())
+    h.update(b'\0')
+    h.update(src.encode())
+    return h.hexdigest()
+
+
+def _quads(code):
+    return [(q.op, q.dest, q.arg1, q.arg2, q.relop) for q in code]
+
+
+def pack(toks, symtab, tac, tac_code, asm):
+    data = ([(t.type, t.value, t.line, t.col) for t in toks], symtab,
+            _quads(tac), None if tac_code is tac else _quads(tac_code), asm)
+    return zlib.compress(marshal.dumps(data), 1)
+
+
+def unpack(blob):
+    """Inverse of pack: (toks, symtab, tac, tac_code, asm)."""
+    toks, symtab, tac, tac_code, asm = marshal.loads(zlib.decompress(blob))
+    tac = [Quad(*q) for q in tac]
+    tac_code = tac if tac_code is None else [Quad(*q) for q in tac_code]
+    return [Token(*t) for t in toks], symtab, tac, tac_code, asm
+
+
+class CompileCache:
+    def __init__(self, root, max_bytes=256 << 20, prune_every=64):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Unpacked entry for key, or None. Unreadable entries count as misses."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            entry = unpack(blob)
+            os.utime(path)
+        except (OSError, ValueError, EOFError, TypeError, zlib.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, blob):
+        path = self._path(key)
+        d = os.path.dirname(path)
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._puts += 1
+        if self._puts % self.prune_every == 0:
+            self.prune()
+
+    def entries(self):
+        """(mtime, size, path) of every entry."""
+        out = []
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                if e.name.startswith('.tmp-'):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue        # removed by another process
+                out.append((st.st_mtime, st.st_size, e.path))
+        return out
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self):
+        """Delete least recently used entries until the cache fits."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            removed += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
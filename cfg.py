@@ -0,0 +1,318 @@
+# Control-flow graph over TAC and a bitset dataflow framework...
+#
+# build_cfg() splits the quads into basic blocks (split_blocks) and links
+# them by their jumps. solve() is a worklist solver for gen/kill problems
+# where every set is a Python int used as a bitset over a Universe of
+# items (names, definition positions or expressions), so meet and transfer
+# are a few big-int operations per block whatever the set sizes. liveness,
+# reaching_definitions and available_expressions build the gen/kill sets
+# for the standard analyses.
+
+import heapq
+
+from tac_generator import (LABEL, GOTO, IFFALSE, IFZ, UMINUS, BINARY_OPS, COMMUTATIVE_OPS,
+                           DEF_OPS, is_literal, split_blocks)
+
+
+class Block:
+    __slots__ = ('index', 'start', 'end', 'label', 'succs', 'preds')
+
+    def __init__(self, index, start, end, label):
+        self.index = index
+        self.start = start        # code[start:end]
+        self.end = end
+        self.label = label        # label opening the block, if any
+        self.succs = []
+        self.preds = []
+
+    def __repr__(self):
+        return f"Block({self.index}, {self.start}, {self.end}, succs={self.succs})"
+
+
+class CFG:
+    def __init__(self, code, blocks, label_block):
+        self.code = code
+        self.blocks = blocks
+        self.label_block = label_block    # label -> block index
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def quads(self, b):
+        blk = self.blocks[b]
+        return self.code[blk.start:blk.end]
+
+    def postorder(self):
+        """Block indexes reachable from the entry, in DFS postorder."""
+        if not self.blocks:
+            return []
+        blocks = self.blocks
+        seen = bytearray(len(blocks))
+        order = []
+        seen[0] = 1
+        stack = [(0, iter(blocks[0].succs))]
+        while stack:
+            b, it = stack[-1]
+            for s in it:
+                if not seen[s]:
+                    seen[s] = 1
+                    stack.append((s, iter(blocks[s].succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(b)
+        return order
+
+    def reverse_postorder(self):
+        return self.postorder()[::-1]
+
+
+def build_cfg(code):
+    blocks = []
+    label_block = {}
+    for start, end in split_blocks(code):
+        first = code[start]
+        label = first.dest if first.op == LABEL else None
+        if label is not None:
+            label_block[label] = len(blocks)
+        blocks.append(Block(len(blocks), start, end, label))
+    n = len(blocks)
+    for b, blk in enumerate(blocks):
+        last = code[blk.end - 1]
+        if last.op == GOTO:
+            succs = [label_block[last.dest]]
+        elif last.op in (IFFALSE, IFZ):
+            succs = [label_block[last.dest]]
+            if b + 1 < n and b + 1 != succs[0]:
+                succs.append(b + 1)
+        else:
+            succs = [b + 1] if b + 1 < n else []
+        blk.succs = succs
+        for s in succs:
+            blocks[s].preds.append(b)
+    return CFG(code, blocks, label_block)
+
+
+class Universe:
+    """Bijection between items and bit positions."""
+
+    def __init__(self, items=()):
+        self.items = []
+        self.index = {}
+        for x in items:
+            self.add(x)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, x):
+        i = self.index.get(x)
+        if i is None:
+            i = self.index[x] = len(self.items)
+            self.items.append(x)
+        return i
+
+    def bit(self, x):
+        return 1 << self.index[x]
+
+    def mask(self, xs):
+        m = 0
+        for x in xs:
+            m |= 1 << self.index[x]
+        return m
+
+    def full(self):
+        return (1 << len(self.items)) - 1
+
+    def members(self, bits):
+        items = self.items
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(items[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+
+class DataflowResult:
+    """Per-block IN and OUT bitsets over universe (IN is at block entry in
+    both directions)."""
+
+    def __init__(self, cfg, universe, ins, outs):
+        self.cfg = cfg
+        self.universe = universe
+        self.ins = ins
+        self.outs = outs
+
+    def in_set(self, b):
+        return set(self.universe.members(self.ins[b]))
+
+    def out_set(self, b):
+        return set(self.universe.members(self.outs[b]))
+
+
+def solve(cfg, gen, kill, forward=True, union=True, boundary=0, init=0):
+    """Worklist solution of out = gen | (in & ~kill) (forward) or
+    in = gen | (out & ~kill) (backward). union selects the meet; boundary is
+    the value entering the entry (forward) or leaving exit blocks
+    (backward); init is the starting value of every other block.
+    Returns (ins, outs)."""
+    blocks = cfg.blocks
+    n = len(blocks)
+    ins = [init] * n
+    outs = [init] * n
+    order = cfg.reverse_postorder() if forward else cfg.postorder()
+    # unreachable blocks still get a solution
+    reached = set(order)
+    order += [b for b in range(n) if b not in reached]
+    # the worklist is a heap on position in `order`, so a change is always
+    # propagated along the whole graph before blocks are revisited
+    keep = [~k for k in kill]
+    rank = [0] * n
+    for r, b in enumerate(order):
+        rank[b] = r
+    work = list(range(n))
+    queued = bytearray(b'\1' * n)
+    while work:
+        b = order[heapq.heappop(work)]
+        queued[b] = 0
+        blk = blocks[b]
+        edges = blk.preds if forward else blk.succs
+        if forward and b == 0 or not forward and not edges:
+            x = boundary
+        elif not edges:
+            x = init
+        elif union:
+            x = 0
+        else:
+            x = -1
+        for e in edges:
+            if union:
+                x |= outs[e] if forward else ins[e]
+            else:
+                x &= outs[e] if forward else ins[e]
+        y = gen[b] | (x & keep[b])
+        if forward:
+            ins[b] = x
+            if y == outs[b]:
+                continue
+            outs[b] = y
+            nxt = blk.succs
+        else:
+            outs[b] = x
+            if y == ins[b]:
+                continue
+            ins[b] = y
+            nxt = blk.preds
+        for s in nxt:
+            if not queued[s]:
+                queued[s] = 1
+                heapq.heappush(work, rank[s])
+    return ins, outs
+
+
+# -- standard analyses --
+
+def liveness(cfg, track=None):
+    """Names live into/out of each block. track(name) limits the universe,
+    e.g. to temps; literals are never tracked."""
+    code = cfg.code
+    u = Universe()
+    gen, kill = [], []
+    for blk in cfg.blocks:
+        use = defs = 0
+        for i in range(blk.start, blk.end):
+            q = code[i]
+            for arg in (q.arg1, q.arg2):
+                if arg is not None and not is_literal(arg) and (track is None or track(arg)):
+                    m = 1 << u.add(arg)
+                    if not defs & m:
+                        use |= m
+            if q.op in DEF_OPS and (track is None or track(q.dest)):
+                defs |= 1 << u.add(q.dest)
+        gen.append(use)
+        kill.append(defs)
+    ins, outs = solve(cfg, gen, kill, forward=False)
+    return DataflowResult(cfg, u, ins, outs)
+
+
+def reaching_definitions(cfg, track=None):
+    """Definition positions (indexes into cfg.code) reaching each block.
+    track(name) limits which names' definitions are followed."""
+    code = cfg.code
+    u = Universe(i for i, q in enumerate(code)
+                 if q.op in DEF_OPS and (track is None or track(q.dest)))
+    defs_of = {}
+    for i in u.items:
+        d = code[i].dest
+        defs_of[d] = defs_of.get(d, 0) | (1 << u.index[i])
+    gen, kill = [], []
+    for blk in cfg.blocks:
+        last = {}
+        for i in range(blk.start, blk.end):
+            if i in u.index:
+                last[code[i].dest] = i
+        g = k = 0
+        for d, i in last.items():
+            g |= 1 << u.index[i]
+            k |= defs_of[d]
+        gen.append(g)
+        kill.append(k)
+    ins, outs = solve(cfg, gen, kill)
+    return DataflowResult(cfg, u, ins, outs)
+
+
+def expression_key(q):
+    """(op, a, b) computed by q, commutative operands ordered; None if q
+    computes nothing."""
+    op = q.op
+    if op in BINARY_OPS:
+        a, b = q.arg1, q.arg2
+        if op in COMMUTATIVE_OPS and b < a:
+            a, b = b, a
+        return (op, a, b)
+    if op == UMINUS:
+        return (op, q.arg1, None)
+    return None
+
+
+def available_expressions(cfg):
+    """Expressions computed on every path to each block and not invalidated
+    by a redefinition of one of their operands since."""
+    code = cfg.code
+    u = Universe()
+    for q in code:
+        key = expression_key(q)
+        if key is not None:
+            u.add(key)
+    uses_of = {}
+    for key in u.items:
+        m = 1 << u.index[key]
+        for x in key[1:]:
+            if x is not None:
+                uses_of[x] = uses_of.get(x, 0) | m
+    gen, kill = [], []
+    for blk in cfg.blocks:
+        g = k = 0
+        for i in range(blk.start, blk.end):
+            q = code[i]
+            key = expression_key(q)
+            if key is not None:
+                g |= 1 << u.index[key]
+            if q.op in DEF_OPS:
+                killed = uses_of.get(q.dest, 0)
+                g &= ~killed
+                k |= killed
+        gen.append(g)
+        kill.append(k & ~g)
+    ins, outs = solve(cfg, gen, kill, union=False, boundary=0, init=u.full())
+    return DataflowResult(cfg, u, ins, outs)
+
+
+def dominators(cfg):
+    """Per block, a bitset of the blocks that dominate it (bit i = block i).
+    Unreachable blocks come out dominated by every block."""
+    n = len(cfg.blocks)
+    gen = [1 << b for b in range(n)]
+    ins, outs = solve(cfg, gen, [0] * n, union=False, boundary=0, init=(1 << n) - 1)
+    return outs
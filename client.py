@@ -0,0 +1,167 @@
+# Thin client for server.py...
+#
+# Sends each file to a running compile server and writes the artifacts it
+# returns into --out-dir (one subdirectory per file when there are several),
+# the same files main.py would write. It imports nothing from the compiler,
+# so a compile costs interpreter startup plus one round trip.
+#
+# The files go down one connection with up to WINDOW requests outstanding;
+# the server answers each as its compile finishes, matched by "id". The
+# window matters: the server stops reading while its answers go unread.
+
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"mini-compiler-{os.getuid()}.sock")
+WINDOW = 16
+
+
+def connect(path=DEFAULT_SOCKET, port=None, timeout=None):
+    """Socket to a server on the Unix socket path, or on localhost:port."""
+    if port is not None:
+        return socket.create_connection(("127.0.0.1", port), timeout=timeout)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    s.connect(path)
+    return s
+
+
+class Client:
+    """One connection to a compile server; requests are JSON lines."""
+
+    def __init__(self, path=DEFAULT_SOCKET, port=None, timeout=None):
+        self.sock = connect(path, port, timeout)
+        self._file = self.sock.makefile("rb")
+        self._next_id = 0
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def send(self, request):
+        """Send one request, numbering it; returns its id."""
+        self._next_id += 1
+        request = dict(request, id=self._next_id)
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        return self._next_id
+
+    def receive(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def compile(self, source, opt_level=0, num_registers=4, allocator="linear", emit=None):
+        """Response to one compile request (see server.py)."""
+        self.send(compile_request(source, opt_level, num_registers, allocator, emit))
+        return self.receive()
+
+    def metrics(self):
+        self.send({"op": "metrics"})
+        return self.receive()
+
+
+def compile_request(source, opt_level=0, num_registers=4, allocator="linear", emit=None):
+    request = {"source": source, "options": {"opt_level": opt_level, "registers": num_registers,
+                                             "allocator": allocator}}
+    if emit is not None:
+        request["emit"] = list(emit)
+    return request
+
+
+def write_response(outdir, response):
+    """Write the artifacts of a successful compile response; returns their paths."""
+    os.makedirs(outdir, exist_ok=True)
+    paths = []
+    for art in response["artifacts"].values():
+        path = os.path.join(outdir, art["file"])
+        if "base64" in art:
+            with open(path, "wb") as f:
+                f.write(base64.b64decode(art["base64"]))
+        else:
+            with open(path, "w") as f:
+                f.write(art["text"])
+        paths.append(path)
+    return paths
+
+
+def _output_dirs(files, outroot):
+    # outroot for one file; else one directory per file, as main.output_dirs
+    if len(files) == 1:
+        return [outroot]
+    dirs = []
+    used = set()
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 1
+        while name in used:
+            name = f"{stem}_{n}"
+            n += 1
+        used.add(name)
+        dirs.append(os.path.join(outroot, name))
+    return dirs
+
+
+def _collect(client, pending, files, dirs):
+    # take one answer; 1 if its compile failed
+    r = client.receive()
+    i = pending.pop(r["id"])
+    if not r["ok"]:
+        print(f"FAILED {files[i]}: {r['error']}", file=sys.stderr)
+        return 1
+    write_response(dirs[i], r)
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compile files on a running compile server.")
+    ap.add_argument("files", nargs="*", help="source files")
+    ap.add_argument("-O", dest="opt_level", type=int, choices=(0, 1, 2), default=0)
+    ap.add_argument("--registers", type=int, default=4)
+    ap.add_argument("--allocator", choices=("linear", "coloring"), default="linear")
+    ap.add_argument("--emit", default=None, metavar="LIST",
+                    help="comma-separated artifacts to write (default: the server's)")
+    ap.add_argument("--out-dir", default="output")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET, help="server's Unix socket")
+    ap.add_argument("--port", type=int, default=None, help="use the server on localhost:PORT")
+    ap.add_argument("--metrics", action="store_true", help="print the server's metrics")
+    args = ap.parse_args()
+    emit = None if args.emit is None else [n for n in args.emit.split(",") if n]
+
+    failed = 0
+    dirs = _output_dirs(args.files, args.out_dir)
+    try:
+        client = Client(args.socket, args.port)
+    except OSError as e:
+        where = f"127.0.0.1:{args.port}" if args.port is not None else args.socket
+        raise SystemExit(f"no compile server at {where}: {e}")
+    with client:
+        pending = {}    # request id -> index into args.files
+        for i, path in enumerate(args.files):
+            if len(pending) == WINDOW:
+                failed += _collect(client, pending, args.files, dirs)
+            with open(path, "r") as f:
+                src = f.read()
+            pending[client.send(compile_request(src, args.opt_level, args.registers,
+                                                args.allocator, emit))] = i
+        while pending:
+            failed += _collect(client, pending, args.files, dirs)
+        if args.metrics:
+            print(json.dumps(client.metrics()["metrics"], indent=2))
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Quiet compiler API: source text in, artifacts out, nothing printed...
+#
+# compile(source, options) runs every stage in memory and returns a
+# Compilation. Each artifact (tokens, symbols, raw and final TAC, asm) has a
+# renderer producing its lines, or bytes for the binary TAC and asm modules
+# of irformat.py; write_artifacts() writes the chosen ones, each file in a
+# single write, and main.py prints its console sections from the same
+# renderers.
+
+import os
+
+from lexer import lexer, lex_compact, lex_file, TokenBuffer
+from parser import Parser
+from machine_generator import MachineGenerator
+from register_allocator import ALLOCATORS
+from optimizer import optimize, LEVELS
+from peephole import peephole
+from scheduler import schedule
+from cache import cache_key, pack
+from profiling import NO_PROFILE, PARSER_METHODS
+from irformat import encode_tac, encode_asm
+from parallel import parse_parallel, MIN_BYTES
+
+
+class CompileOptions:
+    __slots__ = ('opt_level', 'num_registers', 'allocator')
+
+    def __init__(self, opt_level=0, num_registers=4, allocator="linear"):
+        if opt_level not in LEVELS:
+            raise ValueError(f"unknown optimization level {opt_level!r}")
+        if num_registers < 2:
+            raise ValueError("need at least 2 registers")
+        if allocator not in ALLOCATORS:
+            raise ValueError(f"unknown allocator {allocator!r}")
+        self.opt_level = opt_level
+        self.num_registers = num_registers
+        self.allocator = allocator
+
+    def key(self):
+        """(opt_level, num_registers, allocator), the positional form the
+        compile functions and cache keys take."""
+        return (self.opt_level, self.num_registers, self.allocator)
+
+    def __repr__(self):
+        return (f"CompileOptions(opt_level={self.opt_level}, num_registers={self.num_registers}, "
+                f"allocator={self.allocator!r})")
+
+
+class Compilation:
+    """Artifacts of one compile: tokens, symbol table (storage name ->
+    type), TAC as generated, TAC after optimization (the same list at -O0)
+    and asm."""
+    def __init__(self, toks, symtab, tac, tac_code, asm):
+        self.toks = toks
+        self.symtab = symtab
+        self.tac = tac
+        self.tac_code = tac_code
+        self.asm = asm
+
+
+def compile(source, options=None, cache=None, profiler=None, jobs=1, compact_tokens=False):
+    """Compile source text with CompileOptions (defaults when None). Raises
+    RuntimeError from the lexer and ParserError from the parser."""
+    if options is None:
+        options = CompileOptions()
+    return compile_source(source, *options.key(), cache=cache, profiler=profiler, jobs=jobs,
+                          compact_tokens=compact_tokens)
+
+
+def compile_source(src, opt_level=0, num_registers=4, allocator="linear", cache=None,
+                   profiler=None, jobs=1, compact_tokens=False):
+    """Run every stage without printing. Raises RuntimeError from the lexer
+    and ParserError from the parser. With a CompileCache, unchanged sources
+    compiled with the same options are loaded instead. A profiling.Profiler
+    collects per-stage statistics. jobs > 1 lexes and parses a large source
+    in that many processes (parallel.py); the result is the same.
+    compact_tokens keeps the tokens of a serial parse in a lexer.TokenBuffer,
+    about a sixth of the memory of Token objects for a slower parse."""
+    prof = profiler or NO_PROFILE
+    if cache is not None:
+        with prof.stage("cache") as st:
+            key = cache_key(src, (opt_level, num_registers, allocator))
+            entry = cache.get(key)
+            st.count(hit=int(entry is not None))
+        if entry is not None:
+            return Compilation(*entry)
+    if jobs > 1 and len(src) >= MIN_BYTES:
+        with prof.stage("frontend") as st:
+            fe = parse_parallel(src, jobs)
+            toks, symtab, tac = fe.toks, fe.symtab, fe.tac
+            st.count(bytes=len(src), tokens=len(toks), quads=len(tac), temps=fe.temp_count,
+                     labels=fe.label_count, symbols=len(symtab), chunks=fe.chunks)
+    else:
+        with prof.stage("lex") as st:
+            toks = lex_compact(src) if compact_tokens else lexer(src)
+            st.count(bytes=len(src), tokens=len(toks))
+        with prof.stage("parse") as st:
+            p = Parser(toks)
+            prof.instrument(st, p, PARSER_METHODS)
+            p.parse()
+            tac = p.tac.get_code()
+            symtab = p.symtab
+            st.count(quads=len(tac), temps=p.tac.temp_count, labels=p.tac.label_count,
+                     symbols=len(symtab))
+    tac_code, asm = compile_tac(tac, opt_level, num_registers, allocator, prof)
+    symtab = symtab.as_dict()
+    if cache is not None:
+        cache.put(key, pack(toks, symtab, tac, tac_code, asm))
+    return Compilation(toks, symtab, tac, tac_code, asm)
+
+
+def _collect(tokens, buf):
+    # pass tokens through, keeping a compact copy in buf
+    push = buf.push
+    for t in tokens:
+        push(t.type, t.value, t.line, t.col)
+        yield t
+
+
+def compile_file(path, opt_level=0, num_registers=4, allocator="linear", profiler=None,
+                 keep_tokens=True):
+    """Compile the source file at path without reading it whole: the lexer
+    streams it through an mmap (lexer.lex_file) and the parser reads the
+    tokens through a bounded window, so lexing and parsing are one stage.
+    keep_tokens collects the tokens in a lexer.TokenBuffer for the tokens
+    artifact; otherwise Compilation.toks is None."""
+    prof = profiler or NO_PROFILE
+    with prof.stage("parse") as st:
+        tokens = lex_file(path)
+        toks = None
+        if keep_tokens:
+            toks = TokenBuffer()
+            tokens = _collect(tokens, toks)
+        p = Parser(tokens)
+        prof.instrument(st, p, PARSER_METHODS)
+        p.parse()
+        tac = p.tac.get_code()
+        st.count(tokens=p.pos + 1, quads=len(tac), temps=p.tac.temp_count,
+                 labels=p.tac.label_count, symbols=len(p.symtab))
+    tac_code, asm = compile_tac(tac, opt_level, num_registers, allocator, prof)
+    return Compilation(toks, p.symtab.as_dict(), tac, tac_code, asm)
+
+
+def compile_tac(tac, opt_level=0, num_registers=4, allocator="linear", profiler=None):
+    """Back end: optimized TAC (tac itself at -O0) and asm. -O2 also
+    schedules the asm for a pipelined core (scheduler.py)."""
+    prof = profiler or NO_PROFILE
+    tac_code = tac
+    if opt_level:
+        with prof.stage("optimize") as st:
+            tac_code = optimize(tac, opt_level)
+            st.count(quads_in=len(tac), quads_out=len(tac_code))
+    with prof.stage("codegen") as st:
+        mg = MachineGenerator(num_registers=num_registers, allocator=allocator)
+        asm = mg.generate(tac_code)
+        st.count(instructions=len(asm), spills=mg.spills)
+    if opt_level:
+        with prof.stage("peephole") as st:
+            n = len(asm)
+            asm = peephole(asm)
+            st.count(instructions_in=n, instructions_out=len(asm))
+    if opt_level >= 2:
+        with prof.stage("schedule") as st:
+            asm = schedule(asm)
+            st.count(instructions=len(asm))
+    return tac_code, asm
+
+
+# -- artifacts --
+
+def token_lines(toks):
+    return [repr(t) for t in toks]
+
+
+def symbol_lines(symtab):
+    return [f"{k} : {v}" for k, v in symtab.items()]
+
+
+def tac_lines(code):
+    return [f"({i}) {q}" for i, q in enumerate(code, 1)]
+
+
+# name -> (file name, lines or bytes of a Compilation)
+ARTIFACTS = {
+    'tokens': ('tokens.txt', lambda r: token_lines(r.toks)),
+    'symbols': ('symbols.txt', lambda r: symbol_lines(r.symtab)),
+    'raw_tac': ('raw_tac.txt', lambda r: tac_lines(r.tac)),
+    'tac': ('tac.txt', lambda r: tac_lines(r.tac_code)),
+    'asm': ('asm.txt', lambda r: r.asm),
+    'tac_ir': ('tac.ir', lambda r: encode_tac(r.tac_code)),
+    'asm_ir': ('asm.ir', lambda r: encode_asm(r.asm)),
+}
+DEFAULT_ARTIFACTS = ('tokens', 'tac', 'asm')
+
+
+def render(result, name):
+    """Text (bytes for binary ones) of one artifact, as write_artifacts()
+    writes it."""
+    lines = ARTIFACTS[name][1](result)
+    if isinstance(lines, bytes):
+        return lines
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def write_artifacts(outdir, result, artifacts=DEFAULT_ARTIFACTS):
+    """Write the named artifacts of result into outdir; returns their paths."""
+    os.makedirs(outdir, exist_ok=True)
+    paths = []
+    for name in artifacts:
+        path = os.path.join(outdir, ARTIFACTS[name][0])
+        data = render(result, name)
+        with open(path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
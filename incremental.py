@@ -0,0 +1,351 @@
+# Incremental recompilation at top-level statement granularity...
+#
+# The program is kept as a list of top-level statements. Each one remembers
+# its source span, its tokens, the TAC it produced and the symbol-table
+# operations it performed (declarations, declared-before-use checks and
+# block scopes).
+# The spans tile the source: a statement runs from its first token to the
+# first token of the next one.
+#
+# After an edit, only the statements overlapping the changed text are
+# re-lexed and re-parsed. The region grows while a token would straddle its
+# end or the parse runs off the end of it, and it also takes in a preceding
+# `if` that could gain an `else`. Statements after the region keep their
+# tokens, with positions shifted, and their TAC. Their symbol-table
+# operations are replayed so redeclaration and use-before-declaration
+# errors come out as a full parse would report them. A statement whose
+# declarations, or the variables it reads and assigns, would now get other
+# storage (an edit added or removed an earlier declaration of the same
+# name) joins the region instead.
+#
+# Temps are numbered afresh in every statement (TACGenerator recycles them),
+# so a re-parsed statement gets the same temps a full parse would give it.
+# Re-parsed statements reuse the label numbers their predecessors owned
+# before new ones are drawn, so unchanged code keeps its labels and TAC
+# diffs stay small. Label numbering can therefore differ from a fresh
+# compile, but it stays unique.
+
+import bisect
+
+from lexer import Token, lexer, lex_span
+from parser import Parser, ParserError, deep_recursion
+from tac_generator import TACGenerator, LABEL
+from compiler import Compilation, compile_tac
+from symbols import SymbolTable
+
+
+class _LazyCompilation(Compilation):
+    """Runs the back end the first time tac_code or asm is read, so callers
+    that only need tokens, symbols and errors never pay for it."""
+
+    def __init__(self, toks, symtab, tac, options):
+        self.toks = toks
+        self.symtab = symtab
+        self.tac = tac
+        self._options = options
+        self._backend = None
+
+    def _run_backend(self):
+        if self._backend is None:
+            self._backend = compile_tac(self.tac, *self._options)
+        return self._backend
+
+    @property
+    def tac_code(self):
+        return self._run_backend()[0]
+
+    @property
+    def asm(self):
+        return self._run_backend()[1]
+
+
+class Statement:
+    __slots__ = ('start', 'line', 'col', 'tokens', 'code', 'log')
+
+    def __init__(self, start, line, col, tokens, code, log):
+        self.start = start        # offset, line and col where its span begins
+        self.line = line
+        self.col = col
+        self.tokens = tokens
+        self.code = code          # Quads
+        self.log = log            # ('decl', name, type) / ('use', name)
+
+    def label_numbers(self):
+        return [int(q.dest[1:]) for q in self.code if q.op == LABEL]
+
+
+class _PooledTAC(TACGenerator):
+    """Hands out previously owned label numbers first, then fresh ones above
+    the high-water mark."""
+
+    def __init__(self, labels, next_label):
+        super().__init__()
+        self._labels = labels[::-1]
+        self._label = next_label
+
+    def new_label(self):
+        if self._labels:
+            return f"L{self._labels.pop()}"
+        return super().new_label()
+
+
+class _RecordingParser(Parser):
+    """Parses top-level statements one at a time, logging symbol-table use."""
+
+    def __init__(self, tokens, symtab, tac):
+        super().__init__(tokens)
+        self.symtab = symtab
+        self.tac = tac
+        self.log = []
+
+    def declare(self, name, typ):
+        var = super().declare(name, typ)
+        self.log.append(('decl', name, typ, var))
+        return var
+
+    def require_declared(self, name):
+        var = super().require_declared(name)
+        self.log.append(('use', name, var))
+        return var
+
+    def read(self, name):
+        var = super().read(name)
+        self.log.append(('read', name, var))
+        return var
+
+    def enter_scope(self):
+        super().enter_scope()
+        self.log.append(('push',))
+
+    def exit_scope(self):
+        super().exit_scope()
+        self.log.append(('pop',))
+
+    def statements(self, start, line, col, offset_of):
+        """Parse to EOF and return Statements. The first span begins at
+        (start, line, col); later ones at their first token, whose offset
+        offset_of(line, col) gives."""
+        out = []
+        toks = self.tokens
+        with deep_recursion():
+            while self.cur().type != 'EOF':
+                first = self.pos
+                code_start = len(self.tac.code)
+                self.log = []
+                self.parse_statement()
+                if out:
+                    t = toks[first]
+                    start, line, col = offset_of(t.line, t.col), t.line, t.col
+                out.append(Statement(start, line, col, toks[first:self.pos],
+                                     self.tac.code[code_start:], self.log))
+        return out
+
+
+def _offsets(src, start, end, line, col):
+    # offset of a (line, col) position in src[start:end], which begins at (line, col)
+    starts = [start - (col - 1)]
+    i = src.find('\n', start, end)
+    while i >= 0:
+        starts.append(i + 1)
+        i = src.find('\n', i + 1, end)
+    return lambda l, c: starts[l - line] + c - 1
+
+
+def _common_prefix(a, b, limit, step=4096):
+    i = 0
+    while i < limit:
+        j = min(i + step, limit)
+        if a[i:j] != b[i:j]:
+            while a[i] == b[i]:
+                i += 1
+            return i
+        i = j
+    return limit
+
+
+def _common_suffix(a, b, limit, step=4096):
+    na, nb = len(a), len(b)
+    i = 0
+    while i < limit:
+        j = min(i + step, limit)
+        if a[na-j:na-i] != b[nb-j:nb-i]:
+            while a[na-i-1] == b[nb-i-1]:
+                i += 1
+            return i
+        i = j
+    return limit
+
+
+def _safe_boundary(src, k):
+    # can lexing stop at k without changing the tokens around it?
+    c = src[k-1]
+    return c in ' \t\n' or (c in ';}' and (k < 2 or src[k-2] != "'"))
+
+
+def _replay(log, symtab):
+    """Redo a statement's symbol-table operations on symtab. False if one of
+    its declarations or the names it uses now get other storage, making its
+    TAC stale."""
+    for entry in log:
+        kind = entry[0]
+        if kind == 'decl':
+            _, name, typ, storage = entry
+            if symtab.declared_here(name):
+                raise ParserError(f"Redeclaration of {name}")
+            if symtab.storage[symtab.declare(name, typ)] != storage:
+                return False
+        elif kind == 'use':
+            sid = symtab.lookup(entry[1])
+            if sid is None:
+                raise ParserError(f"Variable {entry[1]} used before declaration")
+            if symtab.storage[sid] != entry[2]:
+                return False
+        elif kind == 'read':
+            if symtab.operand(entry[1]) != entry[2]:
+                return False
+        elif kind == 'push':
+            symtab.push()
+        else:
+            symtab.pop()
+    return True
+
+
+class IncrementalCompiler:
+    """Keeps the last successfully compiled program and recompiles edits to it.
+
+    update(src) diffs src against the previous source; edit(start, end, text)
+    applies a known replacement. Both return a compiler.Compilation and raise
+    the usual RuntimeError / ParserError, leaving the previous state intact.
+    """
+
+    def __init__(self, opt_level=0, num_registers=4, allocator="linear"):
+        self.options = (opt_level, num_registers, allocator)
+        self.src = None
+        self.stmts = []
+        self.eof = None
+        self.next_label = 0
+        self.symtab = SymbolTable()
+        self.reparsed = 0         # statements parsed by the last update
+
+    # -- entry points --
+
+    def update(self, src):
+        if self.src is None:
+            return self.full(src)
+        old = self.src
+        limit = min(len(old), len(src))
+        p = _common_prefix(old, src, limit)
+        s = _common_suffix(old, src, limit - p)
+        return self._apply(src, p, len(old) - s, len(src) - s)
+
+    def edit(self, start, end, text):
+        """Replace self.src[start:end] by text and recompile."""
+        if self.src is None:
+            raise ValueError("nothing compiled yet")
+        src = self.src[:start] + text + self.src[end:]
+        return self._apply(src, start, end, start + len(text))
+
+    def full(self, src):
+        toks = lexer(src)
+        tac = TACGenerator()
+        parser = _RecordingParser(toks, SymbolTable(), tac)
+        stmts = parser.statements(0, 1, 1, _offsets(src, 0, len(src), 1, 1))
+        self._commit(src, stmts, toks[-1], parser.symtab, tac._label)
+        self.reparsed = len(stmts)
+        return self.result()
+
+    def result(self):
+        toks = [t for st in self.stmts for t in st.tokens]
+        toks.append(self.eof)
+        tac = [q for st in self.stmts for q in st.code]
+        return _LazyCompilation(toks, self.symtab.as_dict(), tac, self.options)
+
+    # -- internals --
+
+    def _commit(self, src, stmts, eof, symtab, next_label):
+        self.src = src
+        self.stmts = stmts
+        self.eof = eof
+        self.symtab = symtab
+        self.next_label = next_label
+
+    def _apply(self, src, p, old_end, new_end):
+        """Recompile after old[p:old_end] became src[p:new_end]."""
+        old, stmts = self.src, self.stmts
+        if not stmts:
+            return self.full(src)
+        delta = new_end - old_end
+        starts = [st.start for st in stmts]
+        i = max(bisect.bisect_right(starts, p) - 1, 0)
+        j = bisect.bisect_right(starts, max(old_end - 1, p))
+        if i > 0 and stmts[i-1].tokens[0].value == 'if':
+            i -= 1                  # an edit may give it an `else`
+
+        symtab = SymbolTable()
+        for st in stmts[:i]:
+            _replay(st.log, symtab)
+        first = stmts[i]
+        line, col = first.line, first.col
+        while True:
+            end = stmts[j].start + delta if j < len(stmts) else len(src)
+            if end < len(src) and not _safe_boundary(src, end):
+                j += 1
+                continue
+            toks, pos, eline, ecol = lex_span(src, first.start, end, line, col)
+            if pos < end:
+                j += 1
+                continue
+            labels = []
+            for st in stmts[i:j]:
+                labels += st.label_numbers()
+            tac = _PooledTAC(sorted(labels), self.next_label)
+            region_symtab = symtab.copy()
+            toks.append(Token('EOF', '', eline, ecol))
+            parser = _RecordingParser(toks, region_symtab, tac)
+            try:
+                new = parser.statements(first.start, line, col,
+                                        _offsets(src, first.start, end, line, col))
+            except ParserError:
+                if parser.pos >= len(toks) - 1 and j < len(stmts):
+                    j += 1          # ran into the end of the region
+                    continue
+                raise
+            # later statements keep their TAC unless a declaration or use
+            # in them now resolves to other storage
+            k = j
+            while k < len(stmts) and _replay(stmts[k].log, region_symtab):
+                k += 1
+            if k == len(stmts):
+                break
+            j = k + 1
+
+        # shift what follows the region
+        tail = stmts[j:]
+        if tail:
+            dline = src.count('\n', p, new_end) - old.count('\n', p, old_end)
+            end_line = old.count('\n', 0, old_end) + 1
+            dcol = (new_end - src.rfind('\n', 0, new_end)) - (old_end - old.rfind('\n', 0, old_end))
+            tail = [_shift(st, delta, end_line, dline, dcol) for st in tail]
+            eof = _shift_token(self.eof, end_line, dline, dcol)
+        else:
+            eof = toks[-1]
+        self._commit(src, stmts[:i] + new + tail, eof, region_symtab, tac._label)
+        self.reparsed = len(new)
+        return self.result()
+
+
+def _shift_token(t, end_line, dline, dcol):
+    if t.line == end_line:
+        return Token(t.type, t.value, t.line + dline, t.col + dcol)
+    return Token(t.type, t.value, t.line + dline, t.col)
+
+
+def _shift(st, delta, end_line, dline, dcol):
+    if st.line > end_line:
+        # below the edit: only the offset and line numbers move
+        toks = st.tokens if not dline else [Token(t.type, t.value, t.line + dline, t.col)
+                                            for t in st.tokens]
+        return Statement(st.start + delta, st.line + dline, st.col, toks, st.code, st.log)
+    col = st.col + dcol if st.line == end_line else st.col
+    toks = [_shift_token(t, end_line, dline, dcol) for t in st.tokens]
+    return Statement(st.start + delta, st.line + dline, col, toks, st.code, st.log)
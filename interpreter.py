@@ -0,0 +1,210 @@
+# Run TAC directly, without going through MachineGenerator...
+#
+# Two engines share one result type. interpret() walks the quads with
+# labels resolved up front and literals pre-seeded into the environment, so
+# every operand read is one dict lookup. compile_tac() turns the program
+# into a single generated Python function: each basic block becomes
+# straight-line code over local variables and blocks are selected through a
+# binary tree of `if` tests on the block number. PRINT output is buffered
+# in a list in both engines.
+
+import operator
+
+from tac_generator import (LABEL, GOTO, IFFALSE, IFZ, PRINT, COPY, UMINUS, BINARY_OPS,
+                           REL_OPS, DEF_OPS, is_literal, literal_value, apply_op, split_blocks)
+
+
+class ExecutionError(Exception):
+    pass
+
+
+class ExecResult:
+    def __init__(self, output, variables, steps):
+        self.output = output          # PRINTed values, in order
+        self.variables = variables    # name -> final value (temps included)
+        self.steps = steps            # TAC instructions executed
+
+    def write(self, stream):
+        stream.write(''.join(f"{v}\n" for v in self.output))
+
+
+def _value(literal):
+    v = literal_value(literal)
+    return ord(literal[1]) if v is None else v
+
+
+def _div(a, b):
+    try:
+        return apply_op('/', a, b)
+    except ZeroDivisionError:
+        raise ExecutionError("division by zero") from None
+
+
+def _operands(code):
+    # every name and literal the program mentions
+    names = set()
+    for q in code:
+        for x in (q.arg1, q.arg2):
+            if x is not None:
+                names.add(x)
+        if q.op in DEF_OPS:
+            names.add(q.dest)
+    return names
+
+
+def _labels(code):
+    return {q.dest: i for i, q in enumerate(code) if q.op == LABEL}
+
+
+# -- interpreter --
+
+_FUNCS = {
+    '+': operator.add, '-': operator.sub, '*': operator.mul, '/': _div,
+    '==': lambda a, b: int(a == b), '!=': lambda a, b: int(a != b),
+    '<': lambda a, b: int(a < b), '>': lambda a, b: int(a > b),
+    '<=': lambda a, b: int(a <= b), '>=': lambda a, b: int(a >= b),
+}
+
+def interpret(code, max_steps=10_000_000):
+    """Execute a list of Quads and return an ExecResult."""
+    targets = _labels(code)
+    env = {}
+    for x in _operands(code):
+        env[x] = _value(x) if is_literal(x) else 0
+    funcs = _FUNCS
+    out = []
+    n = len(code)
+    pc = 0
+    steps = 0
+    try:
+        while pc < n:
+            steps += 1
+            if steps > max_steps:
+                raise ExecutionError("step limit exceeded")
+            q = code[pc]
+            pc += 1
+            op = q.op
+            if op == COPY:
+                env[q.dest] = env[q.arg1]
+            elif op in funcs:
+                env[q.dest] = funcs[op](env[q.arg1], env[q.arg2])
+            elif op == IFFALSE:
+                if not funcs[q.relop](env[q.arg1], env[q.arg2]):
+                    pc = targets[q.dest]
+            elif op == GOTO:
+                pc = targets[q.dest]
+            elif op == IFZ:
+                if env[q.arg1] == 0:
+                    pc = targets[q.dest]
+            elif op == UMINUS:
+                env[q.dest] = -env[q.arg1]
+            elif op == PRINT:
+                out.append(env[q.arg1])
+    except KeyError as e:
+        raise ExecutionError(f"undefined label {e.args[0]!r}") from None
+    variables = {x: v for x, v in env.items() if not is_literal(x)}
+    return ExecResult(out, variables, steps)
+
+
+# -- compiler to a Python function --
+
+_PY_OPS = {'+': '+', '-': '-', '*': '*'}
+
+
+class CompiledProgram:
+    """A TAC program compiled to Python. Call run() as often as needed."""
+
+    def __init__(self, code):
+        self.source = _generate(code)
+        namespace = {'_div': _div, 'ExecutionError': ExecutionError}
+        exec(compile(self.source, '<tac>', 'exec'), namespace)
+        self._func = namespace['_program']
+
+    def run(self, max_steps=10_000_000):
+        out = []
+        variables, budget = self._func(out, max_steps)
+        return ExecResult(out, variables, max_steps - budget)
+
+
+def compile_tac(code):
+    return CompiledProgram(code)
+
+
+def _generate(code):
+    names = sorted(x for x in _operands(code) if not is_literal(x))
+    # locals are numbered: storage names such as `x.1` are not identifiers
+    local = {x: f"v{i}" for i, x in enumerate(names)}
+
+    def val(x):
+        if is_literal(x):
+            return repr(_value(x))
+        return local[x]
+
+    blocks = list(split_blocks(code))
+    block_of = {}
+    for b, (start, end) in enumerate(blocks):
+        if code[start].op == LABEL:
+            block_of[code[start].dest] = b
+
+    def target(label):
+        if label not in block_of:
+            raise ExecutionError(f"undefined label {label!r}")
+        return block_of[label]
+
+    bodies = []
+    for b, (start, end) in enumerate(blocks):
+        body = [f"budget -= {end - start}",
+                "if budget < 0: raise ExecutionError('step limit exceeded')"]
+        nxt = b + 1 if b + 1 < len(blocks) else -1
+        for q in code[start:end]:
+            op = q.op
+            if op == COPY:
+                body.append(f"{local[q.dest]} = {val(q.arg1)}")
+            elif op == '/':
+                body.append(f"{local[q.dest]} = _div({val(q.arg1)}, {val(q.arg2)})")
+            elif op in REL_OPS:
+                body.append(f"{local[q.dest]} = int({val(q.arg1)} {op} {val(q.arg2)})")
+            elif op in BINARY_OPS:
+                body.append(f"{local[q.dest]} = {val(q.arg1)} {_PY_OPS[op]} {val(q.arg2)}")
+            elif op == UMINUS:
+                body.append(f"{local[q.dest]} = -{val(q.arg1)}")
+            elif op == PRINT:
+                body.append(f"emit({val(q.arg1)})")
+            elif op == GOTO:
+                nxt = target(q.dest)
+            elif op == IFFALSE:
+                body.append(f"if not ({val(q.arg1)} {q.relop} {val(q.arg2)}): block = {target(q.dest)}")
+                body.append(f"else: block = {nxt}")
+                nxt = None
+            elif op == IFZ:
+                body.append(f"block = {target(q.dest)} if {val(q.arg1)} == 0 else {nxt}")
+                nxt = None
+        if nxt is not None:
+            body.append(f"block = {nxt}")
+        bodies.append(body)
+
+    lines = ["def _program(out, budget):", "    emit = out.append"]
+    lines += [f"    {local[x]} = 0" for x in names]
+    lines += ["    block = 0", "    while block >= 0:"] if blocks else []
+
+    def dispatch(lo, hi, indent):
+        # blocks lo..hi-1, chosen by bisecting on the block number
+        pad = ' ' * indent
+        if hi - lo == 1:
+            lines.extend(pad + s for s in bodies[lo])
+            return
+        mid = (lo + hi) // 2
+        lines.append(f"{pad}if block < {mid}:")
+        dispatch(lo, mid, indent + 4)
+        lines.append(f"{pad}else:")
+        dispatch(mid, hi, indent + 4)
+
+    if blocks:
+        dispatch(0, len(blocks), 8)
+    pairs = ', '.join(f"{x!r}: {local[x]}" for x in names)
+    lines.append(f"    return {{{pairs}}}, budget")
+    return '\n'.join(lines) + '\n'
+
+
+def run_compiled(code, max_steps=10_000_000):
+    return compile_tac(code).run(max_steps)
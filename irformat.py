@@ -0,0 +1,346 @@
+# Versioned binary encoding of TAC and pseudo-assembly...
+#
+# Layout (little-endian, every section 4-byte aligned):
+#
+#   header    magic b'MCIR', u16 version, u16 kind (TAC or ASM), u16 field
+#             size (2 or 4), u16 reserved, then u32 string count, record
+#             count, label count and the offsets of the record, label and
+#             string-data sections
+#   strings   string count + 1 u32 offsets into the string data
+#   records   fixed-width records of u16 or u32 fields, one per quad or
+#             instruction; u16 whenever every field fits
+#   labels    u32 (string index, record index) pairs, in order of appearance
+#   data      the interned strings (names, literals, labels), UTF-8
+#
+# A TAC record is (opcode | relop << 5, dest, arg1, arg2) where every
+# operand is an index into the string table or NONE (all ones). An ASM
+# record is (opcode | kind_a << 5 | kind_b << 7, a, b): a register operand
+# holds its register number, the others a string index. Labels are not ASM
+# records; the label table holds the address of the instruction each one
+# precedes, which is what a loader wants anyway.
+#
+# IRFile reads the sections through memoryviews over the buffer (an mmap
+# for load()), so opening a file costs a header check; strings are decoded
+# on first use. Records and strings are checked as they are decoded: an
+# opcode, operand kind, string or record index out of range, or string data
+# that is not UTF-8, raises IRError like a bad header does.
+
+import mmap
+import struct
+import sys
+from array import array
+
+from tac_generator import Quad, LABEL, GOTO, IFFALSE, IFZ, PRINT, COPY, UMINUS, BINARY_OPS, REL_OPS
+
+MAGIC = b'MCIR'
+VERSION = 1
+TAC, ASM = 1, 2
+
+TAC_OPCODES = (LABEL, GOTO, IFFALSE, IFZ, PRINT, COPY, UMINUS) + BINARY_OPS
+ASM_OPCODES = ('LOAD', 'LOADI', 'STORE', 'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'NEG', 'CMP',
+               'JMP', 'JE', 'JNE', 'JLT', 'JGT', 'JLE', 'JGE', 'PRINT')
+# ASM operand kinds
+NO_OPERAND, REGISTER, STRING = 0, 1, 2
+
+_HEADER = struct.Struct('<4sHHHHIIIIII')
+_TAC_WIDTH = 4
+_ASM_WIDTH = 3
+_TAC_CODE = {op: i for i, op in enumerate(TAC_OPCODES)}
+_ASM_CODE = {op: i for i, op in enumerate(ASM_OPCODES)}
+_RELOP_CODE = {op: i + 1 for i, op in enumerate(REL_OPS)}
+_RELOPS = (None,) + REL_OPS
+
+
+class IRError(Exception):
+    pass
+
+
+class _Strings:
+    def __init__(self):
+        self.index = {}
+        self.items = []
+
+    def add(self, s):
+        if s is None:
+            return -1           # NONE once the field size is known
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.items)
+            self.items.append(s)
+        return i
+
+
+def _array(typecode, values):
+    a = array(typecode, values)
+    if sys.byteorder != 'little':
+        a.byteswap()
+    return a
+
+
+def _pad4(n):
+    return n + (-n) % 4
+
+
+def _pack(kind, strings, records, labels):
+    data = [s.encode('utf-8') for s in strings.items]
+    offsets = [0]
+    for d in data:
+        offsets.append(offsets[-1] + len(d))
+    width = _TAC_WIDTH if kind == TAC else _ASM_WIDTH
+    field = 2 if max(records, default=0) < 0xFFFF else 4
+    none = (1 << 8 * field) - 1
+    code = _array('H' if field == 2 else 'I', [none if v < 0 else v for v in records])
+    code_off = _HEADER.size + 4 * len(offsets)
+    labels_off = _pad4(code_off + field * len(records))
+    data_off = labels_off + 4 * len(labels)
+    header = _HEADER.pack(MAGIC, VERSION, kind, field, 0, len(strings.items),
+                          len(records) // width, len(labels) // 2, code_off, labels_off, data_off)
+    return b''.join((header, _array('I', offsets).tobytes(), code.tobytes(),
+                     bytes(labels_off - code_off - field * len(records)),
+                     _array('I', labels).tobytes(), *data))
+
+
+def encode_tac(code):
+    """Bytes of a binary TAC module for a list of Quads."""
+    strings = _Strings()
+    records = []
+    labels = []
+    for i, q in enumerate(code):
+        try:
+            op = _TAC_CODE[q.op]
+        except KeyError:
+            raise IRError(f"unknown TAC opcode {q.op!r}") from None
+        if q.op == LABEL:
+            labels += (strings.add(q.dest), i)
+        records += (op | _RELOP_CODE.get(q.relop, 0) << 5, strings.add(q.dest),
+                    strings.add(q.arg1), strings.add(q.arg2))
+    return _pack(TAC, strings, records, labels)
+
+
+def _asm_operand(text, strings):
+    if text[0] == 'R' and text[1:].isdigit():
+        return REGISTER, int(text[1:])
+    return STRING, strings.add(text)
+
+
+def encode_asm(asm):
+    """Bytes of a binary ASM module for asm lines as MachineGenerator and
+    peephole() write them."""
+    strings = _Strings()
+    records = []
+    labels = []
+    for line in asm:
+        line = line.strip()
+        if not line:
+            continue
+        if line.endswith(':'):
+            labels += (strings.add(line[:-1]), len(records) // _ASM_WIDTH)
+            continue
+        op, _, rest = line.partition(' ')
+        if op not in _ASM_CODE:
+            raise IRError(f"unknown instruction {line!r}")
+        args = [a.strip() for a in rest.split(',')] if rest else []
+        if len(args) > 2:
+            raise IRError(f"too many operands in {line!r}")
+        kinds = [NO_OPERAND, NO_OPERAND]
+        values = [0, 0]
+        for k, a in enumerate(args):
+            kinds[k], values[k] = _asm_operand(a, strings)
+        records += (_ASM_CODE[op] | kinds[0] << 5 | kinds[1] << 7, values[0], values[1])
+    return _pack(ASM, strings, records, labels)
+
+
+def _cast(view, typecode):
+    # zero-copy on little-endian hosts; elsewhere a byte-swapped copy
+    if sys.byteorder == 'little':
+        return view.cast(typecode)
+    a = array(typecode, view.tobytes())
+    a.byteswap()
+    return memoryview(a)
+
+
+class IRFile:
+    """A binary TAC or ASM module read in place from a buffer."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._close = None
+        try:
+            self._open()
+        except Exception:
+            self._view.release()
+            raise
+
+    def _open(self):
+        view = self._view
+        if len(view) < _HEADER.size:
+            raise IRError("truncated header")
+        (magic, version, kind, field, _, nstrings, nrecords, nlabels,
+         code_off, labels_off, data_off) = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise IRError("not an IR file")
+        if version != VERSION:
+            raise IRError(f"unsupported IR version {version}")
+        if kind not in (TAC, ASM):
+            raise IRError(f"unknown IR kind {kind}")
+        if field not in (2, 4):
+            raise IRError(f"bad field size {field}")
+        width = _TAC_WIDTH if kind == TAC else _ASM_WIDTH
+        if not (_HEADER.size + 4 * (nstrings + 1) == code_off
+                and _pad4(code_off + field * width * nrecords) == labels_off
+                and labels_off + 8 * nlabels == data_off <= len(view)):
+            raise IRError("corrupt section table")
+        if struct.unpack_from('<I', view, code_off - 4)[0] > len(view) - data_off:
+            raise IRError("corrupt string table")
+        self.kind = kind
+        self.width = width
+        self._none = (1 << 8 * field) - 1
+        self._offsets = _cast(view[_HEADER.size:code_off], 'I')
+        self._records = _cast(view[code_off:code_off + field * width * nrecords],
+                              'H' if field == 2 else 'I')
+        self._label_table = _cast(view[labels_off:data_off], 'I')
+        self._data = view[data_off:]
+        self._strings = [None] * nstrings
+        self._nrecords = nrecords
+
+    def __len__(self):
+        return self._nrecords
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        for v in (self._offsets, self._records, self._label_table, self._data, self._view):
+            v.release()
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def string(self, i):
+        if i == self._none:
+            return None
+        if i >= len(self._strings):
+            raise IRError(f"string index {i} out of range")
+        s = self._strings[i]
+        if s is None:
+            start, end = self._offsets[i], self._offsets[i+1]
+            if not start <= end <= len(self._data):
+                raise IRError("corrupt string table")
+            try:
+                s = self._strings[i] = str(self._data[start:end], 'utf-8')
+            except UnicodeDecodeError:
+                raise IRError(f"string {i} is not UTF-8") from None
+        return s
+
+    def strings(self):
+        """The whole string table, decoded."""
+        return [self.string(i) for i in range(len(self._strings))]
+
+    def _columns(self):
+        # one list per record field
+        w = self.width
+        return [self._records[k::w].tolist() for k in range(w)]
+
+    def record(self, i):
+        """The raw u32 fields of record i."""
+        w = self.width
+        return tuple(self._records[i*w:(i+1)*w])
+
+    def labels(self):
+        """label -> record index (for ASM, the address it precedes)."""
+        t = self._label_table
+        if any(t[k] > self._nrecords for k in range(1, len(t), 2)):
+            raise IRError("label address out of range")
+        return {self.string(t[k]): t[k+1] for k in range(0, len(t), 2)}
+
+    # -- TAC --
+
+    def quad(self, i):
+        if self.kind != TAC:
+            raise IRError("not a TAC module")
+        r = self._records
+        w0 = r[4*i]
+        try:
+            op, relop = TAC_OPCODES[w0 & 31], _RELOPS[w0 >> 5]
+        except IndexError:
+            raise IRError(f"bad opcode field {w0:#x} in record {i}") from None
+        return Quad(op, self.string(r[4*i+1]), self.string(r[4*i+2]),
+                    self.string(r[4*i+3]), relop)
+
+    def quads(self):
+        """All quads, decoded column by column."""
+        if self.kind != TAC:
+            raise IRError("not a TAC module")
+        table = dict(enumerate(self.strings()))
+        table[self._none] = None
+        relops = _RELOPS
+        ops, dests, arg1s, arg2s = self._columns()
+        try:
+            return [Quad(TAC_OPCODES[w & 31], table[d], table[a], table[b], relops[w >> 5])
+                    for w, d, a, b in zip(ops, dests, arg1s, arg2s)]
+        except (IndexError, KeyError):
+            raise IRError("opcode or string index out of range") from None
+
+    # -- ASM --
+
+    def instructions(self):
+        """(mnemonic, operand texts) of every instruction, registers
+        written R<n> as in asm.txt. Identical records share one tuple."""
+        if self.kind != ASM:
+            raise IRError("not an ASM module")
+        strings = self.strings()
+        seen = {}
+        out = []
+        for rec in zip(*self._columns()):
+            ins = seen.get(rec)
+            if ins is None:
+                w = rec[0]
+                if w >> 9 or (w & 31) >= len(ASM_OPCODES):
+                    raise IRError(f"bad opcode field {w:#x} in record {len(out)}")
+                args = []
+                for kind, v in ((w >> 5 & 3, rec[1]), (w >> 7 & 3, rec[2])):
+                    if kind == REGISTER:
+                        args.append(f"R{v}")
+                    elif kind == STRING:
+                        if v >= len(strings):
+                            raise IRError(f"string index {v} out of range")
+                        args.append(strings[v])
+                    elif kind != NO_OPERAND:
+                        raise IRError(f"bad operand kind in record {len(out)}")
+                ins = seen[rec] = (ASM_OPCODES[w & 31], tuple(args))
+            out.append(ins)
+        return out
+
+    def asm(self):
+        """The asm lines, labels included."""
+        at = {}
+        for name, addr in self.labels().items():
+            at.setdefault(addr, []).append(f"{name}:")
+        out = []
+        for i, (op, args) in enumerate(self.instructions()):
+            out += at.get(i, ())
+            out.append(f"{op} {', '.join(args)}" if args else op)
+        out += at.get(self._nrecords, ())
+        return out
+
+
+def load(path):
+    """IRFile over a read-only mmap of path; close() it (or use `with`)."""
+    with open(path, 'rb') as f:
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        ir = IRFile(m)
+    except Exception:
+        m.close()
+        raise
+    ir._close = m.close
+    return ir
+
+
+def save(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
@@ -2,6 +2,11 @@
 # Custom lexer. Returns list of tokens (type, value, line, col)...
 
 import re
+import io
+import mmap
+import codecs
+import collections
+from array import array
 
 KEYWORDS = {'int','float','double','char','if','else','while','print','return'}
 OPS = {'+', '-', '*', '/', '=', '==','!=','<','>','<=','>='}
@@ -23,6 +28,8 @@ _tok_regex = '|'.join('(?P<%s>%s)' % pair for pair in token_specification)
 _get_token = re.compile(_tok_regex).match
 
 class Token:
+    __slots__ = ('type', 'value', 'line', 'col')
+
     def __init__(self, typ, val, line, col):
         self.type = typ
         self.value = val
@@ -31,14 +38,16 @@ class Token:
     def __repr__(self):
         return f"Token({self.type!r}, {self.value!r}, line={self.line},col={self.col})"
 
-def lexer(code):
-    """Return list of Token objects from source code string."""
-    pos = 0
-    line = 1
-    col = 1
-    tokens = []
-    mo = _get_token(code, pos)
-    while mo:
+def _scan_regex(code, pos, line, col, limit, push):
+    """Reference scanner over the token_specification alternation.
+
+    Scans tokens from code[pos:] whose match ends at or before limit,
+    calls push(type, value, line, col) per token and returns the
+    (pos, line, col) state to resume from.
+    """
+    get_token = _get_token
+    mo = get_token(code, pos)
+    while mo and mo.end() <= limit:
         typ = mo.lastgroup
         val = mo.group(typ)
         if typ == 'NEWLINE':
@@ -66,9 +75,353 @@ def lexer(code):
                 tok_type = 'CHAR'
             else:
                 tok_type = typ
-            tokens.append(Token(tok_type, val, line, col))
+            push(tok_type, val, line, col)
             col += len(val)
         pos = mo.end()
-        mo = _get_token(code, pos)
+        mo = get_token(code, pos)
+    return pos, line, col
+
+# Table-driven scanner...
+
+# First-character classes. The alternatives in token_specification start with
+# disjoint ASCII character sets, so the first character decides the rule.
+_C_SPACE, _C_NEWLINE, _C_WORD, _C_DIGIT, _C_DELIM, _C_OP, _C_OPEQ, _C_QUOTE = range(8)
+
+_CHAR_CLASS = {}
+for _c in ' \t':
+    _CHAR_CLASS[_c] = _C_SPACE
+_CHAR_CLASS['\n'] = _C_NEWLINE
+for _c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_':
+    _CHAR_CLASS[_c] = _C_WORD
+for _c in '0123456789':
+    _CHAR_CLASS[_c] = _C_DIGIT
+for _c in ';,(){}':
+    _CHAR_CLASS[_c] = _C_DELIM
+for _c in '+-*/':
+    _CHAR_CLASS[_c] = _C_OP
+for _c in '=<>!':
+    _CHAR_CLASS[_c] = _C_OPEQ     # may take a trailing '='
+_CHAR_CLASS["'"] = _C_QUOTE
+del _c
+
+_WORD_TYPE = {kw: 'KEYWORD' for kw in KEYWORDS}
+_match_space = re.compile(r'[ \t]+').match
+_match_word = re.compile(r'[A-Za-z0-9_]*').match
+_match_number = re.compile(r'\d+(\.\d+)?').match
+
+def _scan_table(code, pos, line, col, limit, push):
+    """Same contract and token stream as _scan_regex, but classifies each
+    token by a table lookup on its first character. Anything outside the
+    table (non-ASCII, stray characters) goes through the reference regex."""
+    classes = _CHAR_CLASS
+    word_type = _WORD_TYPE
+    n = len(code)
+    while pos < n:
+        cls = classes.get(code[pos])
+        if cls == _C_SPACE:
+            end = pos + 1
+            if end < n and classes.get(code[end]) == _C_SPACE:
+                end = _match_space(code, end).end()
+            if end > limit:
+                break
+            col += end - pos
+            pos = end
+            continue
+        if cls == _C_NEWLINE:
+            if pos >= limit:
+                break
+            pos += 1
+            line += 1
+            col = 1
+            continue
+        if cls == _C_WORD:
+            end = _match_word(code, pos + 1).end()
+            val = code[pos:end]
+            typ = word_type.get(val, 'ID')
+        elif cls == _C_DELIM:
+            end = pos + 1
+            val = code[pos]
+            typ = 'DELIM'
+        elif cls == _C_OP:
+            end = pos + 1
+            val = code[pos]
+            typ = 'OP'
+        elif cls == _C_OPEQ:
+            if code.startswith('=', pos + 1):
+                end = pos + 2
+                typ = 'OP'
+            elif code[pos] != '!':
+                end = pos + 1
+                typ = 'OP'
+            else:
+                end = pos + 1
+                typ = None
+            val = code[pos:end]
+        elif cls == _C_DIGIT:
+            end = _match_number(code, pos).end()
+            val = code[pos:end]
+            typ = 'NUMBER'
+        elif cls == _C_QUOTE and pos + 2 < n and code[pos+2] == "'" and code[pos+1] != '\n':
+            end = pos + 3
+            val = code[pos:end]
+            typ = 'CHAR'
+        else:
+            mo = _get_token(code, pos)
+            end = mo.end()
+            val = mo.group()
+            typ = 'NUMBER' if mo.lastgroup == 'NUMBER' else None
+        if end > limit:
+            break
+        if typ is None:
+            raise RuntimeError(f'Unexpected character {val!r} on line {line} col {col}')
+        push(typ, val, line, col)
+        col += end - pos
+        pos = end
+    return pos, line, col
+
+_ENGINES = {'table': _scan_table, 'regex': _scan_regex}
+_scan = _scan_table
+
+def lexer(code, engine='table'):
+    """Return list of Token objects from source code string.
+
+    engine='regex' selects the reference alternation scanner.
+    """
+    tokens = []
+    append = tokens.append
+    def push(typ, val, line, col):
+        append(Token(typ, val, line, col))
+    pos, line, col = _ENGINES[engine](code, 0, 1, 1, len(code), push)
     tokens.append(Token('EOF','',line,col))
     return tokens
+
+def lex_span(code, start, end, line, col, engine='table'):
+    """Tokens of code[start:end] (no EOF), positioned as if scanning reached
+    start at (line, col). Returns (tokens, pos, line, col); pos < end means a
+    token straddles end and was left unscanned."""
+    tokens = []
+    append = tokens.append
+    def push(typ, val, line, col):
+        append(Token(typ, val, line, col))
+    pos, line, col = scan_span(code, start, end, line, col, push, engine)
+    return tokens, pos, line, col
+
+def scan_span(code, start, end, line, col, push, engine='table'):
+    """lex_span without the Token objects: calls push(type, value, line, col)
+    for each token and returns (pos, line, col)."""
+    return _ENGINES[engine](code, start, line, col, end, push)
+
+# Compact token storage...
+
+KIND_NAMES = ('ID', 'KEYWORD', 'NUMBER', 'CHAR', 'OP', 'DELIM', 'EOF')
+KIND_CODES = {name: i for i, name in enumerate(KIND_NAMES)}
+_VIEW_BATCH = 256
+
+_Fields = collections.namedtuple('_Fields', 'type value line col')
+
+class TokenView(tuple):
+    """One TokenBuffer entry, read like a Token. Views are plain tuples with
+    namedtuple's field getters, so a batch of them is built from the arrays
+    without running Python code per token."""
+    __slots__ = ()
+    type, value, line, col = _Fields.type, _Fields.value, _Fields.line, _Fields.col
+
+    def __repr__(self):
+        return f"Token({self.type!r}, {self.value!r}, line={self.line},col={self.col})"
+
+class TokenBuffer:
+    """Struct-of-arrays token stream.
+
+    Kinds are small ints (see KIND_NAMES), line/col live in parallel int
+    arrays and values are indices into an interned string table, so a
+    token costs ~13 bytes instead of a full object. Indexing returns a
+    TokenView; Parser reads the buffer through views(), which keeps a
+    batch of recent views so cur()/advance() stay dict lookups.
+    """
+    def __init__(self):
+        self.kinds = array('B')
+        self.lines = array('I')
+        self.cols = array('I')
+        self.values = array('I')
+        self.strings = []      # interned values
+        self._ids = {}         # value -> index into strings
+
+    def push(self, typ, val, line, col):
+        ids = self._ids
+        sid = ids.get(val)
+        if sid is None:
+            sid = ids[val] = len(self.strings)
+            self.strings.append(val)
+        self.kinds.append(KIND_CODES[typ])
+        self.values.append(sid)
+        self.lines.append(line)
+        self.cols.append(col)
+
+    def extend(self, tokens):
+        push = self.push
+        for t in tokens:
+            push(t.type, t.value, t.line, t.col)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def _views(self, i, j):
+        # TokenViews of entries i..j-1
+        return map(TokenView, zip(map(KIND_NAMES.__getitem__, self.kinds[i:j]),
+                                  map(self.strings.__getitem__, self.values[i:j]),
+                                  self.lines[i:j], self.cols[i:j]))
+
+    def __getitem__(self, i):
+        n = len(self.kinds)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("token index out of range")
+        return TokenView((KIND_NAMES[self.kinds[i]], self.strings[self.values[i]],
+                          self.lines[i], self.cols[i]))
+
+    def __iter__(self):
+        for i in range(0, len(self.kinds), _VIEW_BATCH):
+            yield from self._views(i, i + _VIEW_BATCH)
+
+    def views(self):
+        """Index -> TokenView mapping for the parser."""
+        return _Views(self)
+
+    def nbytes(self):
+        """Bytes held by the per-token arrays (excluding the string table)."""
+        return sum(a.itemsize * len(a) for a in (self.kinds, self.lines, self.cols, self.values))
+
+class _Views(dict):
+    # a batch of views is made on a miss; older batches are dropped
+    __slots__ = ('_buf',)
+
+    def __init__(self, buf):
+        self._buf = buf
+
+    def __missing__(self, i):
+        buf = self._buf
+        if not 0 <= i < len(buf):
+            raise IndexError("token index out of range")
+        if len(self) >= 4 * _VIEW_BATCH:
+            self.clear()
+        self.update(zip(range(i, i + _VIEW_BATCH), buf._views(i, i + _VIEW_BATCH)))
+        return self[i]
+
+def lex_compact(source):
+    """Lex into a TokenBuffer. Accepts a source string or a token iterable
+    (e.g. iter_tokens/lex_file output) to keep streaming input compact."""
+    buf = TokenBuffer()
+    if isinstance(source, str):
+        pos, line, col = _scan(source, 0, 1, 1, len(source), buf.push)
+        buf.push('EOF', '', line, col)
+    else:
+        buf.extend(source)
+    return buf
+
+# Streaming mode...
+
+# Characters the scanner may need to see past the end of a match before it
+# can commit to it ('1' + '.5', quote + char + quote).
+_LOOKAHEAD = 2
+
+def _chunks(source, chunk_size):
+    # yield text chunks from a str, a text/binary file object or a buffer
+    if isinstance(source, str):
+        for i in range(0, len(source), chunk_size):
+            yield source[i:i+chunk_size]
+        return
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+    if hasattr(source, 'read') and not isinstance(source, mmap.mmap):
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                break
+            yield data if isinstance(data, str) else decoder.decode(data)
+    else:
+        for i in range(0, len(source), chunk_size):
+            yield decoder.decode(source[i:i+chunk_size])
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+def iter_tokens(source, chunk_size=1 << 16):
+    """Yield Token objects from a string, file object or mmap, one chunk at a time.
+
+    Only the unscanned tail of the current chunk and its tokens are held in
+    memory; line/col carry over chunk boundaries. Ends with an EOF token.
+    """
+    buf = ''
+    pos, line, col = 0, 1, 1
+    out = []
+    append = out.append
+    def push(typ, val, line, col):
+        append(Token(typ, val, line, col))
+    for chunk in _chunks(source, chunk_size):
+        buf = buf[pos:] + chunk
+        pos, line, col = _scan(buf, 0, line, col, len(buf) - _LOOKAHEAD, push)
+        yield from out
+        out.clear()
+    buf = buf[pos:]
+    pos, line, col = _scan(buf, 0, line, col, len(buf), push)
+    yield from out
+    yield Token('EOF','',line,col)
+
+def lex_file(path, chunk_size=1 << 16):
+    """Stream tokens from a source file through a read-only mmap."""
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            yield from iter_tokens('', chunk_size)
+            return
+        with mm:
+            yield from iter_tokens(mm, chunk_size)
+
+class TokenStream:
+    """Index-compatible window over a token iterator, for the Parser.
+
+    The parser only moves forward, so tokens before the requested index are
+    dropped; at most `lookahead` tokens past it may be peeked.
+    """
+    def __init__(self, tokens, lookahead=4):
+        self._it = iter(tokens)
+        self._buf = collections.deque()
+        self._base = 0          # stream index of _buf[0]
+        self._eof = None
+        self.lookahead = lookahead
+
+    def _pull(self):
+        tok = next(self._it, None)
+        if tok is None:
+            if self._eof is None:
+                raise IndexError("token stream exhausted")
+            return self._eof
+        if tok.type == 'EOF':
+            self._eof = tok
+        return tok
+
+    def __getitem__(self, i):
+        buf = self._buf
+        while self._base < i:
+            if buf:
+                buf.popleft()
+            else:
+                self._pull()
+            self._base += 1
+        k = i - self._base
+        if k < 0:
+            raise IndexError(f"token {i} already consumed")
+        if not buf:
+            buf.append(self._pull())
+        return buf[0]
+
+    def peek(self, k=1):
+        """Token k positions after the current one, without consuming."""
+        if k > self.lookahead:
+            raise IndexError(f"lookahead {k} exceeds window of {self.lookahead}")
+        buf = self._buf
+        while len(buf) <= k:
+            buf.append(self._pull())
+        return buf[k]
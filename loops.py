@@ -0,0 +1,321 @@
+# Loop detection and loop optimizations over TAC...
+#
+# find_loops() takes the natural loops of the CFG: an edge b -> h where h
+# dominates b is a back edge, and the loop is h plus every block that
+# reaches b without passing through h. Back edges to one header make one
+# loop. Code placed right before the header's label runs once per entry into
+# the loop (the preheader) as long as the only way in from outside is by
+# falling through into that label.
+#
+# The passes register in optimizer.PASSES:
+#   licm      hoist temp computations whose operands the loop never changes
+#   strength  turn `T = i * k` for an int induction variable i into a copy
+#             of a running sum updated next to each `i = i +/- c`
+#   invert    rewrite the parser's `L: cond; ifFalse E; body; goto L; E:`
+#             as a guard plus a bottom test, so an iteration takes one
+#             conditional jump instead of a conditional and a goto
+
+from cfg import build_cfg, dominators
+from tac_generator import (Quad, COPY, UMINUS, LABEL, GOTO, IFFALSE, IFZ, BINARY_OPS,
+                           REL_OPS, JUMP_OPS, DEF_OPS, is_temp, is_literal, literal_value)
+
+
+class Loop:
+    __slots__ = ('header', 'blocks', 'latches')
+
+    def __init__(self, header):
+        self.header = header      # block index
+        self.blocks = {header}    # member block indexes
+        self.latches = []         # blocks with a back edge to the header
+
+    def positions(self, cfg):
+        """Indexes into cfg.code of the loop's quads, in order."""
+        out = []
+        for b in sorted(self.blocks):
+            blk = cfg.blocks[b]
+            out.extend(range(blk.start, blk.end))
+        return out
+
+    def __repr__(self):
+        return f"Loop(header={self.header}, blocks={sorted(self.blocks)})"
+
+
+def find_loops(cfg):
+    """Natural loops of cfg, outermost (largest) first."""
+    dom = dominators(cfg)
+    reached = set(cfg.postorder())
+    loops = {}
+    for b in sorted(reached):
+        for h in cfg.blocks[b].succs:
+            if not dom[b] >> h & 1:
+                continue
+            loop = loops.get(h)
+            if loop is None:
+                loop = loops[h] = Loop(h)
+            loop.latches.append(b)
+            stack = [b]
+            while stack:
+                x = stack.pop()
+                if x not in loop.blocks:
+                    loop.blocks.add(x)
+                    stack.extend(p for p in cfg.blocks[x].preds if p in reached)
+    return sorted(loops.values(), key=lambda l: (-len(l.blocks), l.header))
+
+
+def has_preheader(cfg, loop):
+    """Does code inserted before the header's label run once per entry?"""
+    blk = cfg.blocks[loop.header]
+    outside = [p for p in blk.preds if p not in loop.blocks]
+    if loop.header == 0:
+        return not outside
+    if outside != [loop.header - 1]:
+        return False
+    last = cfg.code[cfg.blocks[outside[0]].end - 1]
+    return not (last.op in JUMP_OPS and last.dest == blk.label)
+
+
+def _loops(code):
+    cfg = build_cfg(code)
+    return cfg, [l for l in find_loops(cfg) if has_preheader(cfg, l)]
+
+
+def _rebuild(code, drop, before, after=None):
+    # drop: positions to leave out; before/after: position -> quads to add
+    after = after or {}
+    out = []
+    for i, q in enumerate(code):
+        out.extend(before.get(i, ()))
+        if i not in drop:
+            out.append(q)
+        out.extend(after.get(i, ()))
+    return out
+
+
+def _args(q):
+    return [a for a in (q.arg1, q.arg2) if a is not None]
+
+
+def _fresh(code, prefix):
+    # first unused number for temps ('T') or labels ('L')
+    n = 0
+    for q in code:
+        x = q.dest      # every temp is defined and every label placed somewhere
+        if x is not None and x[0] == prefix and x[1:].isdigit():
+            n = max(n, int(x[1:]))
+    return n + 1
+
+
+# -- loop-invariant code motion --
+
+def _speculable(q):
+    # safe to run even when the loop body would not have: no trap
+    if q.op == '/':
+        return literal_value(q.arg2) not in (None, 0)
+    return q.op in BINARY_OPS or q.op == UMINUS
+
+
+def loop_invariant_code_motion(code):
+    """Move temp computations whose operands are not redefined inside a loop
+    into its preheader. Each loop is visited outermost first, so a value
+    leaves every loop it is invariant in. Copies stay put: they are as cheap
+    to redo as a hoisted temp is to reload."""
+    cfg, loops = _loops(code)
+    if not loops:
+        return code
+    defs = {}
+    uses = {}
+    for i, q in enumerate(code):
+        if q.op in DEF_OPS:
+            defs[q.dest] = defs.get(q.dest, 0) + 1
+        for a in _args(q):
+            uses.setdefault(a, []).append(i)
+    hoisted = {}        # position -> header label position
+    for loop in loops:
+        positions = loop.positions(cfg)
+        inside = set(positions)
+        changed = {}    # name -> definitions left in the loop
+        for i in positions:
+            q = code[i]
+            if q.op in DEF_OPS and i not in hoisted:
+                changed[q.dest] = changed.get(q.dest, 0) + 1
+        target = cfg.blocks[loop.header].start
+        for i in positions:
+            q = code[i]
+            if (i in hoisted or not _speculable(q) or not is_temp(q.dest)
+                    or defs[q.dest] != 1 or not inside.issuperset(uses.get(q.dest, ()))):
+                continue
+            if all(is_literal(a) or not changed.get(a) for a in _args(q)):
+                hoisted[i] = target
+                changed[q.dest] -= 1
+    if not hoisted:
+        return code
+    before = {}
+    for i in sorted(hoisted):
+        before.setdefault(hoisted[i], []).append(code[i])
+    return _rebuild(code, hoisted, before)
+
+
+# -- strength reduction --
+
+def _float_names(code):
+    """Names some definition may leave a float in. Relational results are
+    ints and unset names read as 0."""
+    floats = set()
+    changed = True
+    while changed:
+        changed = False
+        for q in code:
+            if q.op not in DEF_OPS or q.op in REL_OPS or q.dest in floats:
+                continue
+            if any(a in floats or isinstance(literal_value(a), float) for a in _args(q)):
+                floats.add(q.dest)
+                changed = True
+    return floats
+
+
+def _int_literal(x):
+    v = literal_value(x) if x is not None else None
+    return v if isinstance(v, int) else None
+
+
+def _step(code, i, name):
+    """c when code[i] is `name = name + c` / `name = name - c` with an int
+    literal c, or the `name = T` of `T = name + c; name = T`; else None."""
+    q = code[i]
+    if q.op == COPY and is_temp(q.arg1) and i > 0:
+        prev = code[i-1]
+        if prev.dest != q.arg1:
+            return None
+        q = prev
+    if q.op == '+':
+        if q.arg1 == name:
+            return _int_literal(q.arg2)
+        if q.arg2 == name:
+            return _int_literal(q.arg1)
+    elif q.op == '-' and q.arg1 == name:
+        c = _int_literal(q.arg2)
+        return -c if c is not None else None
+    return None
+
+
+def strength_reduction(code):
+    """For `T = i * k` in a loop, with k an int literal and i an int whose
+    only definitions in the loop add or subtract int literals, keep S = i * k
+    in a new temp: set it in the preheader, add c * k after every step of i,
+    and turn the multiplication into `T = S`."""
+    cfg, loops = _loops(code)
+    if not loops:
+        return code
+    uses = {}
+    for q in code:
+        for a in _args(q):
+            uses[a] = uses.get(a, 0) + 1
+    floats = None
+    temp = _fresh(code, 'T')
+    replaced = {}       # position -> new quad
+    before = {}
+    after = {}
+    for loop in loops:
+        positions = loop.positions(cfg)
+        steps = {}      # name -> [(position, c)], None if not an induction variable
+        for i in positions:
+            q = code[i]
+            if q.op not in DEF_OPS:
+                continue
+            if is_temp(q.dest):
+                continue
+            c = _step(code, i, q.dest)
+            if c is None or q.op == COPY and uses.get(q.arg1) != 1:
+                steps[q.dest] = None
+            elif steps.get(q.dest, ()) is not None:
+                steps.setdefault(q.dest, []).append((i, c))
+        sums = {}       # (i, k) -> running sum temp
+        for p in positions:
+            q = code[p]
+            if q.op != '*' or p in replaced:
+                continue
+            for iv, k in ((q.arg1, q.arg2), (q.arg2, q.arg1)):
+                k = _int_literal(k)
+                if k is not None and steps.get(iv):
+                    break
+            else:
+                continue
+            if floats is None:
+                floats = _float_names(code)
+            if iv in floats:
+                continue
+            s = sums.get((iv, k))
+            if s is None:
+                s = sums[(iv, k)] = f"T{temp}"
+                temp += 1
+                before.setdefault(cfg.blocks[loop.header].start, []).append(
+                    Quad('*', s, iv, str(k)))
+                for i, c in steps[iv]:
+                    d = c * k
+                    after.setdefault(i, []).append(
+                        Quad('+' if d >= 0 else '-', s, s, str(abs(d))))
+            replaced[p] = Quad(COPY, q.dest, s)
+    if not replaced:
+        return code
+    code = [replaced.get(i, q) for i, q in enumerate(code)]
+    return _rebuild(code, (), before, after)
+
+
+# -- loop inversion --
+
+_NEGATE = {'==': '!=', '!=': '==', '<': '>=', '>=': '<', '>': '<=', '<=': '>'}
+
+INVERT_LIMIT = 16   # longest condition worth duplicating, in quads
+
+
+def loop_inversion(code):
+    """Rewrite each `L: cond; ifFalse ... E; body; goto L; E:` whose label L
+    is only reached by that goto into `cond; ifFalse ... E; B: body; cond';
+    ifFalse <negated> B; E:`, cond' being cond on fresh temps."""
+    targets = {}
+    labels = {}
+    for i, q in enumerate(code):
+        if q.op in JUMP_OPS:
+            targets.setdefault(q.dest, []).append(i)
+        elif q.op == LABEL:
+            labels[q.dest] = i
+    temp = _fresh(code, 'T')
+    label = _fresh(code, 'L')
+    drop = set()
+    after = {}
+    for top, q in enumerate(code):
+        if q.op != LABEL or len(targets.get(q.dest, ())) != 1:
+            continue
+        back = targets[q.dest][0]
+        if back < top:
+            continue
+        j = top + 1
+        while j < back and code[j].op in DEF_OPS and is_temp(code[j].dest):
+            j += 1
+        test = code[j]
+        if (j >= back or j - top - 1 > INVERT_LIMIT or test.op not in (IFFALSE, IFZ)
+                or code[back].op != GOTO or back + 1 >= len(code)
+                or code[back+1].op != LABEL or code[back+1].dest != test.dest):
+            continue
+        body = f"L{label}"
+        label += 1
+        rename = {}
+        bottom = []
+        for c in code[top+1:j]:
+            rename[c.dest] = f"T{temp}"
+            temp += 1
+            bottom.append(Quad(c.op, rename[c.dest], rename.get(c.arg1, c.arg1),
+                               rename.get(c.arg2, c.arg2), c.relop))
+        a1 = rename.get(test.arg1, test.arg1)
+        if test.op == IFZ:
+            bottom.append(Quad(IFFALSE, body, a1, '0', '=='))
+        else:
+            bottom.append(Quad(IFFALSE, body, a1, rename.get(test.arg2, test.arg2),
+                               _NEGATE[test.relop]))
+        drop.add(top)
+        drop.add(back)
+        after[j] = [Quad(LABEL, body)]
+        after[back] = bottom
+    if not drop:
+        return code
+    return _rebuild(code, drop, {}, after)
@@ -1,114 +1,270 @@
-
 # Convert TAC list into simple  pseudo-assembly...
+#
+# Registers are allocated per basic block with the liveness computed by
+# register_allocator.analyze(). Variables are written through to memory on
+# every assignment; temps stay in registers and are only stored when they
+# are spilled while still live or are live on exit from their block.
+
+from tac_generator import (LABEL, GOTO, IFFALSE, IFZ, PRINT, COPY, UMINUS, BINARY_OPS,
+                           REL_OPS, is_temp, is_literal, literal_value)
+from register_allocator import ALLOCATORS, INF, analyze
+
+_OPCODES = {'+': 'ADD', '-': 'SUB', '*': 'MUL', '/': 'DIV'}
+# jump taken when the relation is false / true
+_JUMP_IF_FALSE = {'==': 'JNE', '!=': 'JE', '<': 'JGE', '>': 'JLE', '<=': 'JGT', '>=': 'JLT'}
+_JUMP_IF_TRUE = {'==': 'JE', '!=': 'JNE', '<': 'JLT', '>': 'JGT', '<=': 'JLE', '>=': 'JGE'}
+
 
 class MachineGenerator:
-    def __init__(self, num_registers=4):
+    def __init__(self, num_registers=4, allocator='linear'):
+        if num_registers < 2:
+            raise ValueError("need at least 2 registers")
         self.num_registers = num_registers
-        self.reg_map = {}     # operand -> register name...
-        self.reg_in_use = []  # list of operands in registers order...
+        self.regs = [f"R{i+1}" for i in range(num_registers)]
+        self.allocator = ALLOCATORS[allocator](num_registers)
+        self.contents = [[] for _ in range(num_registers)]  # names held by each register
+        self.loc = {}          # name -> register index
+        self.dirty = set()     # temps whose only current copy is in a register
         self.asm = []
+        self._block = None
+        self._pos = 0
+        self._pinned = set()   # registers read by the current instruction
+        self._cmp_labels = 0
+        self.spills = 0        # stores forced by evicting a value still needed
 
-    def get_reg(self, operand):
-        # if oper already in register, return it...
-        if operand in self.reg_map:
-            return self.reg_map[operand]
-
-        if len(self.reg_in_use) < self.num_registers:
-            r = f"R{len(self.reg_in_use)+1}"
-            self.reg_map[operand] = r
-            self.reg_in_use.append(operand)
+    # -- register state --
+
+    def is_literal(self, op):
+        return is_literal(op)
+
+    def _unbind(self, name):
+        r = self.loc.pop(name, None)
+        if r is not None:
+            self.contents[r].remove(name)
+        self.dirty.discard(name)
+
+    def _needed(self, name):
+        # would dropping name lose the only copy of a value still to be read?
+        return name in self.dirty and self._block.live_after(name, self._pos - 1)
+
+    def _evict(self, r):
+        reg = self.regs[r]
+        for name in self.contents[r]:
+            del self.loc[name]
+            if self._needed(name):
+                self.asm.append(f"STORE {reg}, {name}")
+                self.spills += 1
+        self.dirty.difference_update(self.contents[r])
+        self.contents[r] = []
+
+    def _spill_rank(self, r):
+        names = self.contents[r]
+        dist = min((self._block.next_use(n, self._pos - 1) for n in names), default=INF)
+        stores = sum(1 for n in names if self._needed(n))
+        return (dist, -stores)
+
+    def _take(self):
+        """A free register from the allocator's scratch set, else the one whose
+        contents are needed furthest away (spilled). None if all are in use
+        by the current instruction."""
+        candidates = [r for r in self.allocator.scratch if r not in self._pinned]
+        for r in candidates:
+            if not self.contents[r]:
+                return r
+        if not candidates:
+            return None
+        r = max(candidates, key=self._spill_rank)
+        self._evict(r)
+        return r
+
+    def _use(self, operand):
+        """Register index holding operand, loading it if necessary."""
+        r = self.loc.get(operand)
+        if r is None:
+            r = self._take()
             if self.is_literal(operand):
-                self.asm.append(f"LOADI {r}, {operand}")
+                self.asm.append(f"LOADI {self.regs[r]}, {operand}")
             else:
-                self.asm.append(f"LOAD {r}, {operand}")
-            return r
-
-        
-        spilled = self.reg_in_use.pop(0)
-        r = self.reg_map.pop(spilled)
-        self.asm.append(f"STORE {r}, {spilled}")
-        self.reg_map[operand] = r
-        self.reg_in_use.append(operand)
-        if self.is_literal(operand):
-            self.asm.append(f"LOADI {r}, {operand}")
-        else:
-            self.asm.append(f"LOAD {r}, {operand}")
+                self.asm.append(f"LOAD {self.regs[r]}, {operand}")
+            self.loc[operand] = r
+            self.contents[r].append(operand)
+        self._pinned.add(r)
         return r
 
-    def is_literal(self, op):
-        if op.startswith("'") and op.endswith("'"):
-            return True
-        try:
-            float(op)
-            return True
-        except:
-            return False
-
-    def free_reg_of(self, operand):
-        if operand in self.reg_map:
-            r = self.reg_map.pop(operand)
-            if operand in self.reg_in_use:
-                self.reg_in_use.remove(operand)
-            return r
-        return None
+    def get_reg(self, operand):
+        return self.regs[self._use(operand)]
+
+    def _dest(self, dest, src, keep_src=True):
+        """Register to compute dest in. With keep_src the result starts as a
+        copy of register src (two-address ops); otherwise src is only the
+        preferred register."""
+        h = self.allocator.home(self._pos) if is_temp(dest) else None
+        if h is not None:
+            if h != src:
+                self._evict(h)
+                if keep_src:
+                    self.asm.append(f"MOV {self.regs[h]}, {self.regs[src]}")
+            return h
+        scratch = self.allocator.scratch
+        r = None
+        if src in scratch:
+            names = [n for n in self.contents[src] if n != dest]
+            if not any(self._block.live_after(n, self._pos) for n in names):
+                return src                  # nothing else in src is read again
+            free = [f for f in scratch if not self.contents[f] and f not in self._pinned]
+            if free:
+                r = free[0]
+            elif not any(n in self.dirty for n in names):
+                return src                  # only cached copies are lost
+        if r is None:
+            r = self._take()
+        if r is None:
+            # every register feeds this instruction: save src and reuse it
+            for n in self.contents[src]:
+                if n != dest and self._needed(n):
+                    self.asm.append(f"STORE {self.regs[src]}, {n}")
+                    self.spills += 1
+                    self.dirty.discard(n)
+            return src
+        if keep_src:
+            self.asm.append(f"MOV {self.regs[r]}, {self.regs[src]}")
+        return r
+
+    def _define(self, dest, r, alias=False):
+        """Record that r holds dest's new value. Unless alias, r's previous
+        contents are gone."""
+        if not alias:
+            for name in list(self.contents[r]):
+                if name != dest:
+                    self._unbind(name)
+        self._unbind(dest)
+        self.loc[dest] = r
+        self.contents[r].append(dest)
+        if is_temp(dest) and self.allocator.in_register(self._pos):
+            self.dirty.add(dest)
+        elif not is_temp(dest) or self._block.live_after(dest, self._pos):
+            self.asm.append(f"STORE {self.regs[r]}, {dest}")
+
+    def _flush(self):
+        # store dirty temps that later blocks read
+        live_out = self._block.live_out
+        for name in sorted(self.dirty):
+            if name in live_out:
+                self.asm.append(f"STORE {self.regs[self.loc[name]]}, {name}")
+        self.dirty.clear()
+
+    def _reset(self):
+        self.contents = [[] for _ in range(self.num_registers)]
+        self.loc = {}
+        self.dirty = set()
+
+    # -- instructions --
 
     def binop(self, dest, a, op, b):
-        ra = self.get_reg(a)
-        rb = self.get_reg(b)
-        opmap = {'+':'ADD','-':'SUB','*':'MUL','/':'DIV'}
-        instr = opmap.get(op, 'NOP')
-        self.asm.append(f"{instr} {ra}, {rb}")  
-        if dest in self.reg_map:
-            rd = self.reg_map[dest]
-            self.asm.append(f"MOV {rd}, {ra}")
-            old = self.reg_map.pop(dest)
-            if dest in self.reg_in_use:
-                self.reg_in_use.remove(dest)
-        old_key = None
-        for k,v in list(self.reg_map.items()):
-            if v == ra:
-                old_key = k
-                break
-        if old_key and old_key != dest:
-            # replace mapping
-            self.reg_map.pop(old_key, None)
-            if old_key in self.reg_in_use:
-                self.reg_in_use.remove(old_key)
-        self.reg_map[dest] = ra
-        if dest not in self.reg_in_use:
-            self.reg_in_use.append(dest)
-        return
+        if op in REL_OPS:
+            return self.compare_value(dest, a, op, b)
+        ra = self._use(a)
+        rb = self._use(b)
+        rd = self._dest(dest, ra)
+        self.asm.append(f"{_OPCODES[op]} {self.regs[rd]}, {self.regs[rb]}")
+        self._define(dest, rd)
+
+    def compare_value(self, dest, a, op, b):
+        # dest = (a op b) as 1/0, branching around the second LOADI
+        ra = self._use(a)
+        self.asm.append(f"CMP {self.regs[ra]}, {self._operand(b)}")
+        rd = self._dest(dest, ra, keep_src=False)
+        self._cmp_labels += 1
+        skip = f"LC{self._cmp_labels}"
+        self.asm.append(f"LOADI {self.regs[rd]}, 1")
+        self.asm.append(f"{_JUMP_IF_TRUE[op]} {skip}")
+        self.asm.append(f"LOADI {self.regs[rd]}, 0")
+        self.asm.append(f"{skip}:")
+        self._define(dest, rd)
+
+    def negate(self, dest, operand):
+        r = self._use(operand)
+        rd = self._dest(dest, r)
+        self.asm.append(f"NEG {self.regs[rd]}")
+        self._define(dest, rd)
 
     def assign(self, dest, src):
-        
-        rsrc = self.get_reg(src)
-       
-        self.asm.append(f"STORE {rsrc}, {dest}")
-        if dest in self.reg_map:
-            self.reg_map.pop(dest)
-            if dest in self.reg_in_use:
-                self.reg_in_use.remove(dest)
+        if dest == src:
+            return
+        r = self._use(src)
+        h = self.allocator.home(self._pos) if is_temp(dest) else None
+        if h is not None and h != r:
+            self._evict(h)
+            self.asm.append(f"MOV {self.regs[h]}, {self.regs[r]}")
+            self._define(dest, h)
+        elif h is not None or r in self.allocator.scratch:
+            self._define(dest, r, alias=True)
+        else:
+            # homes only ever hold colored temps
+            self._unbind(dest)
+            if not is_temp(dest) or self._block.live_after(dest, self._pos):
+                self.asm.append(f"STORE {self.regs[r]}, {dest}")
+
+    def _operand(self, b):
+        # CMP accepts a numeric immediate on the right
+        if b not in self.loc and literal_value(b) is not None:
+            return b
+        return self.regs[self._use(b)]
 
     def iffalse_jump(self, left, op, right, label):
-        rl = self.get_reg(left)
-        rr = self.get_reg(right)
-        self.asm.append(f"CMP {rl}, {rr}")
-        jmp = {
-            '==':'JNE', '!=':'JE',
-            '<':'JGE', '>':'JLE', '<=':'JGT', '>=':'JLT'
-        }.get(op, 'JNE')
-        self.asm.append(f"{jmp} {label}")
+        self._flush()
+        rl = self._use(left)
+        self.asm.append(f"CMP {self.regs[rl]}, {self._operand(right)}")
+        self.asm.append(f"{_JUMP_IF_FALSE.get(op, 'JNE')} {label}")
 
     def ifz_jump(self, operand, label):
-        r = self.get_reg(operand)
-        self.asm.append(f"CMP {r}, 0")
+        self._flush()
+        r = self._use(operand)
+        self.asm.append(f"CMP {self.regs[r]}, 0")
         self.asm.append(f"JE {label}")
 
+    def emit_print(self, operand):
+        r = self.loc.get(operand)
+        self.asm.append(f"PRINT {operand if r is None else self.regs[r]}")
+
     def emit_label(self, label):
         self.asm.append(f"{label}:")
 
     def emit_goto(self, label):
+        self._flush()
         self.asm.append(f"JMP {label}")
 
+    def generate(self, code):
+        # walk TAC quads block by block, dispatching on opcode...
+        for block in analyze(code):
+            self._block = block
+            self.allocator.begin_block(code, block)
+            for i in range(block.start, block.end):
+                q = code[i]
+                self._pos = i
+                self._pinned.clear()
+                op = q.op
+                if op == COPY:
+                    self.assign(q.dest, q.arg1)
+                elif op in BINARY_OPS:
+                    self.binop(q.dest, q.arg1, op, q.arg2)
+                elif op == LABEL:
+                    self.emit_label(q.dest)
+                elif op == GOTO:
+                    self.emit_goto(q.dest)
+                elif op == IFFALSE:
+                    self.iffalse_jump(q.arg1, q.relop, q.arg2, q.dest)
+                elif op == IFZ:
+                    self.ifz_jump(q.arg1, q.dest)
+                elif op == UMINUS:
+                    self.negate(q.dest, q.arg1)
+                elif op == PRINT:
+                    self.emit_print(q.arg1)
+            if code[block.end - 1].op not in (GOTO, IFFALSE, IFZ):
+                self._pos = block.end
+                self._flush()
+            self._reset()
+        return self.finalize()
+
     def finalize(self):
         return self.asm[:]
@@ -1,97 +1,259 @@
 # main.py
-from lexer import lexer
-from parser import Parser, ParserError
-from machine_generator import MachineGenerator
-import sys
+from lexer import lexer, lex_file
+from parser import ParserError
+from compiler import (compile_source, compile_file, DEFAULT_ARTIFACTS, ARTIFACTS,
+                      write_artifacts, token_lines, symbol_lines, tac_lines)
+from vm import VM, VMError
+from cache import CompileCache
+from profiling import Profiler, combine, format_table
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
+import json
 import os
+import sys
+import time
+
+
+SECTIONS = ('source', 'tokens', 'symbols', 'tac', 'asm')
 
-def run_file(filename="sample_code.txt"):
-    with open(filename, "r") as f:
-        src = f.read()
-    print("=== SOURCE CODE ===")
-    print(src)
-    # Lexical stage
-    print("\n=== LEXICAL TOKENS ===")
-    toks = lexer(src)
-    for t in toks:
-        print(t)
-    # Parsing/TAC
-    print("\n=== PARSING & TAC GENERATION ===")
-    p = Parser(toks)
+
+def run_file(filename="sample_code.txt", opt_level=0, num_registers=4, allocator="linear",
+             execute=False, cache=None, profiler=None, show=(), emit=DEFAULT_ARTIFACTS,
+             outdir="output", jobs=1, compact_tokens=False, stream=False):
+    """Compile filename, write the `emit` artifacts into outdir and print the
+    `show` sections (names from SECTIONS). Returns the Compilation, or None
+    after a parse error. jobs > 1 parses a large file in that many processes;
+    compact_tokens holds the tokens in a lexer.TokenBuffer. stream lexes the
+    file as the parser reads it (compiler.compile_file), without the cache
+    or jobs, and never holds the whole source."""
+    src = None
+    if not stream or "source" in show:
+        with open(filename, "r") as f:
+            src = f.read()
+    out = []
+    if "source" in show:
+        out += ["=== SOURCE CODE ===", src]
     try:
-        p.parse()
+        if stream:
+            result = compile_file(filename, opt_level, num_registers, allocator, profiler,
+                                  "tokens" in show or "tokens" in emit)
+        else:
+            result = compile_source(src, opt_level, num_registers, allocator, cache, profiler,
+                                    jobs, compact_tokens)
     except ParserError as e:
-        print("Parser error:", e)
-        return
-    # Dump symbol table
-    print("\n=== SYMBOL TABLE ===")
-    for k,v in p.symtab.items():
-        print(f"{k} : {v}")
-    # Dump TAC
-    print("\n=== THREE-ADDRESS CODE (TAC) ===")
-    p.tac.dump()
-    tac_lines = p.tac.get_code()
-    # Machine code generation
-    print("\n=== MACHINE CODE (pseudo assembly) ===")
-    mg = MachineGenerator(num_registers=4)
-    for instr in tac_lines:
-        # interpret instr
-        parts = instr.split()
-        if parts[0] == 'label':
-            mg.emit_label(parts[1])
-        elif parts[0] == 'goto':
-            mg.emit_goto(parts[1])
-        elif parts[0] == 'PRINT':
-            # operand is parts[1] (maybe temp)
-            mg.asm.append(f"PRINT {parts[1]}")
-        elif parts[0] == 'ifFalse':
-            # ifFalse left op right goto L
-            _, left, op, right, _, lbl = parts
-            mg.iffalse_jump(left, op, right, lbl)
-        elif parts[0] == 'ifz':
-            _, operand, _, lbl = parts
-            mg.ifz_jump(operand, lbl)
-        elif parts[0] == 'label':
-            mg.emit_label(parts[1])
-        elif parts[0] == 't' or parts[0].startswith('T') or '=' in instr:
-            # assignment or temp computation
-            if '=' in instr:
-                lhs, rhs = instr.split('=',1)
-                lhs = lhs.strip(); rhs = rhs.strip()
-                if rhs.startswith('uminus '):
-                    opnd = rhs.split()[1]
-                    r = mg.get_reg(opnd)
-                    mg.asm.append(f"NEG {r}")
-                    mg.asm.append(f"STORE {r}, {lhs}")
-                elif any(op in rhs for op in [' + ',' - ',' * ',' / ','==','!=','<=','>=','<','>']):
-                    # binary; parse a op b
-                    # split by spaces
-                    parts_rhs = rhs.split()
-                    a = parts_rhs[0]; oper = parts_rhs[1]; b = parts_rhs[2]
-                    mg.binop(lhs, a, oper, b)
-                else:
-                    # simple assignment
-                    mg.assign(lhs, rhs)
+        if "tokens" in show:
+            out.append("\n=== LEXICAL TOKENS ===")
+            out += token_lines(lex_file(filename) if stream else lexer(src))
+        if show:
+            out.append("\n=== PARSING & TAC GENERATION ===")
+        out.append(f"Parser error: {e}")
+        _write(out)
+        return None
+    if "tokens" in show:
+        out.append("\n=== LEXICAL TOKENS ===")
+        out += token_lines(result.toks)
+    if "symbols" in show or "tac" in show:
+        out.append("\n=== PARSING & TAC GENERATION ===")
+    if "symbols" in show:
+        out.append("\n=== SYMBOL TABLE ===")
+        out += symbol_lines(result.symtab)
+    if "tac" in show:
+        out.append("\n=== THREE-ADDRESS CODE (TAC) ===")
+        out += tac_lines(result.tac)
+        if opt_level:
+            out.append(f"\n=== OPTIMIZED TAC (-O{opt_level}) ===")
+            out += tac_lines(result.tac_code)
+    if "asm" in show:
+        out.append("\n=== MACHINE CODE (pseudo assembly) ===")
+        out += result.asm
+    write_artifacts(outdir, result, emit)
+    if execute:
+        out.append("\n=== EXECUTION ===")
+        try:
+            stats = VM().run(result.asm)
+        except VMError as e:
+            out.append(f"VM error: {e}")
         else:
-            # fallback: try parse assignment
-            if '=' in instr:
-                lhs, rhs = instr.split('=',1)
-                mg.assign(lhs.strip(), rhs.strip())
-    asm = mg.finalize()
-    for a in asm:
-        print(a)
-    # save outputs
-    outdir="output"
-    os.makedirs(outdir, exist_ok=True)
-    with open(outdir+"/tokens.txt","w") as f:
-        for t in toks: f.write(repr(t)+"\n")
-    with open(outdir+"/tac.txt","w") as f:
-        for i,l in enumerate(tac_lines,1): f.write(f"({i}) {l}\n")
-    with open(outdir+"/asm.txt","w") as f:
-        for a in asm: f.write(a+"\n")
+            out += [str(v) for v in stats.output]
+            out.append("\n=== CYCLE REPORT ===")
+            out += stats.report()
+    _write(out)
+    return result
+
+
+def _write(lines):
+    # one write for the whole report rather than a print per line
+    if lines:
+        sys.stdout.write("\n".join(lines).lstrip("\n") + "\n")
+
+
+# -- batch mode --
+
+_caches = {}    # cache dir -> CompileCache, one per worker process
+
+
+def _compile_job(job):
+    # runs in a worker: (path, outdir, options, cache dir, stats, artifacts)
+    # -> per-file summary; stats is None or Profiler arguments
+    path, outdir, options, cache_dir, stats, artifacts = job
+    profiler = Profiler(*stats) if stats is not None else None
+    start = time.perf_counter()
+    cache = None
+    if cache_dir is not None:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = CompileCache(cache_dir)
+    try:
+        with open(path, "r") as f:
+            src = f.read()
+        result = compile_source(src, *options, cache=cache, profiler=profiler)
+        write_artifacts(outdir, result, artifacts)
+    except (RuntimeError, ParserError, OSError) as e:
+        summary = {"file": path, "ok": False, "error": f"{type(e).__name__}: {e}",
+                   "seconds": time.perf_counter() - start}
+    else:
+        summary = {"file": path, "ok": True, "outdir": outdir, "bytes": len(src),
+                   "lines": src.count("\n") + 1, "asm": len(result.asm),
+                   "seconds": time.perf_counter() - start}
+    if profiler is not None:
+        profiler.close()
+        summary["stats"] = profiler.to_dict()
+    return summary
+
+
+def expand_inputs(patterns):
+    """Files named by patterns (globs are expanded), in order, without repeats."""
+    files = []
+    seen = set()
+    for pat in patterns:
+        matches = sorted(glob.glob(pat, recursive=True)) if glob.has_magic(pat) else [pat]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+
+def output_dirs(files, outroot):
+    # one directory per input, named after its stem; clashes get a suffix
+    dirs = []
+    used = set()
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 1
+        while name in used:
+            name = f"{stem}_{n}"
+            n += 1
+        used.add(name)
+        dirs.append(os.path.join(outroot, name))
+    return dirs
+
+
+def compile_batch(files, outroot="output", workers=None, opt_level=0, num_registers=4,
+                  allocator="linear", cache_dir=None, stats=None, artifacts=DEFAULT_ARTIFACTS):
+    """Compile files in a process pool. Returns (per-file results, wall seconds);
+    failures are reported in the results, never raised. stats (Profiler
+    arguments) profiles each file into its result's "stats"."""
+    options = (opt_level, num_registers, allocator)
+    jobs = [(path, d, options, cache_dir, stats, tuple(artifacts))
+            for path, d in zip(files, output_dirs(files, outroot))]
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1 or len(jobs) < 2:
+        results = [_compile_job(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compile_job, jobs, chunksize=chunksize))
+    return results, time.perf_counter() - start
+
+
+def batch_summary(results, wall):
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    lines = [f"FAILED {r['file']}: {r['error']}" for r in failed]
+    nbytes = sum(r["bytes"] for r in ok)
+    nlines = sum(r["lines"] for r in ok)
+    rate = len(results) / wall if wall else 0.0
+    lines.append(f"{len(results)} files: {len(ok)} ok, {len(failed)} failed in {wall:.2f}s")
+    lines.append(f"{rate:.1f} files/s, {nlines / wall if wall else 0:.0f} lines/s, "
+                 f"{nbytes / wall / 1e6 if wall else 0:.2f} MB/s")
+    return lines
+
+
+def _artifact_list(text):
+    names = tuple(n for n in text.split(",") if n)
+    for n in names:
+        if n not in ARTIFACTS:
+            raise argparse.ArgumentTypeError(f"unknown artifact {n!r}")
+    return names
+
 
 if __name__=="__main__":
-    fn = "sample_code.txt"
-    if len(sys.argv)>1:
-        fn = sys.argv[1]
-    run_file(fn)
+    ap = argparse.ArgumentParser(description="Mini compiler")
+    ap.add_argument("files", nargs="*", default=["sample_code.txt"],
+                    help="source file (several files or globs with --batch)")
+    ap.add_argument("-O", dest="opt_level", type=int, choices=(0, 1, 2), default=0,
+                    help="TAC optimization level (-O0, -O1, -O2)")
+    ap.add_argument("--registers", type=int, default=4, help="number of machine registers")
+    ap.add_argument("--allocator", choices=("linear", "coloring"), default="linear",
+                    help="register allocator (default: linear scan)")
+    ap.add_argument("--run", action="store_true",
+                    help="execute the generated assembly and report cycles")
+    ap.add_argument("--batch", action="store_true",
+                    help="compile all files quietly in parallel, one output dir each")
+    ap.add_argument("-j", "--jobs", type=int, default=None,
+                    help="worker processes for --batch (default: CPU count), or to lex "
+                         "and parse one large file in chunks (default: 1)")
+    ap.add_argument("--compact-tokens", action="store_true",
+                    help="hold tokens in compact arrays (about 6x less memory, slower parse)")
+    ap.add_argument("--stream", action="store_true",
+                    help="lex the file in chunks as it is parsed instead of reading it whole "
+                         "(no --cache or -j)")
+    ap.add_argument("--out-dir", default="output",
+                    help="directory for artifacts (with --batch, one subdirectory per file)")
+    ap.add_argument("--emit", type=_artifact_list, default=DEFAULT_ARTIFACTS, metavar="LIST",
+                    help="comma-separated artifacts to write, from "
+                         f"{','.join(ARTIFACTS)} (default: {','.join(DEFAULT_ARTIFACTS)}; "
+                         "empty for none)")
+    ap.add_argument("--show", action="append", choices=SECTIONS, default=[],
+                    help="print a section (repeatable); nothing is printed by default")
+    ap.add_argument("-v", "--verbose", action="store_true", help="print every section")
+    ap.add_argument("--cache", metavar="DIR", default=None,
+                    help="reuse compile results stored in DIR for unchanged sources")
+    ap.add_argument("--stats", choices=("table", "json"), default=None,
+                    help="report per-stage time and counters (summed over files with --batch)")
+    ap.add_argument("--stats-memory", action="store_true",
+                    help="with --stats, also trace peak memory per stage and parser calls "
+                         "(slows compilation down)")
+    args = ap.parse_args()
+
+    def print_stats(stats):
+        print("\n=== COMPILE STATS ===")
+        if args.stats == "json":
+            print(json.dumps(stats, indent=2))
+        else:
+            for line in format_table(stats):
+                print(line)
+
+    if args.batch:
+        stats = (args.stats_memory, args.stats_memory) if args.stats else None
+        results, wall = compile_batch(expand_inputs(args.files), args.out_dir, args.jobs,
+                                      args.opt_level, args.registers, args.allocator,
+                                      args.cache, stats, args.emit)
+        for line in batch_summary(results, wall):
+            print(line)
+        if args.stats:
+            print_stats(combine(r["stats"] for r in results))
+        raise SystemExit(1 if any(not r["ok"] for r in results) else 0)
+    if len(args.files) != 1:
+        ap.error("give one file, or use --batch")
+    profiler = Profiler(args.stats_memory, args.stats_memory) if args.stats else None
+    run_file(args.files[0], args.opt_level, args.registers, args.allocator, args.run,
+             CompileCache(args.cache) if args.cache else None, profiler,
+             SECTIONS if args.verbose else args.show, args.emit, args.out_dir, args.jobs or 1,
+             args.compact_tokens, args.stream)
+    if profiler is not None:
+        profiler.close()
+        print_stats(profiler.to_dict())
@@ -0,0 +1,321 @@
+# TAC optimizer. Runs configurable passes over the quad list between the
+# parser and MachineGenerator...
+#
+# Passes are local to basic blocks (labels start one, jumps end one) except
+# dead temp elimination and unreachable code removal, which look at the
+# whole program, and the loop passes from loops.py, which work on natural
+# loops of the CFG. Variables are memory and stay observable, so only temps
+# are ever deleted or moved.
+
+from tac_generator import (Quad, COPY, UMINUS, LABEL, GOTO, IFFALSE, IFZ,
+                           BINARY_OPS, COMMUTATIVE_OPS, JUMP_OPS, DEF_OPS,
+                           is_temp, literal_value, apply_op, split_blocks)
+from loops import loop_invariant_code_motion, strength_reduction, loop_inversion
+import heapq
+import math
+
+
+def _fold(op, a, b):
+    # literal text for `a op b`, or None when it must be left to run time
+    try:
+        value = apply_op(op, a, b)
+    except ZeroDivisionError:
+        return None
+    if isinstance(value, int):
+        return str(value)
+    return repr(value) if math.isfinite(value) else None
+
+
+def constant_fold(code):
+    """Evaluate operators on numeric literals and decide constant branches."""
+    out = []
+    for q in code:
+        op = q.op
+        if op in BINARY_OPS or op == UMINUS:
+            a = literal_value(q.arg1)
+            b = literal_value(q.arg2) if op != UMINUS else 0
+            if a is not None and b is not None:
+                value = _fold(op, a, b)
+                if value is not None:
+                    out.append(Quad(COPY, q.dest, value))
+                    continue
+        elif op == IFFALSE:
+            a = literal_value(q.arg1)
+            b = literal_value(q.arg2)
+            if a is not None and b is not None:
+                if not apply_op(q.relop, a, b):
+                    out.append(Quad(GOTO, q.dest))
+                continue
+        elif op == IFZ:
+            a = literal_value(q.arg1)
+            if a is not None:
+                if a == 0:
+                    out.append(Quad(GOTO, q.dest))
+                continue
+        out.append(q)
+    return out
+
+
+def copy_propagation(code):
+    """Within a block, replace uses of x after `x = y` by y (y may be a
+    literal, so this also propagates constants) until either is redefined."""
+    out = []
+    for start, end in split_blocks(code):
+        copies = {}     # name -> replacement
+        readers = {}    # replacement -> names currently copied from it
+        for q in code[start:end]:
+            a1 = copies.get(q.arg1, q.arg1) if q.arg1 is not None else None
+            a2 = copies.get(q.arg2, q.arg2) if q.arg2 is not None else None
+            if a1 is not q.arg1 or a2 is not q.arg2:
+                q = Quad(q.op, q.dest, a1, a2, q.relop)
+            if q.op in DEF_OPS:
+                d = q.dest
+                old = copies.pop(d, None)
+                if old is not None:
+                    readers[old].discard(d)
+                for name in readers.pop(d, ()):
+                    del copies[name]
+                if q.op == COPY and a1 != d:
+                    copies[d] = a1
+                    readers.setdefault(a1, set()).add(d)
+            out.append(q)
+    return out
+
+
+def common_subexpressions(code):
+    """Within a block, turn a recomputed `a op b` into a copy of the operand
+    that already holds it."""
+    out = []
+    for start, end in split_blocks(code):
+        avail = {}      # (op, a, b) -> holder
+        keys_of = {}    # operand or holder -> keys mentioning it
+        for q in code[start:end]:
+            op = q.op
+            if op in BINARY_OPS or op == UMINUS:
+                a, b = q.arg1, q.arg2
+                if op in COMMUTATIVE_OPS and b < a:
+                    a, b = b, a
+                key = (op, a, b)
+                holder = avail.get(key)
+                if holder is not None:
+                    q = Quad(COPY, q.dest, holder)
+            else:
+                key = None
+            if op in DEF_OPS:
+                d = q.dest
+                for k in keys_of.pop(d, ()):
+                    avail.pop(k, None)
+                if key is not None and d != key[1] and d != key[2] and key not in avail:
+                    avail[key] = d
+                    for name in (key[1], key[2], d):
+                        if name is not None:
+                            keys_of.setdefault(name, set()).add(key)
+            out.append(q)
+    return out
+
+
+def coalesce_copies(code):
+    """Fold `T = a op b; x = T` into `x = a op b` when T has no other use."""
+    uses = _use_counts(code)
+    out = []
+    for q in code:
+        prev = out[-1] if out else None
+        if (q.op == COPY and prev is not None and prev.op in DEF_OPS and prev.op != COPY
+                and prev.dest == q.arg1 and is_temp(q.arg1) and uses.get(q.arg1) == 1):
+            out[-1] = Quad(prev.op, q.dest, prev.arg1, prev.arg2, prev.relop)
+            continue
+        out.append(q)
+    return out
+
+
+def dead_temps(code):
+    """Drop definitions of temps that are never read anywhere."""
+    uses = _use_counts(code)
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        for q in code:
+            if q.op in DEF_OPS and is_temp(q.dest) and not uses.get(q.dest):
+                for arg in (q.arg1, q.arg2):
+                    if arg is not None:
+                        uses[arg] -= 1
+                changed = True
+                continue
+            out.append(q)
+        code = out
+    return code
+
+
+def unreachable_code(code):
+    """Remove code after an unconditional goto up to the next label, gotos to
+    the very next label, and labels nothing jumps to."""
+    out = []
+    dead = False
+    for q in code:
+        if q.op == LABEL:
+            dead = False
+        if not dead:
+            out.append(q)
+        if q.op == GOTO:
+            dead = True
+    code = out
+    out = []
+    for i, q in enumerate(code):
+        if q.op == GOTO:
+            j = i + 1
+            while j < len(code) and code[j].op == LABEL and code[j].dest != q.dest:
+                j += 1
+            if j < len(code) and code[j].op == LABEL:
+                continue
+        out.append(q)
+    targets = {q.dest for q in out if q.op in JUMP_OPS}
+    return [q for q in out if q.op != LABEL or q.dest in targets]
+
+
+def _use_counts(code):
+    uses = {}
+    for q in code:
+        for arg in (q.arg1, q.arg2):
+            if arg is not None:
+                uses[arg] = uses.get(arg, 0) + 1
+    return uses
+
+
+PASSES = {
+    'fold': constant_fold,
+    'copyprop': copy_propagation,
+    'cse': common_subexpressions,
+    'coalesce': coalesce_copies,
+    'dce': dead_temps,
+    'unreachable': unreachable_code,
+    'licm': loop_invariant_code_motion,
+    'strength': strength_reduction,
+    'invert': loop_inversion,
+}
+
+LEVELS = {
+    0: (),
+    1: ('fold', 'copyprop', 'dce'),
+    2: ('fold', 'coalesce', 'copyprop', 'cse', 'copyprop', 'licm', 'invert', 'unreachable',
+        'dce'),
+}
+# 'strength' is left out of -O2: its running sum lives in memory across
+# blocks, and the LOAD/STORE per iteration costs more than the MUL it saves.
+
+
+def optimize(code, level=1, passes=None, max_rounds=10):
+    """Run `passes` (names from PASSES; default from LEVELS[level]) over the
+    quads until nothing changes. Returns a new list.
+
+    The passes count uses per temp name, so temps are first given one name
+    per definition (the parser recycles them) and recycled again at the end.
+    """
+    if passes is None:
+        passes = LEVELS[level]
+    funcs = [PASSES[name] for name in passes]
+    if not funcs:
+        return list(code)
+    code = unique_temps(code)
+    for _ in range(max_rounds):
+        before = code
+        for f in funcs:
+            code = f(code)
+        if code == before:
+            break
+    return compact_temps(code)
+
+
+# -- temp naming --
+
+def _temp_ranges(code):
+    """(ranges, fixed): ranges maps the position of each block-local temp
+    definition to the position of its last read (itself if never read);
+    fixed holds the temps read somewhere without a definition earlier in the
+    same block, which are left alone."""
+    ranges = {}
+    fixed = set()
+    for start, end in split_blocks(code):
+        current = {}        # temp -> position of its definition in this block
+        for i in range(start, end):
+            q = code[i]
+            for arg in (q.arg1, q.arg2):
+                if arg is not None and is_temp(arg):
+                    d = current.get(arg)
+                    if d is None:
+                        fixed.add(arg)
+                    else:
+                        ranges[d] = i
+            if q.op in DEF_OPS and is_temp(q.dest):
+                current[q.dest] = ranges[i] = i
+    if fixed:
+        ranges = {i: e for i, e in ranges.items() if code[i].dest not in fixed}
+    return ranges, fixed
+
+
+def _renamed(q, names, dest=None):
+    # q with its operands (and dest, if given) renamed; q itself if unchanged
+    if dest is None:
+        dest = names.get(q.dest, q.dest) if q.op in DEF_OPS else q.dest
+    a1 = names.get(q.arg1, q.arg1)
+    a2 = names.get(q.arg2, q.arg2)
+    if dest == q.dest and a1 == q.arg1 and a2 == q.arg2:
+        return q
+    return Quad(q.op, dest, a1, a2, q.relop)
+
+
+def unique_temps(code):
+    """Give every block-local temp definition its own name, numbered in
+    order of definition."""
+    ranges, fixed = _temp_ranges(code)
+    taken = {int(t[1:]) for t in fixed}
+    n = 0
+    names = {}          # temp -> name of its current definition
+    out = []
+    for i, q in enumerate(code):
+        if i in ranges:
+            n += 1
+            while n in taken:
+                n += 1
+            new = f"T{n}"
+            out.append(_renamed(q, names, new))
+            names[q.dest] = new
+        else:
+            out.append(_renamed(q, names))
+    return out
+
+
+def compact_temps(code):
+    """Rename temps so a block-local one frees its number after its last
+    read, each definition taking the lowest free number. Temps live across
+    blocks keep one number throughout."""
+    ranges, fixed = _temp_ranges(code)
+    free = []           # heap of released numbers
+    top = 0
+    names = {}          # temp -> current name
+    release = {}        # position -> numbers freed after it
+    out = []
+    for i, q in enumerate(code):
+        for arg in (q.arg1, q.arg2):
+            if arg in fixed and arg not in names:
+                if free:
+                    names[arg] = f"T{heapq.heappop(free)}"
+                else:
+                    top += 1
+                    names[arg] = f"T{top}"
+        new = None
+        if i in ranges or q.dest in fixed and q.op in DEF_OPS and q.dest not in names:
+            if free:
+                k = heapq.heappop(free)
+            else:
+                top += 1
+                k = top
+            new = f"T{k}"
+            if i in ranges:
+                release.setdefault(ranges[i], []).append(k)
+        out.append(_renamed(q, names, new))
+        if new is not None:
+            names[q.dest] = new
+        for k in release.pop(i, ()):
+            heapq.heappush(free, k)
+    return out
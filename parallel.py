@@ -0,0 +1,287 @@
+# Parallel front end: lex and parse one large source in a process pool...
+#
+# Two passes, both over pieces of the source text, so only strings cross
+# process boundaries on the way out:
+#
+# 1. outline: the source is cut at line starts (no token spans a newline)
+#    and each piece is scanned for its top-level structure: brace depth,
+#    where statements end, which names it declares (and how deep) and how
+#    many `if`/`while`s it holds. Brace depth is relative to the piece; a
+#    depth only counts as top level once the pieces before it are added up.
+# 2. front: the source is cut again at top-level statement boundaries and
+#    each chunk is lexed and parsed by its own Parser. The pre-pass tells a
+#    chunk every name the chunks before it declared and which of them are
+#    top level, so its redeclaration and use-before-declaration checks see
+#    what a serial parse would and a name's n-th declaration gets storage
+#    `name.n` as it would serially. It also says where the chunk's label
+#    numbers start: every `if` and `while` makes two labels. Temps need no
+#    rebasing, since TACGenerator numbers them afresh in every statement.
+#
+# The chunks' tokens, TAC and declarations are concatenated in order, which
+# gives exactly what the serial compile produces. Each chunk reports its
+# declarations and label count, and they must match the pre-pass; any
+# mismatch or error, including every lexer and parser error, reruns the
+# serial front end so messages are the serial ones.
+
+import contextlib
+import gc
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from lexer import Token, lexer, lex_span, scan_span
+from parser import Parser, ParserError
+from symbols import SymbolTable
+from tac_generator import Quad
+
+MIN_BYTES = 1 << 18         # smaller sources are parsed serially
+PIECES_PER_WORKER = 4
+
+_TYPES = {'int', 'float', 'double', 'char'}
+
+
+class FrontEnd:
+    """Tokens, SymbolTable and TAC of a whole source, plus the counters the
+    serial parse reports and the number of chunks parsed (0 if serial)."""
+
+    def __init__(self, toks, symtab, tac, temp_count, label_count, chunks):
+        self.toks = toks
+        self.symtab = symtab
+        self.tac = tac
+        self.temp_count = temp_count
+        self.label_count = label_count
+        self.chunks = chunks
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # tokens and quads are acyclic; collecting while building millions of
+    # them costs more than the building
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def serial(src):
+    toks = lexer(src)
+    p = Parser(toks)
+    p.parse()
+    return FrontEnd(toks, p.symtab, p.tac.get_code(), p.tac.temp_count, p.tac.label_count, 0)
+
+
+# -- pass 1 --
+
+def _outline(text, offset, line):
+    """Top-level structure of text, the source from `offset` on (whole lines,
+    the first numbered `line`). Returns (first token's value, brace depth at
+    the end, lowest depth, ends, decls, branches, open):
+      ends      (offset, line, col, branches, decls) just after each `;` or
+                `}` at the lowest depth that is not followed by `else`
+      decls     (name, type, depth) of every declaration
+      branches  `if`s and `while`s
+      open      the last token is the last end; `else` may follow it
+    """
+    ends = []
+    decls = []
+    depth = low = branches = 0
+    first = None
+    after_end = False       # the previous token closed a recorded end
+    decl = None             # type of the declaration being read
+    want = False            # the next ID is a declared name
+
+    def push(typ, val, line, col):
+        nonlocal depth, low, branches, first, after_end, decl, want
+        if first is None:
+            first = val
+        w, want = want, False
+        end = after_end
+        after_end = False
+        if typ == 'DELIM':
+            if val == ';' or val == '}':
+                if val == '}':
+                    depth -= 1
+                    if depth < low:
+                        low = depth
+                        ends.clear()
+                else:
+                    decl = None
+                if depth == low:
+                    ends.append((line, col + 1, branches, len(decls)))
+                    after_end = True
+            elif val == '{':
+                depth += 1
+            elif val == ',' and decl is not None:
+                want = True
+        elif typ == 'KEYWORD':
+            if val == 'else':
+                if end:
+                    ends.pop()
+            elif val == 'if' or val == 'while':
+                branches += 1
+            elif val in _TYPES:
+                decl = val
+                want = True
+        elif w and typ == 'ID':
+            decls.append((val, decl, depth))
+
+    with _gc_paused():
+        scan_span(text, 0, len(text), line, 1, push)
+        starts = [0]
+        i = text.find('\n')
+        while i >= 0:
+            starts.append(i + 1)
+            i = text.find('\n', i + 1)
+        ends = [(offset + starts[l - line] + c - 1, l, c, b, d) for l, c, b, d in ends]
+    return first, depth, low, ends, decls, branches, after_end
+
+
+def _boundaries(outlines):
+    """(offset, line, col, label base, declarations before) of every
+    top-level statement boundary, all (name, type, at top level)s in order
+    and the label count; None if the braces do not balance."""
+    bounds = []
+    decls = []
+    depth = branches = 0
+    nxt = None              # first token of the pieces after this one
+    firsts = []
+    for o in reversed(outlines):
+        if o[0] is not None:
+            nxt = o[0]
+        firsts.append(nxt)
+    firsts.reverse()
+    for k, (first, d, low, ends, names, b, open_) in enumerate(outlines):
+        if depth + low < 0:
+            return None
+        if depth + low == 0:
+            if open_ and k + 1 < len(outlines) and firsts[k + 1] == 'else':
+                ends = ends[:-1]
+            for off, line, col, nb, nd in ends:
+                bounds.append((off, line, col, 2 * (branches + nb), len(decls) + nd))
+        decls += [(name, typ, depth + rel == 0) for name, typ, rel in names]
+        depth += d
+        branches += b
+    if depth:
+        return None
+    return bounds, decls, 2 * branches
+
+
+# -- pass 2 --
+
+def _front(text, line, col, decls, label_base, last):
+    """Lex and parse one chunk of whole top-level statements, starting from
+    a symbol table that has seen decls, the top-level ones still visible.
+    Returns its tokens (with EOF only if last) and TAC as columns, the
+    declarations it made and its temp and label counts."""
+    with _gc_paused():
+        toks, _, eline, ecol = lex_span(text, 0, len(text), line, col)
+        toks.append(Token('EOF', '', eline, ecol))
+        p = Parser(toks)
+        st = p.symtab
+        for name, typ, top in decls:
+            if top:
+                st.declare(name, typ)
+            else:
+                st.push()
+                st.declare(name, typ)
+                st.pop()
+        p.tac._label = label_base
+        p.parse()
+        if not last:
+            toks.pop()
+        code = p.tac.code
+        n = len(decls)
+        # one object per distinct string, so pickling sends each once
+        seen = {}
+        same = seen.setdefault
+        return ([t.type for t in toks], [same(t.value, t.value) for t in toks],
+                array('I', [t.line for t in toks]), array('I', [t.col for t in toks]),
+                [q.op for q in code], [same(q.dest, q.dest) for q in code],
+                [same(q.arg1, q.arg1) for q in code], [same(q.arg2, q.arg2) for q in code],
+                [q.relop for q in code],
+                st.names[n:], st.types[n:], st.depths[n:], st.storage[n:],
+                p.tac.temp_count, p.tac.label_count - label_base)
+
+
+def _cuts(src, n):
+    # about n pieces of whole lines: [(start, end, first line number)]
+    out = []
+    start, line = 0, 1
+    step = max(1, len(src) // n)
+    while start < len(src):
+        end = src.find('\n', start + step)
+        end = len(src) if end < 0 else end + 1
+        out.append((start, end, line))
+        line += src.count('\n', start, end)
+        start = end
+    return out
+
+
+def _chunks(src, bounds, n):
+    # about n chunks split at bounds: [(start, line, col, label base, decls)]
+    out = [(0, 1, 1, 0, 0)]
+    step = len(src) / n
+    target = step
+    for b in bounds:
+        if b[0] >= target and b[0] < len(src):
+            out.append(b)
+            target = b[0] + step
+    return out
+
+
+def _parallel(src, pool, n):
+    # FrontEnd from about n pieces and chunks, or None to parse serially
+    try:
+        outlines = list(pool.map(_outline, *zip(*((src[a:b], a, l) for a, b, l in _cuts(src, n)))))
+    except RuntimeError:
+        return None             # a lexer error; the serial lexer reports the first
+    found = _boundaries(outlines)
+    if found is None:
+        return None
+    bounds, decls, labels = found
+    chunks = _chunks(src, bounds, n)
+    ends = [c[0] for c in chunks[1:]] + [len(src)]
+    try:
+        parts = list(pool.map(_front, *zip(*((src[c[0]:e], c[1], c[2], decls[:c[4]], c[3],
+                                              e == len(src)) for c, e in zip(chunks, ends)))))
+    except (RuntimeError, ParserError):
+        return None
+
+    # every chunk must have declared and labelled what the pre-pass said
+    chunks.append((len(src), None, None, labels, len(decls)))
+    for k, part in enumerate(parts):
+        made = [(name, typ, not depth) for name, typ, depth in zip(part[9], part[10], part[11])]
+        if (made != decls[chunks[k][4]:chunks[k + 1][4]]
+                or part[14] != chunks[k + 1][3] - chunks[k][3]):
+            return None
+
+    toks = []
+    tac = []
+    symtab = SymbolTable()
+    for part in parts:
+        toks += map(Token, *part[0:4])
+        tac += map(Quad, *part[4:9])
+        symtab.extend(*part[9:13])
+    return FrontEnd(toks, symtab, tac, max(p[13] for p in parts), labels, len(parts))
+
+
+def parse_parallel(src, workers=None, pool=None):
+    """FrontEnd of src, lexed and parsed in chunks over `workers` processes
+    (or an existing ProcessPoolExecutor). Raises what the serial lexer and
+    parser raise."""
+    workers = workers or os.cpu_count() or 1
+    if len(src) < MIN_BYTES or workers < 2:
+        return serial(src)
+    own = pool is None
+    if own:
+        pool = ProcessPoolExecutor(workers)
+    try:
+        with _gc_paused():
+            fe = _parallel(src, pool, workers * PIECES_PER_WORKER)
+    finally:
+        if own:
+            pool.shutdown()
+    return serial(src) if fe is None else fe
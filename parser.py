@@ -1,9 +1,12 @@
 
 # Custom parser using tokens from lexer.py and TAC generator.
 
-from tac_generator import TACGenerator
+from tac_generator import TACGenerator, COPY, PRINT, IFFALSE, IFZ, GOTO, LABEL, UMINUS, REL_OPS
+from symbols import SymbolTable
 from lexer import Token
 import lexer as lexmod
+import contextlib
+import sys
 
 
 _PRECEDENCE = {
@@ -12,16 +15,37 @@ _PRECEDENCE = {
     '+': (3,'left'), '-': (3,'left'),
     '==': (2,'left'), '!=':(2,'left'), '<':(2,'left'), '>':(2,'left'), '<=':(2,'left'), '>=':(2,'left')
 }
+_CMP_PREC = _PRECEDENCE['=='][0]
+_RECURSION_LIMIT = 20000
 
 class ParserError(Exception):
     pass
 
+@contextlib.contextmanager
+def deep_recursion():
+    # expressions recurse once per nesting level; generated code nests deep
+    limit = sys.getrecursionlimit()
+    if limit < _RECURSION_LIMIT:
+        sys.setrecursionlimit(_RECURSION_LIMIT)
+    try:
+        yield
+    except RecursionError:
+        raise ParserError("Expression nested too deeply") from None
+    finally:
+        sys.setrecursionlimit(limit)
+
 class Parser:
     def __init__(self, tokens):
+        # plain iterators (e.g. lexer.iter_tokens) get a bounded window,
+        # a TokenBuffer its cheap views
+        if isinstance(tokens, lexmod.TokenBuffer):
+            tokens = tokens.views()
+        elif not hasattr(tokens, '__getitem__'):
+            tokens = lexmod.TokenStream(tokens)
         self.tokens = tokens
         self.pos = 0
         self.tac = TACGenerator()
-        self.symtab = {}  # name->type
+        self.symtab = SymbolTable()
 
     def cur(self):
         return self.tokens[self.pos]
@@ -40,10 +64,35 @@ class Parser:
         return t
 
     def parse(self):
-        while self.cur().type != 'EOF':
-            self.parse_statement()
+        with deep_recursion():
+            while self.cur().type != 'EOF':
+                self.parse_statement()
         return self.tac.get_code()
 
+    # symbol table access; subclasses may record these
+    def declare(self, name, typ):
+        """Declare name in the current scope; returns its TAC operand."""
+        if self.symtab.declared_here(name):
+            raise ParserError(f"Redeclaration of {name}")
+        return self.symtab.storage[self.symtab.declare(name, typ)]
+
+    def require_declared(self, name):
+        """TAC operand of a declared name."""
+        sid = self.symtab.lookup(name)
+        if sid is None:
+            raise ParserError(f"Variable {name} used before declaration")
+        return self.symtab.storage[sid]
+
+    def read(self, name):
+        """TAC operand of a name read in an expression."""
+        return self.symtab.operand(name)
+
+    def enter_scope(self):
+        self.symtab.push()
+
+    def exit_scope(self):
+        self.symtab.pop()
+
     def parse_statement(self):
         t = self.cur()
         if t.type == 'KEYWORD' and t.value in ('int','float','double','char'):
@@ -68,16 +117,13 @@ class Parser:
         while True:
             if self.cur().type != 'ID':
                 raise ParserError("Expected identifier in declaration")
-            name = self.cur().value
-            if name in self.symtab:
-                raise ParserError(f"Redeclaration of {name}")
-            self.symtab[name] = typ
+            var = self.declare(self.cur().value, typ)
             self.advance()
             if self.cur().type == 'OP' and self.cur().value == '=':
                 self.advance()
-                val_temp = self.parse_expression_until_delim({',',';'})
+                val_temp = self.parse_expression()
                 # assign
-                self.tac.emit(f"{name} = {val_temp}")
+                self.tac.emit(COPY, var, val_temp)
             if self.cur().type == 'DELIM' and self.cur().value == ',':
                 self.advance()
                 continue
@@ -88,15 +134,13 @@ class Parser:
                 raise ParserError("Expected ',' or ';' after declaration")
 
     def parse_assignment(self):
-        name = self.cur().value
-        if name not in self.symtab:
-            raise ParserError(f"Variable {name} used before declaration")
+        var = self.require_declared(self.cur().value)
         self.advance()
         if not (self.cur().type == 'OP' and self.cur().value == '='):
             raise ParserError("Expected '=' in assignment")
         self.advance()
-        val_temp = self.parse_expression_until_delim({';'})
-        self.tac.emit(f"{name} = {val_temp}")
+        val_temp = self.parse_expression()
+        self.tac.emit(COPY, var, val_temp)
         # expect ;
         if self.cur().type == 'DELIM' and self.cur().value == ';':
             self.advance()
@@ -109,14 +153,14 @@ class Parser:
         if not (self.cur().type == 'DELIM' and self.cur().value == '('):
             raise ParserError("Expected '(' after print")
         self.advance()
-        val_temp = self.parse_expression_until_delim({')'})
+        val_temp = self.parse_expression()
         if not (self.cur().type == 'DELIM' and self.cur().value == ')'):
             raise ParserError("Expected ')' after print expr")
         self.advance()
         if not (self.cur().type == 'DELIM' and self.cur().value == ';'):
             raise ParserError("Expected ';' after print")
         self.advance()
-        self.tac.emit(f"PRINT {val_temp}")
+        self.tac.emit(PRINT, arg1=val_temp)
 
     def parse_if(self):
         # if ( cond ) stmt [ else stmt ]
@@ -133,19 +177,19 @@ class Parser:
         # emit conditional jump to else_label if cond false
         if isinstance(cond, tuple):
             left_temp, op, right_temp = cond
-            self.tac.emit(f"ifFalse {left_temp} {op} {right_temp} goto {else_label}")
+            self.tac.emit(IFFALSE, else_label, left_temp, right_temp, op)
         else:
             # cond is single temp -> check if zero
-            self.tac.emit(f"ifz {cond} goto {else_label}")
+            self.tac.emit(IFZ, else_label, cond)
         # then stmt
         self.parse_statement_or_block()
-        self.tac.emit(f"goto {end_label}")
-        self.tac.emit(f"label {else_label}")
+        self.tac.emit(GOTO, end_label)
+        self.tac.emit(LABEL, else_label)
         # else?
         if self.cur().type == 'KEYWORD' and self.cur().value == 'else':
             self.advance()
             self.parse_statement_or_block()
-        self.tac.emit(f"label {end_label}")
+        self.tac.emit(LABEL, end_label)
 
     def parse_while(self):
         # while ( cond ) stmt
@@ -155,151 +199,82 @@ class Parser:
         self.advance()
         start_label = self.tac.new_label()
         end_label = self.tac.new_label()
-        self.tac.emit(f"label {start_label}")
+        self.tac.emit(LABEL, start_label)
         cond = self.parse_condition()
         if not (self.cur().type == 'DELIM' and self.cur().value == ')'):
             raise ParserError("Expected ')' after condition")
         self.advance()
         if isinstance(cond, tuple):
             left_temp, op, right_temp = cond
-            self.tac.emit(f"ifFalse {left_temp} {op} {right_temp} goto {end_label}")
+            self.tac.emit(IFFALSE, end_label, left_temp, right_temp, op)
         else:
-            self.tac.emit(f"ifz {cond} goto {end_label}")
+            self.tac.emit(IFZ, end_label, cond)
         self.parse_statement_or_block()
-        self.tac.emit(f"goto {start_label}")
-        self.tac.emit(f"label {end_label}")
+        self.tac.emit(GOTO, start_label)
+        self.tac.emit(LABEL, end_label)
 
     def parse_statement_or_block(self):
         if self.cur().type == 'DELIM' and self.cur().value == '{':
             self.advance()
+            self.enter_scope()
             while not (self.cur().type == 'DELIM' and self.cur().value == '}'):
                 self.parse_statement()
+            self.exit_scope()
             self.advance()  # skip '}'
         else:
             self.parse_statement()
 
     def parse_condition(self):
-        
-        start = self.pos
-        depth = 0
-        toks = []
-        while True:
-            t = self.cur()
-            if t.type == 'DELIM' and t.value == '(':
-                depth += 1
-            if t.type == 'DELIM' and t.value == ')':
-                if depth == 0:
-                    break
-                depth -= 1
-            if t.type == 'EOF':
-                raise ParserError("Unexpected EOF in condition")
-            toks.append(t)
+        # left side stops at the first comparison; no comparison -> single temp
+        left = self.parse_expression(_CMP_PREC + 1)
+        t = self.cur()
+        if t.type == 'OP' and t.value in REL_OPS:
+            op = t.value
             self.advance()
-        
-        comp_ops = {'==','!=','<','>','<=','>='}
-        comp_index = -1
-        comp_val = None
-        for idx, tk in enumerate(toks):
-            if tk.type == 'OP' and tk.value in comp_ops:
-                comp_index = idx
-                comp_val = tk.value
-                break
-        if comp_index == -1:
-            postfix = self.shunting_yard(toks)
-            temp = self.generate_from_postfix(postfix)
-            return temp
-        left_toks = toks[:comp_index]
-        right_toks = toks[comp_index+1:]
-        left_postfix = self.shunting_yard(left_toks)
-        right_postfix = self.shunting_yard(right_toks)
-        left_temp = self.generate_from_postfix(left_postfix)
-        right_temp = self.generate_from_postfix(right_postfix)
-        return (left_temp, comp_val, right_temp)
+            right = self.parse_expression()
+            return (left, op, right)
+        return left
 
-    
-    def parse_expression_until_delim(self, delim_set):
-        # collect tokens until one of delim_set delimiters (e.g., ';', ',', ')')
-        toks = []
-        depth = 0
+    def parse_expression(self, min_prec=1):
+        # precedence climbing: emits TAC while reading, returns result operand
+        left = self.parse_unary()
         while True:
             t = self.cur()
-            if t.type == 'DELIM' and t.value in delim_set and depth == 0:
+            if t.type != 'OP':
                 break
-            if t.type == 'DELIM' and t.value == '(':
-                depth += 1
-            if t.type == 'DELIM' and t.value == ')':
-                if depth == 0:
-                    break
-                depth -= 1
-            if t.type == 'EOF':
+            op = t.value
+            info = _PRECEDENCE.get(op)
+            if info is None or info[0] < min_prec:
                 break
-            toks.append(t)
             self.advance()
-        postfix = self.shunting_yard(toks)
-        temp = self.generate_from_postfix(postfix)
-        return temp
+            right = self.parse_expression(info[0] + 1 if info[1] == 'left' else info[0])
+            temp = self.tac.new_temp()
+            self.tac.emit(op, temp, left, right)
+            left = temp
+        return left
 
-    def shunting_yard(self, token_list):
-        output = []
-        stack = []
-        prev_was_op = True
-        for tk in token_list:
-            if tk.type in ('NUMBER','ID','CHAR'):
-                output.append(tk.value if tk.type != 'CHAR' else f"'{tk.value[1:-1]}'")
-                prev_was_op = False
-            elif tk.type == 'OP':
-                op = tk.value
-                # detect unary minus
-                if op == '-' and prev_was_op:
-                    op = 'uminus'
-                while stack and stack[-1] != '(':
-                    top = stack[-1]
-                    
-                    p_top = _PRECEDENCE.get(top, (0,))[0]
-                    p_op = _PRECEDENCE.get(op, (0,))[0]
-                    if ( ( _PRECEDENCE.get(top,(0,))[1] == 'left' and p_top >= p_op ) or
-                         ( _PRECEDENCE.get(top,(0))[1] == 'right' and p_top > p_op ) ):
-                        output.append(stack.pop())
-                    else:
-                        break
-                stack.append(op)
-                prev_was_op = True
-            elif tk.type == 'DELIM' and tk.value == '(':
-                stack.append('(')
-                prev_was_op = True
-            elif tk.type == 'DELIM' and tk.value == ')':
-                while stack and stack[-1] != '(':
-                    output.append(stack.pop())
-                if not stack:
-                    raise ParserError("Mismatched parentheses")
-                stack.pop()
-                prev_was_op = False
-            else:
-                pass
-        while stack:
-            op = stack.pop()
-            if op == '(':
+    def parse_unary(self):
+        t = self.cur()
+        typ = t.type
+        if typ == 'ID':
+            self.advance()
+            return self.read(t.value)
+        if typ == 'NUMBER' or typ == 'CHAR':
+            self.advance()
+            return t.value
+        if typ == 'OP' and t.value == '-':
+            self.advance()
+            a = self.parse_expression(_PRECEDENCE['uminus'][0])
+            temp = self.tac.new_temp()
+            self.tac.emit(UMINUS, temp, a)
+            return temp
+        if typ == 'DELIM' and t.value == '(':
+            self.advance()
+            val = self.parse_expression()
+            if not (self.cur().type == 'DELIM' and self.cur().value == ')'):
                 raise ParserError("Mismatched parentheses")
-            output.append(op)
-        return output
-
-    def generate_from_postfix(self, postfix):
-
-        stack = []
-        for tok in postfix:
-            if tok == 'uminus':
-                a = stack.pop()
-                t = self.tac.new_temp()
-                self.tac.emit(f"{t} = uminus {a}")
-                stack.append(t)
-            elif tok in ('+','-','*','/','==','!=','<','>','<=','>='):
-                b = stack.pop()
-                a = stack.pop()
-                t = self.tac.new_temp()
-                self.tac.emit(f"{t} = {a} {tok} {b}")
-                stack.append(t)
-            else:
-                stack.append(str(tok))
-        if not stack:
-            raise ParserError("Empty expression")
-        return stack[-1]
+            self.advance()
+            return val
+        if typ == 'EOF' or (typ == 'DELIM' and t.value in (';', ',', ')')):
+            raise ParserError(f"Empty expression at line {t.line}")
+        raise ParserError(f"Unexpected token {t.value!r} in expression at line {t.line}")
@@ -0,0 +1,254 @@
+# Peephole optimizer over the pseudo-assembly from MachineGenerator...
+#
+# Lines are parsed once into (op, args) tuples; labels are ('LABEL', (name,)).
+# Each round makes one linear sweep that tries every rule in RULES at each
+# position, then runs the whole-program PASSES (jump threading, unreachable
+# code, unused labels). Rounds repeat until nothing changes.
+
+from tac_generator import literal_value
+
+JCC = {'JE', 'JNE', 'JLT', 'JGT', 'JLE', 'JGE'}
+_TAKEN = {
+    'JE': lambda c: c == 0, 'JNE': lambda c: c != 0,
+    'JLT': lambda c: c < 0, 'JGT': lambda c: c > 0,
+    'JLE': lambda c: c <= 0, 'JGE': lambda c: c >= 0,
+}
+_ALU = {'ADD', 'SUB', 'MUL', 'DIV'}
+
+# how far ahead register liveness is checked before assuming "live"
+HORIZON = 8
+
+
+def parse(asm):
+    out = []
+    for line in asm:
+        if line.endswith(':'):
+            out.append(('LABEL', (line[:-1],)))
+        else:
+            op, _, rest = line.partition(' ')
+            out.append((op, tuple(a.strip() for a in rest.split(',')) if rest else ()))
+    return out
+
+
+def format_asm(instrs):
+    return [f"{args[0]}:" if op == 'LABEL' else f"{op} {', '.join(args)}" if args else op
+            for op, args in instrs]
+
+
+def reads(ins, reg):
+    op, args = ins
+    if op in ('STORE', 'NEG', 'PRINT'):
+        return args[0] == reg
+    if op in _ALU or op == 'CMP':
+        return reg in args
+    if op == 'MOV':
+        return args[1] == reg
+    return False
+
+
+def writes(ins, reg):
+    op, args = ins
+    if op in ('LOAD', 'LOADI', 'MOV', 'NEG') or op in _ALU:
+        return args[0] == reg
+    return False
+
+
+def dead_after(instrs, j, reg):
+    """Is reg overwritten before being read, starting at instrs[j]? Labels
+    and jumps end the search (conservatively live); program end is dead."""
+    for k in range(j, min(j + HORIZON, len(instrs))):
+        ins = instrs[k]
+        if reads(ins, reg):
+            return False
+        if writes(ins, reg):
+            return True
+        if ins[0] == 'LABEL' or ins[0] == 'JMP' or ins[0] in JCC:
+            return False
+    return j + HORIZON >= len(instrs)
+
+
+# -- window rules: rule(instrs, i) -> replacement for instrs[i:i+width] or None --
+
+def _store_load(instrs, i):
+    # STORE Ra, x; LOAD Rb, x  ->  STORE Ra, x; [MOV Rb, Ra]
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if op1 == 'STORE' and op2 == 'LOAD' and a1[1] == a2[1]:
+        if a1[0] == a2[0]:
+            return [instrs[i]]
+        return [instrs[i], ('MOV', (a2[0], a1[0]))]
+
+def _load_load(instrs, i):
+    # LOAD Ra, x; LOAD Rb, x  ->  LOAD Ra, x; [MOV Rb, Ra]
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if op1 == op2 and op1 in ('LOAD', 'LOADI') and a1[1] == a2[1]:
+        if a1[0] == a2[0]:
+            return [instrs[i]]
+        return [instrs[i], ('MOV', (a2[0], a1[0]))]
+
+def _store_store(instrs, i):
+    # the first of two stores to the same address is never observed
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if op1 == 'STORE' and op2 == 'STORE' and a1[1] == a2[1]:
+        return [instrs[i+1]]
+
+def _self_move(instrs, i):
+    op, args = instrs[i]
+    if op == 'MOV' and args[0] == args[1]:
+        return []
+
+def _move_back(instrs, i):
+    # MOV Ra, Rb; MOV Rb, Ra  ->  MOV Ra, Rb
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if op1 == 'MOV' and op2 == 'MOV' and a1[0] == a2[1] and a1[1] == a2[0]:
+        return [instrs[i]]
+
+def _move_chain(instrs, i):
+    # LOAD/LOADI/MOV Rb, src; MOV Rc, Rb (Rb dead)  ->  LOAD/LOADI/MOV Rc, src
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if (op2 == 'MOV' and op1 in ('LOAD', 'LOADI', 'MOV') and a2[1] == a1[0]
+            and a1[1] != a1[0] and dead_after(instrs, i + 2, a1[0])):
+        return [(op1, (a2[0], a1[1]))]
+
+def _dead_write(instrs, i):
+    op, args = instrs[i]
+    if op in ('LOAD', 'LOADI', 'MOV') and dead_after(instrs, i + 1, args[0]):
+        return []
+
+def _jump_next(instrs, i):
+    # JMP/Jcc L; L:  ->  L:
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if (op1 == 'JMP' or op1 in JCC) and op2 == 'LABEL' and a1[0] == a2[0]:
+        return [instrs[i+1]]
+
+def _const_branch(instrs, i):
+    # LOADI Ra, c; CMP Ra, d; Jcc L  ->  LOADI Ra, c; [JMP L]
+    (op1, a1), (op2, a2), (op3, a3) = instrs[i], instrs[i+1], instrs[i+2]
+    if op1 == 'LOADI' and op2 == 'CMP' and op3 in JCC and a2[0] == a1[0]:
+        c = literal_value(a1[1])
+        d = literal_value(a2[1])
+        if c is None or d is None:
+            return None
+        taken = _TAKEN[op3]((c > d) - (c < d))
+        return [instrs[i], ('JMP', a3)] if taken else [instrs[i]]
+
+def _negate_literal(text):
+    v = literal_value(text)
+    if v is None:
+        return None
+    return str(-v) if isinstance(v, int) else repr(-v)
+
+def _const_neg(instrs, i):
+    # LOADI Ra, c; NEG Ra  ->  LOADI Ra, -c
+    (op1, a1), (op2, a2) = instrs[i], instrs[i+1]
+    if op1 == 'LOADI' and op2 == 'NEG' and a2[0] == a1[0]:
+        neg = _negate_literal(a1[1])
+        if neg is not None:
+            return [('LOADI', (a1[0], neg))]
+
+def _const_move_neg(instrs, i):
+    # LOADI Ra, c; MOV Rb, Ra; NEG Rb  ->  LOADI Ra, c; LOADI Rb, -c
+    (op1, a1), (op2, a2), (op3, a3) = instrs[i], instrs[i+1], instrs[i+2]
+    if op1 == 'LOADI' and op2 == 'MOV' and op3 == 'NEG' and a2[1] == a1[0] and a3[0] == a2[0]:
+        neg = _negate_literal(a1[1])
+        if neg is not None:
+            return [instrs[i], ('LOADI', (a2[0], neg))]
+
+
+RULES = [
+    ('self-move', 1, _self_move),
+    ('store-load', 2, _store_load),
+    ('load-load', 2, _load_load),
+    ('store-store', 2, _store_store),
+    ('move-back', 2, _move_back),
+    ('move-chain', 2, _move_chain),
+    ('jump-next', 2, _jump_next),
+    ('const-branch', 3, _const_branch),
+    ('const-neg', 2, _const_neg),
+    ('const-move-neg', 3, _const_move_neg),
+    ('dead-write', 1, _dead_write),
+]
+
+
+# -- whole-program passes: pass(instrs) -> new list --
+
+def thread_jumps(instrs):
+    """Retarget jumps whose label is followed (possibly after more labels)
+    by an unconditional JMP."""
+    forward = {}
+    for i, (op, args) in enumerate(instrs):
+        if op == 'LABEL':
+            j = i + 1
+            while j < len(instrs) and instrs[j][0] == 'LABEL':
+                j += 1
+            if j < len(instrs) and instrs[j][0] == 'JMP':
+                forward[args[0]] = instrs[j][1][0]
+    if not forward:
+        return instrs
+
+    def final(label):
+        seen = set()
+        while label in forward and label not in seen:
+            seen.add(label)
+            label = forward[label]
+        return label
+
+    out = []
+    for op, args in instrs:
+        if (op == 'JMP' or op in JCC) and args[0] in forward:
+            out.append((op, (final(args[0]),)))
+        else:
+            out.append((op, args))
+    return out
+
+
+def remove_unreachable(instrs):
+    out = []
+    dead = False
+    for ins in instrs:
+        if ins[0] == 'LABEL':
+            dead = False
+        if not dead:
+            out.append(ins)
+        if ins[0] == 'JMP':
+            dead = True
+    return out
+
+
+def remove_unused_labels(instrs):
+    targets = {args[0] for op, args in instrs if op == 'JMP' or op in JCC}
+    return [ins for ins in instrs if ins[0] != 'LABEL' or ins[1][0] in targets]
+
+
+PASSES = [thread_jumps, remove_unreachable, remove_unused_labels]
+
+
+def _sweep(instrs, rules):
+    out = []
+    i, n = 0, len(instrs)
+    while i < n:
+        for _, width, rule in rules:
+            if i + width <= n:
+                rep = rule(instrs, i)
+                if rep is not None:
+                    out.extend(rep)
+                    i += width
+                    break
+        else:
+            out.append(instrs[i])
+            i += 1
+    return out
+
+
+def peephole(asm, rules=None, passes=None, max_rounds=20):
+    """Optimize a list of asm lines; returns a new list of lines."""
+    rules = RULES if rules is None else rules
+    passes = PASSES if passes is None else passes
+    instrs = parse(asm)
+    for _ in range(max_rounds):
+        before = instrs
+        instrs = _sweep(instrs, rules)
+        for p in passes:
+            instrs = p(instrs)
+        if instrs == before:
+            break
+    return format_asm(instrs)
@@ -0,0 +1,186 @@
+# Per-stage compile statistics...
+#
+# compiler.compile_source() and compile_tac() run each stage inside
+# profiler.stage(name) and report the stage's counters there (tokens,
+# quads, temps, labels, instructions, spills, ...). Without a Profiler they
+# use NO_PROFILE, whose stage() returns one shared do-nothing object, so
+# profiling costs a few calls per compile when it is off.
+#
+# Profiler(memory=True) traces allocations with tracemalloc while a stage
+# runs and records the peak above what was allocated when it started;
+# tracing slows the stage down, so its seconds are inflated. calls=True
+# wraps the Parser's parse_* methods on the instance to count calls and
+# time; the time is inclusive, so recursive methods count nested calls
+# again.
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+from parser import Parser
+
+PARSER_METHODS = tuple(sorted(n for n in vars(Parser) if n.startswith('parse_')))
+
+# counter each stage's throughput is reported in
+_RATES = {'lex': 'tokens', 'parse': 'quads', 'frontend': 'tokens', 'optimize': 'quads_in',
+          'codegen': 'instructions', 'peephole': 'instructions_in',
+          'schedule': 'instructions'}
+
+
+class StageStats:
+    __slots__ = ('name', 'seconds', 'peak_bytes', 'counts', 'calls')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_bytes = None    # only with memory tracing
+        self.counts = {}          # counter -> int
+        self.calls = {}           # method -> [calls, seconds]
+
+    def count(self, **counters):
+        self.counts.update(counters)
+
+    def to_dict(self):
+        d = {'name': self.name, 'seconds': self.seconds, 'peak_bytes': self.peak_bytes,
+             'counts': dict(self.counts)}
+        if self.calls:
+            d['calls'] = {m: {'calls': c, 'seconds': s} for m, (c, s) in self.calls.items()}
+        return d
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, **counters):
+        pass
+
+
+class _NullProfiler:
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def instrument(self, stage, obj, names):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+NO_PROFILE = _NullProfiler()
+
+
+class Profiler:
+    """Collects a StageStats per stage run, in order."""
+    enabled = True
+
+    def __init__(self, memory=False, calls=False):
+        self.memory = memory
+        self.calls = calls
+        self.stages = []
+        self._tracing = False     # whether we started tracemalloc
+
+    def __getitem__(self, name):
+        for st in self.stages:
+            if st.name == name:
+                return st
+        raise KeyError(name)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        st = StageStats(name)
+        self.stages.append(st)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.seconds = time.perf_counter() - start
+            if self.memory:
+                st.peak_bytes = max(tracemalloc.get_traced_memory()[1] - base, 0)
+
+    def instrument(self, stage, obj, names):
+        """With calls=True, count calls and time of obj's methods in stage."""
+        if not self.calls:
+            return
+        for name in names:
+            setattr(obj, name, _timed(getattr(obj, name), stage.calls.setdefault(name, [0, 0.0])))
+
+    def close(self):
+        """Stop tracemalloc if this profiler started it."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def to_dict(self):
+        return {'stages': [st.to_dict() for st in self.stages],
+                'seconds': sum(st.seconds for st in self.stages)}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def report(self):
+        return format_table(self.to_dict())
+
+
+def _timed(method, record):
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        record[0] += 1
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            record[1] += perf_counter() - start
+    return wrapper
+
+
+def combine(dicts):
+    """Sum Profiler.to_dict() results (e.g. one per file of a batch) stage by
+    stage; peaks take the maximum."""
+    stages = {}
+    for d in dicts:
+        for st in d['stages']:
+            acc = stages.get(st['name'])
+            if acc is None:
+                acc = stages[st['name']] = {'name': st['name'], 'seconds': 0.0,
+                                            'peak_bytes': None, 'counts': {}}
+            acc['seconds'] += st['seconds']
+            if st['peak_bytes'] is not None:
+                acc['peak_bytes'] = max(acc['peak_bytes'] or 0, st['peak_bytes'])
+            for k, v in st['counts'].items():
+                acc['counts'][k] = acc['counts'].get(k, 0) + v
+            for m, c in st.get('calls', {}).items():
+                calls = acc.setdefault('calls', {}).setdefault(m, {'calls': 0, 'seconds': 0.0})
+                calls['calls'] += c['calls']
+                calls['seconds'] += c['seconds']
+    stages = list(stages.values())
+    return {'stages': stages, 'seconds': sum(st['seconds'] for st in stages)}
+
+
+def format_table(stats):
+    """Text table of a to_dict()/combine() result, one line per stage."""
+    lines = [f"{'stage':<10}{'ms':>10}{'peak KiB':>10}  counts"]
+    for st in stats['stages']:
+        peak = '-' if st['peak_bytes'] is None else f"{st['peak_bytes'] / 1024:.1f}"
+        counts = ' '.join(f"{k}={v}" for k, v in st['counts'].items())
+        rate = _RATES.get(st['name'])
+        if rate in st['counts'] and st['seconds'] > 0:
+            counts += f" ({st['counts'][rate] / st['seconds']:,.0f} {rate}/s)"
+        lines.append(f"{st['name']:<10}{st['seconds'] * 1e3:>10.3f}{peak:>10}  {counts}")
+        calls = sorted(st.get('calls', {}).items(), key=lambda kv: -kv[1]['seconds'])
+        for m, c in calls:
+            if c['calls']:
+                lines.append(f"  {m:<26}{c['calls']:>9} calls {c['seconds'] * 1e3:>10.3f} ms")
+    lines.append(f"{'total':<10}{stats['seconds'] * 1e3:>10.3f}")
+    return lines
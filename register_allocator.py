@@ -0,0 +1,217 @@
+# Register allocation support for MachineGenerator...
+#
+# analyze() takes the basic blocks and temp liveness from cfg.py and
+# records for every block the ordered use/def events of each operand.
+# MachineGenerator keeps the actual register
+# contents; the allocators below only decide where values go and what to
+# evict, ranking candidates by next-use distance.
+
+import bisect
+
+from tac_generator import BINARY_OPS, UMINUS, DEF_OPS, is_temp
+from cfg import build_cfg, liveness
+
+INF = float('inf')
+
+
+class BlockInfo:
+    """One basic block: code[start:end], temps live on exit and, per operand,
+    the sorted positions where it is read (True) or overwritten (False)."""
+    __slots__ = ('start', 'end', 'live_out', 'events')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.live_out = set()
+        self.events = {}    # name -> (positions, is_use flags)
+
+    def next_use(self, name, pos):
+        """Position of the next read of name after pos; INF if it is not read
+        again in this block before being overwritten."""
+        ev = self.events.get(name)
+        if ev is not None:
+            positions, uses = ev
+            k = bisect.bisect_right(positions, pos)
+            if k < len(positions) and uses[k]:
+                return positions[k]
+        return INF
+
+    def live_after(self, name, pos):
+        """Is the value name holds after instruction pos still needed?"""
+        ev = self.events.get(name)
+        if ev is not None:
+            positions, uses = ev
+            k = bisect.bisect_right(positions, pos)
+            if k < len(positions):
+                return uses[k]
+        return name in self.live_out
+
+
+def analyze(code):
+    """Return BlockInfo list for code, with temp liveness solved across jumps."""
+    graph = build_cfg(code)
+    blocks = []
+    for blk in graph.blocks:
+        info = BlockInfo(blk.start, blk.end)
+        events = info.events
+        for i in range(blk.start, blk.end):
+            q = code[i]
+            for arg in (q.arg1, q.arg2):
+                if arg is None:
+                    continue
+                ev = events.get(arg)
+                if ev is None:
+                    ev = events[arg] = ([], [])
+                if not ev[0] or ev[0][-1] != i:
+                    ev[0].append(i)
+                    ev[1].append(True)
+            if q.op in DEF_OPS:
+                d = q.dest
+                ev = events.get(d)
+                if ev is None:
+                    ev = events[d] = ([], [])
+                if not ev[0] or ev[0][-1] != i:
+                    ev[0].append(i)
+                    ev[1].append(False)
+        blocks.append(info)
+
+    live = liveness(graph, track=is_temp)
+    members = live.universe.members
+    for info, out in zip(blocks, live.outs):
+        info.live_out = set(members(out))
+    return blocks
+
+
+class LinearScanAllocator:
+    """Any register may hold any value; when none is free the one whose
+    contents are needed furthest in the future is spilled (preferring values
+    that need no store)."""
+    name = 'linear'
+
+    def __init__(self, num_registers):
+        self.scratch = range(num_registers)
+
+    def begin_block(self, code, block):
+        pass
+
+    def home(self, pos):
+        return None
+
+    def in_register(self, pos):
+        return True
+
+
+class GraphColoringAllocator:
+    """Chaitin/Briggs coloring of the temps defined in each block.
+
+    The first num_registers - reserved registers are homes for colored temps;
+    the reserved ones are scratch registers for variables, literals and temps
+    that did not get a color (those are stored at their definition and
+    reloaded at each use).
+    """
+    name = 'coloring'
+
+    def __init__(self, num_registers, reserved=2):
+        self.k = max(num_registers - reserved, 0)
+        self.scratch = range(self.k, num_registers)
+        self.colors = {}
+
+    def begin_block(self, code, block):
+        self.colors = self._color(code, block)
+
+    def home(self, pos):
+        """Register index for the temp defined at pos, or None if spilled."""
+        return self.colors.get(pos)
+
+    def in_register(self, pos):
+        # uncolored temps are kept in memory
+        return pos in self.colors
+
+    def _color(self, code, block):
+        k = self.k
+        if k == 0:
+            return {}
+        # live ranges: one node per temp definition, [def, last read]
+        start, end = {}, {}
+        current = {}            # temp -> node of its live value
+        edges = []
+        hint = {}
+        uses = {}
+        for i in range(block.start, block.end):
+            q = code[i]
+            for arg in (q.arg1, q.arg2):
+                n = current.get(arg)
+                if n is not None:
+                    end[n] = i
+                    uses[n] += 1
+            op = q.op
+            if op in DEF_OPS and is_temp(q.dest):
+                start[i] = end[i] = i
+                uses[i] = 0
+                if op in BINARY_OPS or op == UMINUS:
+                    # the result is written before arg2 is read
+                    if q.arg2 is not None and q.arg2 != q.arg1 and q.arg2 in current:
+                        edges.append((i, current[q.arg2]))
+                    if q.arg1 in current and not block.live_after(q.arg1, i):
+                        hint[i] = current[q.arg1]
+                elif q.arg1 in current:
+                    hint[i] = current[q.arg1]
+                current[q.dest] = i
+        for name, n in current.items():
+            if name in block.live_out:
+                end[n] = block.end
+
+        adj = {n: set() for n in start}
+        active = []
+        for n in sorted(start):
+            s = start[n]
+            active = [m for m in active if end[m] > s]
+            for m in active:
+                adj[n].add(m)
+                adj[m].add(n)
+            active.append(n)
+        for a, b in edges:
+            adj[a].add(b)
+            adj[b].add(a)
+
+        # simplify, optimistically pushing the cheapest spill candidate
+        degree = {n: len(adj[n]) for n in adj}
+        low = [n for n in adj if degree[n] < k]
+        remaining = set(adj)
+        stack = []
+        while remaining:
+            n = None
+            while low:
+                m = low.pop()
+                if m in remaining:
+                    n = m
+                    break
+            if n is None:
+                n = min(remaining, key=lambda m: (uses[m] + 1) / (degree[m] + 1))
+            remaining.discard(n)
+            stack.append(n)
+            for m in adj[n]:
+                if m in remaining:
+                    degree[m] -= 1
+                    if degree[m] == k - 1:
+                        low.append(m)
+
+        colors = {}
+        while stack:
+            n = stack.pop()
+            taken = {colors[m] for m in adj[n] if m in colors}
+            h = colors.get(hint.get(n))
+            if h is not None and h not in taken:
+                colors[n] = h
+                continue
+            for c in range(k):
+                if c not in taken:
+                    colors[n] = c
+                    break
+        return colors
+
+
+ALLOCATORS = {
+    'linear': LinearScanAllocator,
+    'coloring': GraphColoringAllocator,
+}
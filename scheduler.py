@@ -0,0 +1,185 @@
+# List scheduler for the pseudo-assembly, for a pipelined in-order core...
+#
+# MachineGenerator emits instructions in TAC order, so a LOAD or MUL is
+# mostly followed at once by the instruction that needs its result, and the
+# core sits out the latency (vm.stalls() prices it). schedule() reorders
+# each basic block (split at labels and after jumps; a jump stays last): it
+# builds the block's dependence DAG and issues, cycle by cycle, the ready
+# instruction with the longest latency-weighted path to the end of the
+# block, so independent work fills the wait. A block keeps its order when
+# the schedule would not be shorter.
+#
+# Registers are already allocated, so an instruction depends on the last
+# writer of every register it reads or writes (after the producer's
+# latency) and on the readers since then of every register it writes.
+# CMP writes the flags and conditional jumps read them. Memory is by
+# variable name, which never alias: LOAD and PRINT x read it, STORE writes
+# it. PRINTs and DIVs (which can fail) keep their relative order, so the
+# output, and how much of it comes before a division by zero, is the same.
+
+import heapq
+
+from tac_generator import literal_value
+from peephole import parse, format_asm, JCC
+from vm import DEFAULT_LATENCIES
+
+FLAGS = 'FLAGS'
+_ALU = {'ADD', 'SUB', 'MUL', 'DIV'}
+
+
+def _is_reg(text):
+    return text[0] == 'R' and text[1:].isdigit()
+
+
+def operands(ins):
+    """(registers read, registers written, variables read, variables
+    written) of a parsed instruction; the flags count as register FLAGS."""
+    op, args = ins
+    if op == 'LOAD':
+        return (), (args[0],), (args[1],), ()
+    if op == 'LOADI':
+        return (), (args[0],), (), ()
+    if op == 'STORE':
+        return (args[0],), (), (), (args[1],)
+    if op == 'MOV':
+        return (args[1],), (args[0],), (), ()
+    if op in _ALU:
+        return args, (args[0],), (), ()
+    if op == 'NEG':
+        return args, args, (), ()
+    if op == 'CMP':
+        return tuple(a for a in args if _is_reg(a)), (FLAGS,), (), ()
+    if op in JCC:
+        return (FLAGS,), (), (), ()
+    if op == 'PRINT':
+        a = args[0]
+        if _is_reg(a):
+            return (a,), (), (), ()
+        if a[0] == "'" or literal_value(a) is not None:
+            return (), (), (), ()
+        return (), (), (a,), ()
+    return (), (), (), ()
+
+
+def _blocks(instrs):
+    # (labels, body) runs: labels open a block, a jump closes one
+    out = []
+    labels, body = [], []
+    for ins in instrs:
+        if ins[0] == 'LABEL':
+            if body:
+                out.append((labels, body))
+                labels, body = [], []
+            labels.append(ins)
+        else:
+            body.append(ins)
+            if ins[0] == 'JMP' or ins[0] in JCC:
+                out.append((labels, body))
+                labels, body = [], []
+    if labels or body:
+        out.append((labels, body))
+    return out
+
+
+def _dag(block, lat):
+    # successor lists of (node, min distance in cycles), predecessor counts,
+    # and the cycles block takes in its own order under vm.stalls()'s model
+    n = len(block)
+    succs = [[] for _ in range(n)]
+    npreds = [0] * n
+    last = {}           # register or ('mem', name) -> last writer
+    readers = {}        # same keys -> readers since that write
+    ordered = None      # last PRINT or DIV
+    ready = {}          # register -> cycle its result is available, in order
+    t = 0
+    for i, ins in enumerate(block):
+        rregs, wregs, rmem, wmem = operands(ins)
+        for r in rregs + wregs:
+            c = ready.get(r, 0)
+            if c > t:
+                t = c
+        for r in wregs:
+            ready[r] = t + lat[i]
+        t += 1
+        for k in rregs + tuple(('mem', x) for x in rmem):
+            p = last.get(k)
+            if p is not None:
+                succs[p].append((i, lat[p]))
+                npreds[i] += 1
+            readers.setdefault(k, []).append(i)
+        for k in wregs + tuple(('mem', x) for x in wmem):
+            p = last.get(k)
+            if p is not None:
+                succs[p].append((i, lat[p]))
+                npreds[i] += 1
+            for r in readers.pop(k, ()):
+                if r != i:
+                    succs[r].append((i, 1))
+                    npreds[i] += 1
+            last[k] = i
+        if ins[0] == 'PRINT' or ins[0] == 'DIV':
+            if ordered is not None:
+                succs[ordered].append((i, 1))
+                npreds[i] += 1
+            ordered = i
+    return succs, npreds, t
+
+
+def schedule_block(block, latencies=None):
+    """block (parsed instructions, no labels, a jump only at the end)
+    reordered for the fewest stalls."""
+    table = DEFAULT_LATENCIES if latencies is None else latencies
+    tail = []
+    if block and (block[-1][0] == 'JMP' or block[-1][0] in JCC):
+        block, tail = block[:-1], block[-1:]
+    n = len(block)
+    if n < 2:
+        return block + tail
+    lat = [table.get(op, 1) for op, _ in block]
+    succs, npreds, naive = _dag(block, lat)
+
+    # priority: latency-weighted length of the longest path to the block end
+    prio = [0] * n
+    for i in range(n - 1, -1, -1):
+        p = lat[i]
+        for s, w in succs[i]:
+            if w + prio[s] > p:
+                p = w + prio[s]
+        prio[i] = p
+
+    earliest = [0] * n
+    waiting = [(0, -prio[i], i) for i in range(n) if not npreds[i]]
+    heapq.heapify(waiting)
+    ready = []          # (-priority, index) of nodes that can issue now
+    order = []
+    cycle = 0
+    while waiting or ready:
+        while waiting and waiting[0][0] <= cycle:
+            _, key, i = heapq.heappop(waiting)
+            heapq.heappush(ready, (key, i))
+        if not ready:
+            cycle = waiting[0][0]
+            continue
+        _, i = heapq.heappop(ready)
+        order.append(i)
+        for s, w in succs[i]:
+            if cycle + w > earliest[s]:
+                earliest[s] = cycle + w
+            npreds[s] -= 1
+            if not npreds[s]:
+                heapq.heappush(waiting, (earliest[s], -prio[s], s))
+        cycle += 1
+
+    if cycle >= naive:
+        return block + tail
+    return [block[i] for i in order] + tail
+
+
+def schedule(asm, latencies=None):
+    """asm lines with every basic block list-scheduled under latencies
+    (vm.DEFAULT_LATENCIES unless given)."""
+    out = []
+    for labels, body in _blocks(parse(asm)):
+        out += labels
+        out += schedule_block(body, latencies)
+    return format_asm(out)
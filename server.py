@@ -0,0 +1,319 @@
+# Long-running compile server, so a compile does not pay for interpreter
+# startup and imports...
+#
+# Requests and responses are JSON lines on a Unix socket (or TCP on
+# localhost). client.py speaks the protocol:
+#
+#   {"id": 1, "source": "...", "options": {"opt_level": 2, "registers": 4,
+#    "allocator": "linear"}, "emit": ["tac", "asm"]}
+#     -> {"id": 1, "ok": true, "seconds": ..., "artifacts": {"tac":
+#         {"file": "tac.txt", "text": "..."}, "asm_ir": {"file": "asm.ir",
+#         "base64": "..."}}}
+#     -> {"id": 1, "ok": false, "error": "ParserError: ..."}
+#   {"id": 2, "op": "metrics"} -> {"id": 2, "ok": true, "metrics": {...}}
+#
+# Compiles run in a pool of worker processes that imported the compiler at
+# startup and render the response themselves, so the event loop only moves
+# bytes. A connection may pipeline requests and gets each answer when its
+# compile finishes. Backpressure: the server takes a slot before reading a
+# request (per connection, at most --per-connection) and another before
+# compiling it (at most --max-pending in all), and gives both back once the
+# answer is written. When they run out it stops reading, so the socket
+# buffers fill and clients block in their writes instead of the server
+# queueing without bound. Metrics requests and malformed ones never wait
+# for a compile slot, so metrics still answer when every slot is busy.
+
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from client import DEFAULT_SOCKET, connect
+from compiler import CompileOptions, compile, ARTIFACTS, DEFAULT_ARTIFACTS, render
+from cache import CompileCache
+from parser import ParserError
+
+MAX_REQUEST = 64 << 20      # longest request line, in bytes
+
+
+# -- worker side --
+
+_cache = None
+
+
+def _init_worker(cache_dir):
+    global _cache
+    if cache_dir is not None:
+        _cache = CompileCache(cache_dir)
+
+
+def _compile_job(rid, source, options, emit):
+    # runs in a worker: (ok, encoded response line)
+    start = time.perf_counter()
+    try:
+        result = compile(source, CompileOptions(*options), _cache)
+        artifacts = {}
+        for name in emit:
+            data = render(result, name)
+            art = artifacts[name] = {"file": ARTIFACTS[name][0]}
+            if isinstance(data, bytes):
+                art["base64"] = base64.b64encode(data).decode("ascii")
+            else:
+                art["text"] = data
+    except (RuntimeError, ParserError) as e:
+        return False, _response(rid, False, error=f"{type(e).__name__}: {e}")
+    return True, _response(rid, True, seconds=time.perf_counter() - start, artifacts=artifacts)
+
+
+def _response(rid, ok, **fields):
+    return json.dumps({"id": rid, "ok": ok, **fields}).encode() + b"\n"
+
+
+class BadRequest(ValueError):
+    def __init__(self, rid, message):
+        super().__init__(message)
+        self.rid = rid
+
+
+def parse_request(line):
+    """(id, job) of a request line: job is the _compile_job arguments, or
+    None for a metrics request. Raises BadRequest."""
+    try:
+        req = json.loads(line)
+    except ValueError:
+        raise BadRequest(None, "request is not JSON") from None
+    if not isinstance(req, dict):
+        raise BadRequest(None, "request is not an object")
+    rid = req.get("id")
+    op = req.get("op", "compile")
+    if op == "metrics":
+        return rid, None
+    if op != "compile":
+        raise BadRequest(rid, f"unknown op {op!r}")
+    source = req.get("source")
+    if not isinstance(source, str):
+        raise BadRequest(rid, "source must be a string")
+    opts = req.get("options", {})
+    emit = req.get("emit", DEFAULT_ARTIFACTS)
+    try:
+        options = CompileOptions(opts.get("opt_level", 0), opts.get("registers", 4),
+                                 opts.get("allocator", "linear"))
+        emit = tuple(emit)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise BadRequest(rid, f"bad options: {e}") from None
+    for name in emit:
+        if name not in ARTIFACTS:
+            raise BadRequest(rid, f"unknown artifact {name!r}")
+    return rid, (rid, source, options.key(), emit)
+
+
+# -- server side --
+
+class Metrics:
+    """Counters plus the latencies of the last `window` compiles."""
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0           # bad requests and failed compiles
+        self.connections = 0
+        self.in_flight = 0        # compiles submitted to the pool, not yet answered
+        self.max_in_flight = 0
+        self.waiting = 0          # requests read, waiting for a slot
+        self.latencies = collections.deque(maxlen=window)
+
+    def to_dict(self, workers):
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return lat[min(len(lat) - 1, int(p / 100 * len(lat)))] * 1e3 if lat else None
+        return {
+            'uptime_s': round(time.time() - self.started, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'connections': self.connections,
+            'workers': workers,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            # requests read but not yet being compiled
+            'queue_depth': self.waiting + max(0, self.in_flight - workers),
+            'max_in_flight': self.max_in_flight,
+            'latency_ms': {
+                'count': len(lat),
+                'mean': sum(lat) / len(lat) * 1e3 if lat else None,
+                'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+                'max': lat[-1] * 1e3 if lat else None,
+            },
+        }
+
+
+class CompileServer:
+    def __init__(self, workers=None, max_pending=None, per_connection=8, cache_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.per_connection = per_connection
+        self.cache_dir = cache_dir
+        self.metrics = Metrics()
+        self._pool = None
+        self._slots = None
+        self._server = None
+
+    async def start(self, path=DEFAULT_SOCKET, port=None):
+        if port is None and os.path.exists(path):
+            try:
+                connect(path).close()
+            except OSError:
+                os.unlink(path)       # left over from a server that did not shut down
+            else:
+                raise OSError(f"a server is already listening on {path}")
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                         initargs=(self.cache_dir,))
+        # start every worker now rather than on the first requests
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, time.sleep, 0)
+                               for _ in range(self.workers)))
+        if port is not None:
+            self._server = await asyncio.start_server(self._serve, "127.0.0.1", port,
+                                                      limit=MAX_REQUEST)
+        else:
+            self._server = await asyncio.start_unix_server(self._serve, path, limit=MAX_REQUEST)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def _serve(self, reader, writer):
+        self.metrics.connections += 1
+        mine = asyncio.Semaphore(self.per_connection)
+        tasks = set()
+        try:
+            while True:
+                await mine.acquire()
+                try:
+                    line = await reader.readline()
+                except ConnectionError:
+                    line = b""          # the peer went away
+                except ValueError:
+                    # over MAX_REQUEST: the rest of the line cannot be
+                    # skipped reliably, so answer and close
+                    task = asyncio.ensure_future(
+                        self._answer(BadRequest(None, "request too long"), writer, mine))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    break
+                if not line.strip():
+                    mine.release()
+                    if not line:
+                        break
+                    continue
+                try:
+                    request = parse_request(line)
+                except BadRequest as e:
+                    request = e
+                if isinstance(request, tuple) and request[1] is not None:
+                    self.metrics.waiting += 1
+                    await self._slots.acquire()
+                    self.metrics.waiting -= 1
+                task = asyncio.ensure_future(self._answer(request, writer, mine))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.metrics.connections -= 1
+            writer.close()
+
+    async def _answer(self, request, writer, mine):
+        # compile or report, write the answer, then give the slots back (a
+        # compile job holds one of _slots, set aside by _serve)
+        start = time.perf_counter()
+        m = self.metrics
+        m.requests += 1
+        job = None
+        try:
+            if isinstance(request, BadRequest):
+                m.errors += 1
+                out = _response(request.rid, False, error=str(request))
+            else:
+                rid, job = request
+                if job is None:
+                    out = _response(rid, True, metrics=m.to_dict(self.workers))
+                else:
+                    m.in_flight += 1
+                    m.max_in_flight = max(m.max_in_flight, m.in_flight)
+                    try:
+                        ok, out = await asyncio.get_running_loop().run_in_executor(
+                            self._pool, _compile_job, *job)
+                    except Exception as e:
+                        # a compiler bug or a dead worker: still answer
+                        ok, out = False, _response(rid, False,
+                                                   error=f"internal error: {type(e).__name__}: {e}")
+                    finally:
+                        m.in_flight -= 1
+                    if not ok:
+                        m.errors += 1
+                    m.latencies.append(time.perf_counter() - start)
+            writer.write(out)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if job is not None:
+                self._slots.release()
+            mine.release()
+
+
+async def serve(path=DEFAULT_SOCKET, port=None, **options):
+    """Run a CompileServer until SIGINT or SIGTERM."""
+    server = CompileServer(**options)
+    await server.start(path, port)
+    where = f"127.0.0.1:{port}" if port is not None else path
+    print(f"compile server on {where}: {server.workers} workers, "
+          f"{server.max_pending} pending at most", flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.close()
+        if port is None and os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve compiles over a socket (see client.py).")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on")
+    ap.add_argument("--port", type=int, default=None,
+                    help="listen on localhost:PORT instead of a Unix socket")
+    ap.add_argument("-j", "--jobs", type=int, default=None,
+                    help="worker processes (default: CPU count)")
+    ap.add_argument("--max-pending", type=int, default=None,
+                    help="compiles read but not yet answered, over all connections "
+                         "(default: 4 per worker)")
+    ap.add_argument("--per-connection", type=int, default=8,
+                    help="requests read but not yet answered, per connection")
+    ap.add_argument("--cache", metavar="DIR", default=None,
+                    help="reuse compile results stored in DIR for unchanged sources")
+    args = ap.parse_args()
+    try:
+        asyncio.run(serve(args.socket, args.port, workers=args.jobs,
+                          max_pending=args.max_pending, per_connection=args.per_connection,
+                          cache_dir=args.cache))
+    except OSError as e:
+        raise SystemExit(f"server: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Symbol table with dense integer IDs and nested block scopes...
+#
+# Every declaration gets the next symbol ID, which indexes parallel lists
+# of its name, type, scope depth and storage: the operand TAC uses for the
+# variable. The first declaration of a name stores under the name itself
+# and the n-th after it under `name.n` (no identifier contains a '.'), so
+# every declaration, shadowing or in a sibling scope, has its own memory
+# and its own entry in symbols.txt. Storage names are interned, so all TAC
+# operands for one variable are the same string object; TAC and the back
+# end carry these strings rather than the symbol IDs.
+#
+# `_bound` maps each identifier to the ID of its visible declaration.
+# push() only records where the current scope's undo log starts; pop()
+# undoes the bindings made since, so a scope costs O(1) plus one undo per
+# declaration in it. Declarations at depth 0 are never undone and are not
+# logged.
+
+import sys
+
+
+class SymbolTable:
+    __slots__ = ('names', 'types', 'depths', 'storage', '_bound', '_undo', '_scopes',
+                 '_count')
+
+    def __init__(self):
+        self.names = []       # symbol ID -> identifier
+        self.types = []       # symbol ID -> type name
+        self.depths = []      # symbol ID -> scope depth of the declaration
+        self.storage = []     # symbol ID -> TAC operand for the variable
+        self._bound = {}      # identifier -> visible symbol ID
+        self._undo = []       # (identifier, shadowed ID or None), innermost last
+        self._scopes = []     # len(_undo) when each open scope began
+        self._count = {}      # identifier -> declarations of it so far
+
+    @property
+    def depth(self):
+        return len(self._scopes)
+
+    def push(self):
+        self._scopes.append(len(self._undo))
+
+    def pop(self):
+        mark = self._scopes.pop()
+        undo = self._undo
+        bound = self._bound
+        while len(undo) > mark:
+            name, prev = undo.pop()
+            if prev is None:
+                del bound[name]
+            else:
+                bound[name] = prev
+
+    def lookup(self, name):
+        """ID of the visible declaration of name, or None."""
+        return self._bound.get(name)
+
+    def declared_here(self, name):
+        """Is name declared in the innermost open scope?"""
+        sid = self._bound.get(name)
+        return sid is not None and self.depths[sid] == len(self._scopes)
+
+    def declare(self, name, typ):
+        """Declare name in the innermost scope; returns the new symbol ID.
+        Redeclaration in the same scope is the caller's to reject."""
+        sid = len(self.names)
+        prev = self._bound.get(name)
+        depth = len(self._scopes)
+        self.names.append(name)
+        self.types.append(typ)
+        self.depths.append(depth)
+        n = self._count.get(name, 0)
+        self._count[name] = n + 1
+        self.storage.append(sys.intern(f"{name}.{n}" if n else name))
+        if depth:
+            self._undo.append((name, prev))
+        self._bound[name] = sid
+        return sid
+
+    def operand(self, name):
+        """TAC operand for name where it is used: the storage of its visible
+        declaration, or name itself if there is none."""
+        sid = self._bound.get(name)
+        return name if sid is None else self.storage[sid]
+
+    def extend(self, names, types, depths, storage):
+        """Append declarations made by a parser that started from this
+        table's state at depth 0; the depth-0 ones become visible."""
+        sid = len(self.names)
+        self.names += names
+        self.types += types
+        self.depths += depths
+        self.storage += storage
+        bound = self._bound
+        count = self._count
+        for name, depth in zip(names, depths):
+            if not depth:
+                bound[name] = sid
+            count[name] = count.get(name, 0) + 1
+            sid += 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._bound
+
+    def copy(self):
+        t = SymbolTable()
+        t.names = self.names[:]
+        t.types = self.types[:]
+        t.depths = self.depths[:]
+        t.storage = self.storage[:]
+        t._bound = dict(self._bound)
+        t._undo = self._undo[:]
+        t._scopes = self._scopes[:]
+        t._count = dict(self._count)
+        return t
+
+    def as_dict(self):
+        """storage -> type of every declaration made, in order."""
+        return dict(zip(self.storage, self.types))
@@ -1,26 +1,177 @@
+# Store TAC as quadruples, temp and label generators...
+
+import heapq
+
+# Opcodes. Binary ops use the operator itself ('+', '<', ...) as opcode.
+LABEL = 'label'
+GOTO = 'goto'
+IFFALSE = 'ifFalse'
+IFZ = 'ifz'
+PRINT = 'PRINT'
+COPY = '='
+UMINUS = 'uminus'
+
+ARITH_OPS = ('+', '-', '*', '/')
+REL_OPS = ('==', '!=', '<', '>', '<=', '>=')
+BINARY_OPS = ARITH_OPS + REL_OPS
+COMMUTATIVE_OPS = ('+', '*', '==', '!=')
+JUMP_OPS = (GOTO, IFFALSE, IFZ)
+# opcodes whose dest is a value (the rest use it for a label, or not at all)
+DEF_OPS = frozenset((COPY, UMINUS) + BINARY_OPS)
+
+
+# Operand helpers. Operands are strings: temps (T<n>), variables, numeric
+# literals and quoted char literals.
+
+def is_temp(op):
+    return op[0] == 'T' and op[1:].isdigit()
+
+def is_literal(op):
+    # identifiers never start with a digit, '-' or a quote
+    c = op[0]
+    return c == "'" or c == '-' or c.isdigit()
+
+def literal_value(op):
+    """Numeric value of a literal operand, or None (chars are not folded)."""
+    if not is_literal(op) or op[0] == "'":
+        return None
+    try:
+        return int(op)
+    except ValueError:
+        return float(op)
+
+def apply_op(op, a, b=None):
+    """Evaluate one TAC operator on numbers; int '/' truncates like C.
+
+    Raises ZeroDivisionError on division by zero.
+    """
+    if op == '+': return a + b
+    if op == '-': return a - b
+    if op == '*': return a * b
+    if op == '/':
+        if isinstance(a, int) and isinstance(b, int):
+            q = abs(a) // abs(b)
+            return -q if (a < 0) != (b < 0) else q
+        return a / b
+    if op == UMINUS: return -a
+    if op == '==': return int(a == b)
+    if op == '!=': return int(a != b)
+    if op == '<': return int(a < b)
+    if op == '>': return int(a > b)
+    if op == '<=': return int(a <= b)
+    if op == '>=': return int(a >= b)
+    raise ValueError(f"unknown operator {op!r}")
+
+def split_blocks(code):
+    """Yield (start, end) index ranges of basic blocks: a label starts a
+    block, a jump ends one."""
+    start = 0
+    for i, q in enumerate(code):
+        if q.op == LABEL and i > start:
+            yield start, i
+            start = i
+        elif q.op in JUMP_OPS:
+            yield start, i + 1
+            start = i + 1
+    if start < len(code):
+        yield start, len(code)
+
+
+class Quad:
+    """One TAC instruction: opcode, destination and up to two arguments.
+
+    ifFalse also carries the relational operator in `relop`; jumps keep
+    their target label in `dest`.
+    """
+    __slots__ = ('op', 'dest', 'arg1', 'arg2', 'relop')
+
+    def __init__(self, op, dest=None, arg1=None, arg2=None, relop=None):
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.relop = relop
+
+    def __str__(self):
+        op = self.op
+        if op == COPY:
+            return f"{self.dest} = {self.arg1}"
+        if op == UMINUS:
+            return f"{self.dest} = uminus {self.arg1}"
+        if op == LABEL or op == GOTO:
+            return f"{op} {self.dest}"
+        if op == PRINT:
+            return f"PRINT {self.arg1}"
+        if op == IFFALSE:
+            return f"ifFalse {self.arg1} {self.relop} {self.arg2} goto {self.dest}"
+        if op == IFZ:
+            return f"ifz {self.arg1} goto {self.dest}"
+        return f"{self.dest} = {self.arg1} {op} {self.arg2}"
+
+    def __repr__(self):
+        return f"Quad({self.op!r}, {self.dest!r}, {self.arg1!r}, {self.arg2!r}, {self.relop!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, Quad) and self.op == other.op and self.dest == other.dest
+                and self.arg1 == other.arg1 and self.arg2 == other.arg2 and self.relop == other.relop)
+
+    __hash__ = None
 
-# Store TAC lines, temp and label generators...
 
 class TACGenerator:
+    """Collects quads, handing out temps and labels.
+
+    Every temp the parser asks for is read exactly once, by a later quad of
+    the same statement, so emit() returns the temps a quad reads to a free
+    pool and new_temp() takes the lowest free number. Each statement thus
+    numbers its temps densely from T1 and the whole program uses only as
+    many temp names as its deepest expression needs.
+    """
     def __init__(self):
-        self.code = []       
-        self._temp = 0
+        self.code = []       # list of Quad
+        self._temp = 0       # highest temp number handed out
         self._label = 0
+        self._live = set()   # temps handed out and not read yet
+        self._free = []      # heap of released temp numbers
 
     def new_temp(self):
-        self._temp += 1
-        return f"T{self._temp}"
+        if self._free:
+            t = f"T{heapq.heappop(self._free)}"
+        else:
+            self._temp += 1
+            t = f"T{self._temp}"
+        self._live.add(t)
+        return t
 
     def new_label(self):
         self._label += 1
         return f"L{self._label}"
 
-    def emit(self, line):
-        self.code.append(line)
+    @property
+    def temp_count(self):
+        return self._temp
+
+    @property
+    def label_count(self):
+        return self._label
+
+    def emit(self, op, dest=None, arg1=None, arg2=None, relop=None):
+        self.code.append(Quad(op, dest, arg1, arg2, relop))
+        live = self._live
+        if arg1 in live:
+            live.remove(arg1)
+            heapq.heappush(self._free, int(arg1[1:]))
+        if arg2 in live:
+            live.remove(arg2)
+            heapq.heappush(self._free, int(arg2[1:]))
 
     def get_code(self):
         return self.code[:]
 
+    def lines(self):
+        """Text form of the code, built on demand."""
+        return [str(q) for q in self.code]
+
     def dump(self):
-        for i, l in enumerate(self.code, 1):
-            print(f"({i}) {l}")
+        for i, q in enumerate(self.code, 1):
+            print(f"({i}) {q}")
@@ -0,0 +1,115 @@
+# The on-disk compile cache...
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import cache
+from cache import CompileCache, cache_key, pack
+from compiler import compile_source, token_lines
+
+SOURCE = open("sample_code.txt").read()
+HERE = os.path.dirname(os.path.abspath(cache.__file__))
+
+
+def _artifacts(result):
+    return (token_lines(result.toks), result.symtab, [str(q) for q in result.tac],
+            [str(q) for q in result.tac_code], result.asm)
+
+
+class CompileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.cache = CompileCache(self.root)
+
+    def test_hit_and_miss(self):
+        first = compile_source(SOURCE, 2, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        second = compile_source(SOURCE, 2, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(_artifacts(second), _artifacts(first))
+        self.assertEqual(_artifacts(second), _artifacts(compile_source(SOURCE, 2)))
+        # other options or source are other entries
+        compile_source(SOURCE, 1, cache=self.cache)
+        compile_source(SOURCE + "print(1);", 2, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        self.assertEqual(len(self.cache.entries()), 3)
+
+    def test_unoptimized_code_stays_shared(self):
+        compile_source(SOURCE, 0, cache=self.cache)
+        result = compile_source(SOURCE, 0, cache=self.cache)
+        self.assertIs(result.tac_code, result.tac)
+
+    def test_corrupt_entry(self):
+        key = cache_key(SOURCE, (2, 4, "linear"))
+        expected = _artifacts(compile_source(SOURCE, 2))
+        for blob in (b"", b"not zlib", pack([], {}, [], [], [])[:-3]):
+            with self.subTest(blob=blob):
+                self.cache.put(key, blob)
+                self.assertIsNone(self.cache.get(key))
+                # the compile replaces the entry, and the next one hits
+                self.assertEqual(_artifacts(compile_source(SOURCE, 2, cache=self.cache)), expected)
+                hits = self.cache.hits
+                compile_source(SOURCE, 2, cache=self.cache)
+                self.assertEqual(self.cache.hits, hits + 1)
+
+    def test_compiler_digest_invalidation(self):
+        # editing a compiler module changes every key; run on a copy of the tree
+        tree = os.path.join(self.root, "tree")
+        os.mkdir(tree)
+        for name in cache._COMPILER_MODULES + ("cache.py",):
+            shutil.copy(os.path.join(HERE, name), tree)
+        script = "import cache; print(cache.cache_key('int a = 1;', (0, 4, 'linear')))"
+
+        def key():
+            return subprocess.run([sys.executable, "-c", script], cwd=tree, check=True,
+                                  capture_output=True, text=True).stdout.strip()
+
+        before = key()
+        self.assertEqual(before, cache_key("int a = 1;", (0, 4, "linear")))
+        with open(os.path.join(tree, "optimizer.py"), "a") as f:
+            f.write("\n# edited\n")
+        self.assertNotEqual(key(), before)
+
+    def test_format_invalidation(self):
+        before = cache_key(SOURCE, (0, 4, "linear"))
+        saved = cache.FORMAT, cache._digest
+        try:
+            cache.FORMAT += 1
+            cache._digest = None
+            self.assertNotEqual(cache_key(SOURCE, (0, 4, "linear")), before)
+        finally:
+            cache.FORMAT, cache._digest = saved
+
+    def test_prune_least_recently_used(self):
+        blob = pack([], {"a": "int"}, [], [], ["HALT"])
+        keys = [f"{i:02x}" + "0" * 62 for i in range(5)]
+        for age, key in enumerate(keys):
+            self.cache.put(key, blob)
+            t = 1000000 + age * 10
+            os.utime(self.cache._path(key), (t, t))
+        self.cache.get(keys[0])      # refreshes the oldest
+        self.cache.max_bytes = len(blob) * 5 // 2
+        self.assertEqual(self.cache.prune(), 3)
+        left = sorted(os.path.basename(path) for _, _, path in self.cache.entries())
+        self.assertEqual(left, [keys[0], keys[4]])
+        self.assertEqual(self.cache.size(), 2 * len(blob))
+        self.assertEqual(self.cache.prune(), 0)
+
+    def test_prune_every(self):
+        small = CompileCache(self.root, max_bytes=250, prune_every=4)
+        for i in range(4):
+            small.put(f"{i:02x}" + "0" * 62, b"x" * 100)
+        self.assertEqual(small.size(), 200)
+        # a writer's leftover temp file is not an entry
+        fd, _ = tempfile.mkstemp(dir=os.path.dirname(small._path("01")), prefix=".tmp-")
+        os.close(fd)
+        self.assertEqual(len(small.entries()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# Incremental recompilation against full compiles of the same source...
+
+import random
+import unittest
+
+from compiler import compile_source
+from incremental import IncrementalCompiler
+from interpreter import interpret
+from parser import ParserError
+from tac_generator import LABEL, JUMP_OPS
+
+
+def _tokens(toks):
+    return [(t.type, t.value, t.line, t.col) for t in toks]
+
+
+def _canonical(code):
+    # quads as strings, labels renumbered in order of first appearance
+    names = {}
+    out = []
+    for q in code:
+        if q.op == LABEL or q.op in JUMP_OPS:
+            dest = names.setdefault(q.dest, f"L{len(names)}")
+            q = type(q)(q.op, dest, q.arg1, q.arg2, q.relop)
+        out.append(str(q))
+    return out
+
+
+# statements of the random programs; all valid once `a` and `b` are declared
+LINES = [
+    "a = a + 1;",
+    "print(a);",
+    "b = (a * 3) - -2;",
+    "if (a > 2) a = 1;",
+    "if (a > 2) { print(b); }",
+    "if (1) { int a = 3; a = a + 1; print(a); }",
+    "if (a) { float b = 4.5; if (1) { int a = 5; print(a); } print(b); }",
+    "char c%d = 'x'; print(c%d);",
+]
+# lines that only make sense next to others: redeclarations, a dangling else
+EDIT_LINES = LINES + ["int a = 2;", "float b;", "else a = 2;", "else { int a = 6; print(a); }"]
+SNIPPETS = [" ", "\n", "\n\n", "a", "1", ";", "+ 2", "=", "}", "{", "else ", "int a;",
+            "if (1) { int b = 7; }", "print(b);"]
+
+
+def _program(rng):
+    lines = ["int a = 1;", "float b = 2.5;"]
+    for n in range(rng.randrange(3, 12)):
+        line = rng.choice(LINES)
+        lines.append(line % (n, n) if "%d" in line else line)
+    return "\n".join(lines) + "\n"
+
+
+def _random_edit(rng, src):
+    # (start, end, text) replacing src[start:end]
+    starts = [0] + [i + 1 for i, ch in enumerate(src) if ch == "\n"]
+    k = rng.random()
+    if k < 0.3:             # insert a whole line
+        at = rng.choice(starts)
+        line = rng.choice(EDIT_LINES)
+        return at, at, (line % (at, at) if "%d" in line else line) + "\n"
+    if k < 0.5:             # delete a whole line
+        i = rng.randrange(len(starts) - 1) if len(starts) > 1 else 0
+        end = starts[i + 1] if i + 1 < len(starts) else len(src)
+        return starts[i], end, ""
+    if k < 0.65:            # join a line onto the previous one
+        at = rng.choice(starts[1:] or [0])
+        return max(at - 1, 0), at, " "
+    at = rng.randrange(len(src) + 1)
+    if k < 0.85:
+        return at, at, rng.choice(SNIPPETS)
+    return at, min(at + rng.randrange(1, 6), len(src)), ""
+
+
+class IncrementalTest(unittest.TestCase):
+    def assertSameAsFull(self, result, src):
+        full = compile_source(src)
+        self.assertEqual(_tokens(result.toks), _tokens(full.toks))
+        self.assertEqual(result.symtab, full.symtab)
+        self.assertEqual(_canonical(result.tac), _canonical(full.tac))
+        self.assertEqual(interpret(result.tac_code).output, interpret(full.tac_code).output)
+
+    def test_use_after_new_shadowed_declaration(self):
+        src = "int x = 5;\nprint(x);\n"
+        new = "if (1) { int x = 7; }\n" + src
+        ic = IncrementalCompiler()
+        ic.full(src)
+        self.assertSameAsFull(ic.update(new), new)
+        self.assertEqual(interpret(ic.result().tac_code).output, [5])
+
+    def test_use_after_removed_declaration(self):
+        src = "int x = 5;\nprint(x);\n"
+        old = "if (1) { int x = 7; }\n" + src
+        ic = IncrementalCompiler()
+        ic.full(old)
+        self.assertSameAsFull(ic.update(src), src)
+
+    def test_assignment_after_new_declaration(self):
+        src = "int y = 1;\nint x = 2;\nx = x + y;\nprint(x);\n"
+        new = "if (1) { int x = 9; print(x); }\n" + src
+        ic = IncrementalCompiler()
+        ic.full(src)
+        self.assertSameAsFull(ic.update(new), new)
+
+    def test_random_edits(self):
+        rng = random.Random(520)
+        for trial in range(40):
+            src = _program(rng)
+            ic = IncrementalCompiler()
+            ic.full(src)
+            for step in range(25):
+                start, end, text = _random_edit(rng, src)
+                new = src[:start] + text + src[end:]
+                recompile = (lambda: ic.edit(start, end, text)) if step % 2 else (lambda: ic.update(new))
+                with self.subTest(trial=trial, step=step, src=new):
+                    try:
+                        compile_source(new)
+                    except (ParserError, RuntimeError) as e:
+                        with self.assertRaises(type(e)) as cm:
+                            recompile()
+                        self.assertEqual(str(cm.exception), str(e))
+                        self.assertEqual(ic.src, src)
+                        continue
+                    self.assertSameAsFull(recompile(), new)
+                    src = new
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+# Shadowed variables through both TAC engines and the VM...
+
+import unittest
+
+from compiler import compile_source
+from interpreter import interpret, run_compiled
+from vm import run
+
+SHADOWING = """
+int x = 1;
+if (1) { int x = 2; print(x); }
+print(x);
+if (x) { float x = 3; if (1) { int x = 4; print(x); } print(x); }
+if (1) { char x = 'a'; print(x); }
+print(x);
+"""
+
+
+class ShadowingTest(unittest.TestCase):
+    def test_engines_agree(self):
+        for level in (0, 1, 2):
+            with self.subTest(level=level):
+                result = compile_source(SHADOWING, level)
+                expected = [2, 1, 4, 3, 97, 1]
+                self.assertEqual(interpret(result.tac_code).output, expected)
+                self.assertEqual(run_compiled(result.tac_code).output, expected)
+                self.assertEqual(run(result.asm).output, expected)
+
+    def test_compiled_variables(self):
+        tac = compile_source("int x = 1; if (1) { int x = 2; print(x); } print(x);").tac
+        compiled = run_compiled(tac)
+        self.assertEqual(compiled.output, [2, 1])
+        self.assertEqual(compiled.variables, interpret(tac).variables)
+
+
+if __name__ == "__main__":
+    unittest.main()
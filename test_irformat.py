@@ -0,0 +1,56 @@
+# Round trips and corrupted input for the binary IR...
+
+import random
+import unittest
+
+import irformat
+from compiler import compile_source
+from irformat import IRFile, IRError
+
+SOURCE = """
+int a = 3; float b = 2.5; char c = 'x';
+while (a > 0) { if (a == 2) { print(c); } else { print(b * a); } a = a - 1; }
+"""
+
+
+def _flips(data, count, seed=0):
+    # copies of data with one random bit flipped in each
+    rnd = random.Random(seed)
+    for _ in range(count):
+        b = bytearray(data)
+        k = rnd.randrange(len(b) * 8)
+        b[k // 8] ^= 1 << k % 8
+        yield bytes(b)
+
+
+class IRFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.result = compile_source(SOURCE, 2)
+
+    def test_round_trip(self):
+        with IRFile(irformat.encode_tac(self.result.tac_code)) as f:
+            self.assertEqual(f.quads(), self.result.tac_code)
+        with IRFile(irformat.encode_asm(self.result.asm)) as f:
+            self.assertEqual(f.asm(), self.result.asm)
+
+    def test_corrupt_tac(self):
+        for data in _flips(irformat.encode_tac(self.result.tac_code), 1000):
+            try:
+                with IRFile(data) as f:
+                    f.quads()
+                    [f.quad(i) for i in range(len(f))]
+                    f.labels()
+            except IRError:
+                pass
+
+    def test_corrupt_asm(self):
+        for data in _flips(irformat.encode_asm(self.result.asm), 1000):
+            try:
+                with IRFile(data) as f:
+                    f.asm()
+            except IRError:
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
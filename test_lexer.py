@@ -0,0 +1,96 @@
+# Compact token buffers and the streaming lexer against the plain Token list...
+
+import io
+import os
+import tempfile
+import unittest
+
+from compiler import compile_source, compile_file, token_lines
+from lexer import lexer, lex_compact, iter_tokens, lex_file
+from parser import Parser
+
+SOURCE = open("sample_code.txt").read() + """
+int n = 3, m; char k = 'q';
+while (n > 0) { if (n == 2) { int m = 7; print(m); } else { print(k); } n = n - 1; }
+m = (n + 2) * -3; print(m);
+"""
+
+
+def _parse(tokens):
+    p = Parser(tokens)
+    return [str(q) for q in p.parse()], p.symtab.as_dict()
+
+
+class TokenBufferTest(unittest.TestCase):
+    def test_same_tokens(self):
+        buf = lex_compact(SOURCE)
+        toks = lexer(SOURCE)
+        self.assertEqual(len(buf), len(toks))
+        self.assertEqual([repr(t) for t in buf], [repr(t) for t in toks])
+        self.assertEqual(repr(buf[-1]), repr(toks[-1]))
+
+    def test_same_parse(self):
+        self.assertEqual(_parse(lex_compact(SOURCE)), _parse(lexer(SOURCE)))
+
+    def test_compile_source(self):
+        compact = compile_source(SOURCE, 2, compact_tokens=True)
+        plain = compile_source(SOURCE, 2)
+        self.assertEqual(token_lines(compact.toks), token_lines(plain.toks))
+        self.assertEqual(compact.symtab, plain.symtab)
+        self.assertEqual(compact.asm, plain.asm)
+
+    def test_views_past_a_batch(self):
+        src = "int x = 0;\n" + "x = x + 1;\n" * 2000 + "print(x);\n"
+        self.assertEqual(_parse(lex_compact(src)), _parse(lexer(src)))
+
+
+class StreamingTest(unittest.TestCase):
+    def assertSameTokens(self, streamed, src):
+        self.assertEqual([repr(t) for t in streamed], [repr(t) for t in lexer(src)])
+
+    def _file(self, data):
+        fd, path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_chunk_sizes(self):
+        for size in (1, 2, 3, 7, 64, 1 << 16):
+            with self.subTest(chunk_size=size):
+                self.assertSameTokens(iter_tokens(SOURCE, size), SOURCE)
+
+    def test_tokens_split_across_chunks(self):
+        src = "float counter_variable = 12.5;\nchar c = 'z';\nif (counter_variable >= 1.25) { print(c); }\n"
+        for size in range(1, 12):
+            with self.subTest(chunk_size=size):
+                self.assertSameTokens(iter_tokens(src, size), src)
+
+    def test_crlf_file(self):
+        path = self._file(SOURCE.replace("\n", "\r\n").encode())
+        for size in (1, 5, 1 << 16):
+            with self.subTest(chunk_size=size):
+                self.assertSameTokens(lex_file(path, size), SOURCE)
+
+    def test_non_ascii(self):
+        src = "char c = '\u00e9';\nprint(c);\nchar d = '\u20ac'; print(d);\n"
+        data = src.encode()
+        for size in (1, 2, 3):
+            with self.subTest(chunk_size=size):
+                self.assertSameTokens(iter_tokens(io.BytesIO(data), size), src)
+                self.assertSameTokens(lex_file(self._file(data), size), src)
+
+    def test_empty_file(self):
+        self.assertSameTokens(lex_file(self._file(b"")), "")
+
+    def test_compile_file(self):
+        streamed = compile_file(self._file(SOURCE.encode()), 2)
+        plain = compile_source(SOURCE, 2)
+        self.assertEqual(token_lines(streamed.toks), token_lines(plain.toks))
+        self.assertEqual(streamed.symtab, plain.symtab)
+        self.assertEqual([str(q) for q in streamed.tac], [str(q) for q in plain.tac])
+        self.assertEqual(streamed.asm, plain.asm)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+# Loop optimizations and the -O2 pipeline against unoptimized code...
+
+import unittest
+
+from compiler import compile_source
+from interpreter import interpret
+from optimizer import optimize
+from register_allocator import ALLOCATORS
+from tac_generator import LABEL, GOTO
+from test_register_allocator import PROGRAMS
+from vm import run
+
+LOOPS = {
+    "invariant": """
+int i = 0, s = 0, a = 3, b = 4;
+while (i < 10) { s = s + a * b + i * 4; i = i + 1; }
+print(s);
+""",
+    "nested": """
+int i = 5, t = 0, w = 2;
+while (i > 0) {
+    int j = 0;
+    while (j < i) { t = t + (w + 1) * j - i * 3; j = j + 2; }
+    if (t > 10) { w = w + 1; }
+    i = i - 1;
+}
+print(t); print(w);
+""",
+    "shadowed": """
+int i = 0, k = 1;
+while (i < 4) { int k = i * 5; print(k); i = i + 1; }
+print(k);
+""",
+    "float": """
+float f = 0.5;
+int n = 0;
+while (f < 3) { n = n + 2; print(f * 2); f = f + 1; }
+print(n);
+""",
+    "never runs": """
+int i = 0, a = 6, z = 0, s = 0;
+while (i < 0) { s = s + a / z; i = i + 1; }
+print(s);
+""",
+}
+PASS_SETS = [("licm",), ("strength",), ("invert",), ("licm", "strength", "invert")]
+
+
+def _loop_start(code):
+    return next(i for i, q in enumerate(code) if q.op == LABEL)
+
+
+def _back_gotos(code):
+    placed = set()
+    out = []
+    for q in code:
+        if q.op == LABEL:
+            placed.add(q.dest)
+        elif q.op == GOTO and q.dest in placed:
+            out.append(q)
+    return out
+
+
+class LoopPassTest(unittest.TestCase):
+    def test_same_output(self):
+        for name, src in {**LOOPS, **PROGRAMS}.items():
+            tac = compile_source(src).tac
+            expected = interpret(tac).output
+            for passes in PASS_SETS:
+                with self.subTest(program=name, passes=passes):
+                    self.assertEqual(interpret(optimize(tac, passes=passes)).output, expected)
+
+    def test_licm_hoists_invariant(self):
+        tac = compile_source(LOOPS["invariant"]).tac
+        code = optimize(tac, passes=("licm",))
+        hoisted = [i for i, q in enumerate(code) if q.op == "*" and {q.arg1, q.arg2} == {"a", "b"}]
+        self.assertEqual(len(hoisted), 1)
+        self.assertLess(hoisted[0], _loop_start(code))
+        self.assertLess(interpret(code).steps, interpret(tac).steps)
+
+    def test_licm_keeps_trapping_division(self):
+        code = optimize(compile_source(LOOPS["never runs"]).tac, passes=("licm",))
+        division = next(i for i, q in enumerate(code) if q.op == "/")
+        self.assertGreater(division, _loop_start(code))
+
+    def test_strength_reduction(self):
+        code = optimize(compile_source(LOOPS["invariant"]).tac, passes=("strength",))
+        start = _loop_start(code)
+        self.assertFalse([q for q in code[start:] if q.op == "*" and "i" in (q.arg1, q.arg2)])
+        # float induction variables keep their multiplication
+        code = optimize(compile_source(LOOPS["float"]).tac, passes=("strength",))
+        self.assertTrue([q for q in code[_loop_start(code):] if q.op == "*"])
+
+    def test_inversion(self):
+        tac = compile_source(LOOPS["nested"]).tac
+        code = optimize(tac, passes=("invert",))
+        self.assertEqual(len(_back_gotos(tac)), 2)
+        self.assertEqual(_back_gotos(code), [])
+        self.assertLess(interpret(code).steps, interpret(tac).steps)
+
+
+class PipelineTest(unittest.TestCase):
+    def test_o2(self):
+        for name, src in {**LOOPS, **PROGRAMS}.items():
+            expected = interpret(compile_source(src).tac).output
+            for allocator in ALLOCATORS:
+                for registers in (2, 4):
+                    with self.subTest(program=name, allocator=allocator, registers=registers):
+                        result = compile_source(src, 2, registers, allocator)
+                        self.assertEqual(interpret(result.tac_code).output, expected)
+                        self.assertEqual(run(result.asm).output, expected)
+
+    def test_o2_runs_fewer_instructions(self):
+        for name, src in LOOPS.items():
+            with self.subTest(program=name):
+                plain = run(compile_source(src).asm)
+                self.assertLessEqual(run(compile_source(src, 2).asm).steps, plain.steps)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# The parallel front end against the serial one...
+
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import parallel
+from lexer import lexer
+from parallel import parse_parallel, serial
+from parser import ParserError
+
+BODY = """%(v)s = %(v)s + 1;
+if (%(v)s > 3) { float b = 1.5; print(b); }
+while (%(v)s < 10) { %(v)s = %(v)s + 2; if (%(v)s == 6) { int %(v)s = 4; print(%(v)s); } }
+print(%(v)s);
+"""
+PROGRAM = "int a = 1;\nchar c = 'p';\n" + BODY % {"v": "a"} * 60 + "print(c);\n"
+TAIL = BODY % {"v": "a"} * 10
+
+
+def _front_end(fe):
+    st = fe.symtab
+    return ([repr(t) for t in fe.toks], [str(q) for q in fe.tac],
+            st.names, st.types, st.depths, st.storage, fe.temp_count, fe.label_count)
+
+
+def _middle(text):
+    # PROGRAM with text inserted at the line start nearest its middle
+    half = PROGRAM.index("\n", len(PROGRAM) // 2) + 1
+    return PROGRAM[:half] + text + PROGRAM[half:]
+
+
+def _error(parse, src):
+    try:
+        parse(src)
+    except (ParserError, RuntimeError) as e:
+        return type(e), str(e)
+    return None
+
+
+class ParallelTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        self.min_bytes = parallel.MIN_BYTES
+        parallel.MIN_BYTES = 0
+
+    def tearDown(self):
+        parallel.MIN_BYTES = self.min_bytes
+
+    def parse(self, src):
+        return parse_parallel(src, workers=2, pool=self.pool)
+
+    def assertSameAsSerial(self, src, chunked=True):
+        fe = self.parse(src)
+        self.assertEqual(_front_end(fe), _front_end(serial(src)))
+        if chunked:
+            self.assertGreater(fe.chunks, 1)
+        return fe
+
+    def assertSameError(self, src):
+        expected = _error(serial, src)
+        self.assertIsNotNone(expected)
+        self.assertEqual(_error(self.parse, src), expected)
+
+    def test_program(self):
+        self.assertSameAsSerial(PROGRAM)
+
+    def test_own_pool(self):
+        fe = parse_parallel(PROGRAM, workers=2)
+        self.assertEqual(_front_end(fe), _front_end(serial(PROGRAM)))
+
+    def test_small_source_is_serial(self):
+        parallel.MIN_BYTES = len(PROGRAM) + 1
+        self.assertEqual(self.parse(PROGRAM).chunks, 0)
+
+    def test_else_at_chunk_boundaries(self):
+        # every line start is a place a piece may begin, including each `else`
+        src = "int a = 0;\n" + "if (a > 1) { a = a - 1; }\nelse { a = a + 3; }\nprint(a);\n" * 80
+        self.assertSameAsSerial(src)
+        src = "int a = 0;\n" + "if (a > 1)\na = a - 1;\nelse\na = a + 3;\n" * 80
+        self.assertSameAsSerial(src)
+
+    def test_declarations_across_chunks(self):
+        # top-level names stay visible; block ones get the serial storage
+        body = BODY % {"v": "x"} * 30
+        src = ("int x = 1;\n" + body + "if (1) { int x = 2; float y = 3; print(y); }\n" + body
+               + "float y = 4;\nprint(y);\n")
+        fe = self.assertSameAsSerial(src)
+        self.assertIn("x.1", fe.symtab.storage)
+        self.assertIn("y.1", fe.symtab.storage)
+
+    def test_redeclaration_across_chunks(self):
+        self.assertSameError(PROGRAM + "int a = 2;\n")
+        self.assertSameError("int z;\n" + PROGRAM + "float z;\n" + TAIL)
+
+    def test_use_before_declaration_across_chunks(self):
+        self.assertSameError(PROGRAM + "w = 1;\n" + TAIL + "int w;\n")
+
+    def test_unbalanced_braces(self):
+        self.assertSameError(PROGRAM + "}\n" + TAIL)
+        self.assertSameError(_middle("}\n"))
+        self.assertSameError(_middle("{\n"))
+        self.assertSameError(PROGRAM + "if (a) {\n")
+
+    def test_lexer_errors(self):
+        self.assertSameError(_middle("a = 1 @ 2;\n") + "b = $;\n")
+        self.assertSameError(_middle("char d = 'xy';\n"))
+
+    def test_parser_errors(self):
+        self.assertSameError(_middle("a = ;\n"))
+        self.assertSameError(PROGRAM + TAIL + "print(a)\n")
+        self.assertSameError(PROGRAM + "else { a = 1; }\n" + TAIL)
+
+    def test_empty(self):
+        self.assertEqual(_front_end(self.parse("")), _front_end(serial("")))
+        self.assertEqual([repr(t) for t in self.parse("\n\n").toks],
+                         [repr(t) for t in lexer("\n\n")])
+
+
+if __name__ == "__main__":
+    unittest.main()
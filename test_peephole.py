@@ -0,0 +1,71 @@
+# Peephole rewrites, one rule at a time and over whole programs...
+
+import unittest
+
+from compiler import compile_source
+from interpreter import interpret
+from machine_generator import MachineGenerator
+from peephole import peephole
+from register_allocator import ALLOCATORS
+from test_register_allocator import PROGRAMS
+from vm import run
+
+# (asm, optimized asm)
+CASES = {
+    "store-load": (["LOADI R1, 5", "STORE R1, x", "LOAD R2, x", "PRINT R2"],
+                   ["LOADI R1, 5", "STORE R1, x", "MOV R2, R1", "PRINT R2"]),
+    "load-load": (["LOAD R1, x", "LOAD R2, x", "ADD R1, R2", "PRINT R1"],
+                  ["LOAD R1, x", "MOV R2, R1", "ADD R1, R2", "PRINT R1"]),
+    "moves": (["LOADI R1, 3", "MOV R1, R1", "MOV R2, R1", "MOV R1, R2", "PRINT R2"],
+              ["LOADI R2, 3", "PRINT R2"]),
+    "dead-write": (["LOADI R1, 1", "LOADI R1, 2", "PRINT R1"],
+                   ["LOADI R1, 2", "PRINT R1"]),
+    "branch-not-taken": (["LOADI R1, 3", "CMP R1, 0", "JE L1", "PRINT R1", "L1:", "PRINT 7"],
+                         ["LOADI R1, 3", "PRINT R1", "PRINT 7"]),
+    "branch-taken": (["LOADI R1, 0", "CMP R1, 0", "JE L1", "PRINT R1", "L1:", "PRINT 7"],
+                     ["PRINT 7"]),
+    "jumps": (["JMP L1", "L1:", "JMP L2", "PRINT 1", "L2:", "PRINT 2"],
+              ["PRINT 2"]),
+    "threading": (["LOAD R1, x", "CMP R1, 0", "JE L1", "JMP L2", "L1:", "JMP L3",
+                   "L2:", "PRINT 1", "L3:", "PRINT 2"],
+                  ["LOAD R1, x", "CMP R1, 0", "JE L3", "PRINT 1", "L3:", "PRINT 2"]),
+    "const-neg": (["LOADI R1, 4", "NEG R1", "PRINT R1"],
+                  ["LOADI R1, -4", "PRINT R1"]),
+    "const-move-neg": (["LOADI R1, 2.5", "MOV R2, R1", "NEG R2", "PRINT R2", "PRINT R1"],
+                       ["LOADI R1, 2.5", "LOADI R2, -2.5", "PRINT R2", "PRINT R1"]),
+    "store-store": (["LOADI R1, 1", "LOADI R2, 2", "STORE R1, x", "STORE R2, x", "PRINT x"],
+                    ["LOADI R2, 2", "STORE R2, x", "PRINT x"]),
+}
+
+
+class PeepholeTest(unittest.TestCase):
+    def test_rules(self):
+        for name, (asm, expected) in CASES.items():
+            with self.subTest(case=name):
+                optimized = peephole(asm)
+                self.assertEqual(optimized, expected)
+                self.assertEqual(run(optimized).output, run(asm).output)
+
+    def test_programs(self):
+        # the generator's own asm, before compile_source's peephole pass
+        for name, src in PROGRAMS.items():
+            expected = interpret(compile_source(src).tac).output
+            for level in (0, 1):
+                tac = compile_source(src, level).tac_code
+                for allocator in ALLOCATORS:
+                    for registers in (2, 4):
+                        with self.subTest(program=name, level=level, allocator=allocator,
+                                          registers=registers):
+                            asm = MachineGenerator(registers, allocator).generate(tac)
+                            optimized = peephole(asm)
+                            self.assertEqual(run(optimized).output, expected)
+                            self.assertLessEqual(run(optimized).steps, run(asm).steps)
+                            self.assertEqual(peephole(optimized), optimized)
+
+    def test_no_rules(self):
+        asm = compile_source(PROGRAMS["loops"]).asm
+        self.assertEqual(peephole(asm, rules=[], passes=[]), asm)
+
+
+if __name__ == "__main__":
+    unittest.main()
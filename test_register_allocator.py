@@ -0,0 +1,84 @@
+# Both register allocators through the VM at every register count...
+
+import re
+import unittest
+
+from compiler import compile_source
+from interpreter import interpret
+from machine_generator import MachineGenerator
+from register_allocator import ALLOCATORS
+from vm import run
+
+PROGRAMS = {
+    "pressure": """
+int a = 3, b = 4, c = 5, d = 6, e = 7, f = 8, g = 9, h = 2;
+int x = (a + b) * (c + d) - (e + f) * (g + h);
+int y = ((a * b) + (c * d)) * ((e * f) - (g * h)) + x;
+print(x); print(y);
+print((a + b + c + d) * (e - f - g - h) / (h - 1));
+""",
+    "loops": """
+int i = 0, s = 0, p = 1;
+while (i < 12) {
+    s = s + i * i;
+    if (i > 5) { p = p * 2 - i; } else { p = p + (s - i) * 3; }
+    i = i + 1;
+}
+print(s); print(p);
+int n = 6;
+while (n > 0) { int m = n * 2; while (m > n) { m = m - 1; s = s - m; } n = n - 1; }
+print(s);
+""",
+    "mixed": """
+float r = 1.5;
+char ch = 'k';
+int k = 4;
+if (k == 4) { float t = r * 2.5 + k; print(t); }
+r = r * -k + 0.25;
+print(r); print(ch);
+if (k != 3) print(k - 10); else print(k + 10);
+""",
+}
+
+
+def _registers(asm):
+    return {int(n) for line in asm for n in re.findall(r"\bR(\d+)\b", line)}
+
+
+class RegisterAllocatorTest(unittest.TestCase):
+    def test_same_output(self):
+        for name, src in PROGRAMS.items():
+            expected = interpret(compile_source(src).tac).output
+            for allocator in ALLOCATORS:
+                for registers in (2, 3, 4, 8):
+                    for level in (0, 1, 2):
+                        with self.subTest(program=name, allocator=allocator,
+                                          registers=registers, level=level):
+                            result = compile_source(src, level, registers, allocator)
+                            self.assertEqual(run(result.asm).output, expected)
+
+    def test_register_bounds(self):
+        for name, src in PROGRAMS.items():
+            for allocator in ALLOCATORS:
+                for registers in (2, 3):
+                    with self.subTest(program=name, allocator=allocator, registers=registers):
+                        asm = compile_source(src, 0, registers, allocator).asm
+                        self.assertLessEqual(_registers(asm), set(range(1, registers + 1)))
+
+    def test_spills_under_pressure(self):
+        tac = compile_source(PROGRAMS["pressure"]).tac
+        spills = {}
+        for registers in (2, 8):
+            mg = MachineGenerator(registers, "linear")
+            mg.generate(tac)
+            spills[registers] = mg.spills
+        self.assertGreater(spills[2], 0)
+        self.assertLessEqual(spills[8], spills[2])
+
+    def test_too_few_registers(self):
+        with self.assertRaises(ValueError):
+            MachineGenerator(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# The list scheduler against the order MachineGenerator emits...
+
+import unittest
+
+from compiler import compile_source
+from interpreter import interpret
+from peephole import parse, JCC
+from register_allocator import ALLOCATORS
+from scheduler import schedule
+from test_loops import LOOPS
+from test_register_allocator import PROGRAMS
+from vm import run, VMError
+
+
+def _blocks(asm):
+    # (labels and jumps in order, the instructions between them as sorted lists)
+    fixed, bodies, body = [], [], []
+    for op, args in parse(asm):
+        if op == "LABEL" or op == "JMP" or op in JCC:
+            fixed.append((op, args))
+            bodies.append(sorted(body))
+            body = []
+        else:
+            body.append((op, args))
+    bodies.append(sorted(body))
+    return fixed, bodies
+
+
+def _ordered(asm):
+    return [ins for ins in parse(asm) if ins[0] in ("PRINT", "DIV")]
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_fills_load_latency(self):
+        asm = ["LOAD R1, x", "ADD R1, R1", "LOAD R2, y", "ADD R2, R2", "PRINT R1", "PRINT R2"]
+        scheduled = schedule(asm)
+        self.assertEqual(scheduled, ["LOAD R1, x", "LOAD R2, y", "ADD R1, R1", "ADD R2, R2",
+                                     "PRINT R1", "PRINT R2"])
+        self.assertLess(run(scheduled).stall_cycles(), run(asm).stall_cycles())
+
+    def test_unit_latencies_keep_order(self):
+        asm = compile_source(PROGRAMS["loops"], 1).asm
+        self.assertNotEqual(schedule(asm), asm)
+        self.assertEqual(schedule(asm, {}), asm)
+
+    def test_division_by_zero(self):
+        asm = ["LOAD R1, x", "LOAD R2, y", "MUL R1, R1", "PRINT 5", "DIV R1, R2", "PRINT R1",
+               "LOAD R3, z", "MUL R3, R3", "PRINT R3"]
+        scheduled = schedule(asm)
+        self.assertEqual(_ordered(scheduled), _ordered(asm))
+        for code in (asm, scheduled):
+            with self.assertRaises(VMError):
+                run(code)
+
+    def test_programs(self):
+        for name, src in {**PROGRAMS, **LOOPS}.items():
+            expected = interpret(compile_source(src).tac).output
+            for allocator in ALLOCATORS:
+                for registers in (2, 4):
+                    with self.subTest(program=name, allocator=allocator, registers=registers):
+                        asm = compile_source(src, 1, registers, allocator).asm
+                        scheduled = schedule(asm)
+                        self.assertEqual(_blocks(scheduled), _blocks(asm))
+                        self.assertEqual(_ordered(scheduled), _ordered(asm))
+                        before, after = run(asm), run(scheduled)
+                        self.assertEqual(after.output, expected)
+                        self.assertEqual(after.steps, before.steps)
+                        self.assertLessEqual(after.stall_cycles(), before.stall_cycles())
+
+
+if __name__ == "__main__":
+    unittest.main()
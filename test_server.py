@@ -0,0 +1,64 @@
+# The compile server over a Unix socket...
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+import server
+from server import CompileServer
+
+
+class CompileServerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "server.sock")
+        self.addCleanup(os.rmdir, os.path.dirname(self.path))
+        self.max_request = server.MAX_REQUEST
+        server.MAX_REQUEST = 1024
+
+    def tearDown(self):
+        server.MAX_REQUEST = self.max_request
+
+    def exchange(self, *lines):
+        # start a server, send lines on one connection and return the answers
+        # read until it closes, plus the metrics afterwards
+        async def go():
+            srv = CompileServer(workers=1)
+            await srv.start(self.path)
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+                for line in lines:
+                    writer.write(line)
+                await writer.drain()
+                writer.write_eof()
+                answers = [json.loads(a) for a in (await reader.read()).splitlines()]
+                writer.close()
+                return answers, srv.metrics.to_dict(srv.workers)
+            finally:
+                await srv.close()
+                os.unlink(self.path)
+        return asyncio.run(asyncio.wait_for(go(), 30))
+
+    def test_compile_and_metrics(self):
+        answers, metrics = self.exchange(
+            json.dumps({"id": 1, "source": "int a = 2; print(a * 3);", "emit": ["tac"]}).encode()
+            + b"\n",
+            b'{"id": 2, "op": "metrics"}\n')
+        self.assertEqual(sorted(a["id"] for a in answers), [1, 2])
+        compiled = next(a for a in answers if a["id"] == 1)
+        self.assertTrue(compiled["ok"])
+        self.assertEqual((metrics["requests"], metrics["errors"]), (2, 0))
+
+    def test_request_too_long(self):
+        answers, metrics = self.exchange(b'{"id": 1, "op": "metrics"}\n',
+                                         b'{"id": 2, "source": "' + b"x" * 2048 + b'"}\n',
+                                         b'{"id": 3, "op": "metrics"}\n')
+        self.assertEqual(answers[-1], {"id": None, "ok": False, "error": "request too long"})
+        # the connection closes after the answer: nothing past the long line is read
+        self.assertEqual([a["id"] for a in answers], [1, None])
+        self.assertEqual((metrics["requests"], metrics["errors"]), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+# Storage and symbols.txt entries of block-scoped declarations...
+
+import unittest
+
+from compiler import compile_source, symbol_lines
+
+SIBLINGS = """
+int x = 1;
+if (1) { float y = 2; print(y); }
+if (1) { char y = 'b'; int x = 4; print(x); }
+print(x);
+"""
+
+
+class StorageTest(unittest.TestCase):
+    def test_one_entry_per_declaration(self):
+        symtab = compile_source(SIBLINGS).symtab
+        self.assertEqual(symbol_lines(symtab),
+                         ["x : int", "y : float", "y.1 : char", "x.1 : int"])
+
+
+if __name__ == "__main__":
+    unittest.main()
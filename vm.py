@@ -0,0 +1,385 @@
+# Virtual machine for the pseudo-assembly produced by MachineGenerator...
+#
+# assemble() decodes the text once: labels become instruction addresses,
+# registers become indexes, variables become memory slots and immediates
+# become numbers. Each instruction is then (handler index, a, b) and run()
+# dispatches through a table of handlers. Nothing is priced while running:
+# the VM only counts how often each address executes and how many branches
+# were taken; the cost model is applied to those counts afterwards, so one
+# run can be priced under any number of models.
+#
+# Besides the flat per-opcode costs there is a pipelined in-order model:
+# one instruction issues per cycle, and an instruction stalls until every
+# register it reads or writes (the flags, for CMP and the conditional
+# jumps) has been produced. stalls() works out the stall before each
+# instruction once per program, straight through each basic block with
+# everything ready on entry, and RunStats weighs it by the hit counts.
+
+from tac_generator import apply_op, literal_value
+
+JCC = ('JE', 'JNE', 'JLT', 'JGT', 'JLE', 'JGE')
+
+# cycles per executed instruction; TAKEN is added for every taken jump
+DEFAULT_COSTS = {
+    'LOAD': 3, 'STORE': 3, 'LOADI': 1, 'MOV': 1,
+    'ADD': 1, 'SUB': 1, 'MUL': 3, 'DIV': 20, 'NEG': 1,
+    'CMP': 1, 'JMP': 1, 'JE': 1, 'JNE': 1, 'JLT': 1, 'JGT': 1, 'JLE': 1, 'JGE': 1,
+    'PRINT': 1, 'TAKEN': 2,
+}
+
+# pipelined model: cycles from issue until the result can be used (1 when
+# not listed); TAKEN is the bubble after every taken jump
+DEFAULT_LATENCIES = {'LOAD': 3, 'MUL': 3, 'DIV': 20, 'TAKEN': 2}
+
+# decoded opcodes: operand shape variants get their own handler
+_LOAD, _LOADI, _STORE, _MOV, _ADD, _SUB, _MUL, _DIV, _NEG, _CMP, _CMPI, _JMP, \
+    _JE, _JNE, _JLT, _JGT, _JLE, _JGE, _PRINTR, _PRINTM, _PRINTI = range(21)
+_MNEMONIC = ('LOAD', 'LOADI', 'STORE', 'MOV', 'ADD', 'SUB', 'MUL', 'DIV', 'NEG',
+             'CMP', 'CMP', 'JMP') + JCC + ('PRINT', 'PRINT', 'PRINT')
+_ARITH = {'ADD': _ADD, 'SUB': _SUB, 'MUL': _MUL, 'DIV': _DIV}
+
+
+class VMError(Exception):
+    pass
+
+
+def _immediate(text):
+    v = literal_value(text)
+    if v is None:
+        if text[0] != "'":
+            raise VMError(f"bad immediate {text!r}")
+        v = ord(text[1])
+    return v
+
+
+class Program:
+    """Decoded instructions plus the tables needed to map them back to
+    source lines, memory names and mnemonics."""
+
+    def __init__(self, asm):
+        self.code = []          # (handler index, a, b)
+        self.lines = []         # asm text of each instruction
+        self.labels = {}        # label -> address
+        self.slots = {}         # variable -> memory slot
+        self.num_registers = 0
+        fixups = []
+        for line in asm:
+            line = line.strip()
+            if not line:
+                continue
+            if line.endswith(':'):
+                self.labels[line[:-1]] = len(self.code)
+                continue
+            op, _, rest = line.partition(' ')
+            args = [a.strip() for a in rest.split(',')] if rest else []
+            self._append(op, args, line, fixups)
+        self._resolve(fixups)
+
+    @classmethod
+    def from_ir(cls, ir):
+        """Program from a binary ASM module (irformat.IRFile), built from its
+        records and label table instead of asm text."""
+        self = cls(())
+        self.labels = ir.labels()
+        fixups = []
+        done = {}       # decoded non-jump instructions, reused for repeats
+        for ins in ir.instructions():
+            hit = done.get(ins)
+            if hit is not None:
+                self.code.append(hit[0])
+                self.lines.append(hit[1])
+                continue
+            op, args = ins
+            self._append(op, args, f"{op} {', '.join(args)}" if args else op, fixups)
+            if op != 'JMP' and op not in JCC:
+                done[ins] = (self.code[-1], self.lines[-1])
+        self._resolve(fixups)
+        return self
+
+    def _append(self, op, args, line, fixups):
+        try:
+            if op == 'LOAD':
+                ins = (_LOAD, self._reg(args[0], line), self._slot(args[1]))
+            elif op == 'LOADI':
+                ins = (_LOADI, self._reg(args[0], line), _immediate(args[1]))
+            elif op == 'STORE':
+                ins = (_STORE, self._reg(args[0], line), self._slot(args[1]))
+            elif op == 'MOV':
+                ins = (_MOV, self._reg(args[0], line), self._reg(args[1], line))
+            elif op in _ARITH:
+                ins = (_ARITH[op], self._reg(args[0], line), self._reg(args[1], line))
+            elif op == 'NEG':
+                ins = (_NEG, self._reg(args[0], line), None)
+            elif op == 'CMP':
+                b = args[1]
+                if b[0] == 'R' and b[1:].isdigit():
+                    ins = (_CMP, self._reg(args[0], line), self._reg(b, line))
+                else:
+                    ins = (_CMPI, self._reg(args[0], line), _immediate(b))
+            elif op == 'JMP' or op in JCC:
+                fixups.append((len(self.code), args[0]))
+                ins = (_JMP if op == 'JMP' else _JE + JCC.index(op), None, None)
+            elif op == 'PRINT':
+                a = args[0]
+                if a[0] == 'R' and a[1:].isdigit():
+                    ins = (_PRINTR, self._reg(a, line), None)
+                elif a[0] == "'" or literal_value(a) is not None:
+                    ins = (_PRINTI, _immediate(a), None)
+                else:
+                    ins = (_PRINTM, self._slot(a), None)
+            else:
+                raise VMError(f"unknown instruction {line!r}")
+        except IndexError:
+            raise VMError(f"missing operand in {line!r}") from None
+        self.code.append(ins)
+        self.lines.append(line)
+
+    def _resolve(self, fixups):
+        for addr, label in fixups:
+            if label not in self.labels:
+                raise VMError(f"undefined label {label!r}")
+            h, _, _ = self.code[addr]
+            self.code[addr] = (h, self.labels[label], None)
+
+    def _reg(self, text, line):
+        if not (text[0] == 'R' and text[1:].isdigit()):
+            raise VMError(f"expected a register in {line!r}")
+        r = int(text[1:]) - 1
+        if r >= self.num_registers:
+            self.num_registers = r + 1
+        return r
+
+    def _slot(self, name):
+        return self.slots.setdefault(name, len(self.slots))
+
+
+def assemble(asm):
+    return Program(asm)
+
+
+def _operands(ins, flags):
+    # (registers read, registers written) of a decoded instruction; flags is
+    # the pseudo-register index standing for the condition flags
+    h, a, b = ins
+    if h == _LOAD or h == _LOADI:
+        return (), (a,)
+    if h == _STORE or h == _PRINTR:
+        return (a,), ()
+    if h == _MOV:
+        return (b,), (a,)
+    if _ADD <= h <= _DIV:
+        return (a, b), (a,)
+    if h == _NEG:
+        return (a,), (a,)
+    if h == _CMP:
+        return (a, b), (flags,)
+    if h == _CMPI:
+        return (a,), (flags,)
+    if _JE <= h <= _JGE:
+        return (flags,), ()
+    return (), ()
+
+
+def stalls(program, latencies=None):
+    """Stall cycles before each instruction of program under the pipelined
+    model (DEFAULT_LATENCIES unless latencies is given)."""
+    lat = DEFAULT_LATENCIES if latencies is None else latencies
+    code = program.code
+    flags = program.num_registers
+    starts = set(program.labels.values())
+    out = [0] * len(code)
+    ready = {}          # register -> cycle its pending result is available
+    t = 0               # earliest issue cycle of the next instruction
+    for addr, ins in enumerate(code):
+        if addr in starts:
+            ready = {}
+        read, written = _operands(ins, flags)
+        issue = t
+        for r in read + written:
+            c = ready.get(r, 0)
+            if c > issue:
+                issue = c
+        out[addr] = issue - t
+        t = issue + 1
+        done = issue + lat.get(_MNEMONIC[ins[0]], 1)
+        for r in written:
+            ready[r] = done
+        if _JMP <= ins[0] <= _JGE:
+            ready = {}
+    return out
+
+
+class RunStats:
+    """Execution counts of one run. Cycles are derived from the counts under
+    a cost model (DEFAULT_COSTS unless one is given)."""
+
+    def __init__(self, program, hits, taken, output, memory):
+        self.program = program
+        self.hits = hits            # executions per address
+        self.taken = taken          # taken jumps
+        self.output = output
+        self.memory = memory        # variable -> final value
+        counts = {}
+        loads = stores = 0
+        for (h, _, _), n in zip(program.code, hits):
+            if n:
+                m = _MNEMONIC[h]
+                counts[m] = counts.get(m, 0) + n
+                if h == _LOAD or h == _PRINTM:
+                    loads += n
+                elif h == _STORE:
+                    stores += n
+        self.counts = counts        # mnemonic -> executions
+        self.loads = loads          # memory reads
+        self.stores = stores        # memory writes
+        self.steps = sum(hits)
+
+    def cycles_by_opcode(self, costs=None):
+        costs = DEFAULT_COSTS if costs is None else costs
+        return {m: n * costs.get(m, 1) for m, n in self.counts.items()}
+
+    def cycles(self, costs=None):
+        costs = DEFAULT_COSTS if costs is None else costs
+        return sum(self.cycles_by_opcode(costs).values()) + self.taken * costs.get('TAKEN', 0)
+
+    def report(self, costs=None):
+        costs = DEFAULT_COSTS if costs is None else costs
+        by_op = self.cycles_by_opcode(costs)
+        lines = [f"{'opcode':<8}{'count':>10}{'cycles':>12}"]
+        for m in sorted(by_op, key=by_op.get, reverse=True):
+            lines.append(f"{m:<8}{self.counts[m]:>10}{by_op[m]:>12}")
+        lines.append(f"{'taken':<8}{self.taken:>10}{self.taken * costs.get('TAKEN', 0):>12}")
+        lines.append(f"instructions: {self.steps}  cycles: {self.cycles(costs)}")
+        lines.append(f"memory reads: {self.loads}  writes: {self.stores}  "
+                     f"traffic: {self.loads + self.stores}")
+        lines.append(f"pipelined: {self.pipeline_cycles()} cycles, "
+                     f"{self.stall_cycles()} of them stalls")
+        return lines
+
+    def stall_cycles(self, latencies=None):
+        """Cycles lost to stalls under the pipelined model."""
+        return sum(n * s for n, s in zip(self.hits, stalls(self.program, latencies)) if n)
+
+    def pipeline_cycles(self, latencies=None):
+        lat = DEFAULT_LATENCIES if latencies is None else latencies
+        return self.steps + self.stall_cycles(lat) + self.taken * lat.get('TAKEN', 0)
+
+
+class VM:
+    def __init__(self, max_steps=10_000_000):
+        self.max_steps = max_steps
+
+    def run(self, program):
+        """Execute program (a Program or asm lines) and return RunStats."""
+        if not isinstance(program, Program):
+            program = Program(program)
+        code = program.code
+        n = len(code)
+        regs = [0] * max(program.num_registers, 1)
+        mem = [0] * len(program.slots)
+        out = []
+        hits = [0] * n
+        taken = 0
+        flag = 0            # sign of the last CMP: -1, 0 or 1
+        pc = 0
+        budget = self.max_steps
+
+        # handlers return the next pc; nxt is pc + 1
+        def load(a, b, nxt):
+            regs[a] = mem[b]
+            return nxt
+
+        def loadi(a, b, nxt):
+            regs[a] = b
+            return nxt
+
+        def store(a, b, nxt):
+            mem[b] = regs[a]
+            return nxt
+
+        def mov(a, b, nxt):
+            regs[a] = regs[b]
+            return nxt
+
+        def add(a, b, nxt):
+            regs[a] += regs[b]
+            return nxt
+
+        def sub(a, b, nxt):
+            regs[a] -= regs[b]
+            return nxt
+
+        def mul(a, b, nxt):
+            regs[a] *= regs[b]
+            return nxt
+
+        def div(a, b, nxt):
+            try:
+                regs[a] = apply_op('/', regs[a], regs[b])
+            except ZeroDivisionError:
+                raise VMError(f"division by zero at {nxt - 1}: {program.lines[nxt - 1]}") from None
+            return nxt
+
+        def neg(a, b, nxt):
+            regs[a] = -regs[a]
+            return nxt
+
+        def cmp(a, b, nxt):
+            nonlocal flag
+            x, y = regs[a], regs[b]
+            flag = (x > y) - (x < y)
+            return nxt
+
+        def cmpi(a, b, nxt):
+            nonlocal flag
+            x = regs[a]
+            flag = (x > b) - (x < b)
+            return nxt
+
+        def jmp(a, b, nxt):
+            nonlocal taken
+            taken += 1
+            return a
+
+        def branch(test):
+            def jcc(a, b, nxt):
+                nonlocal taken
+                if test(flag):
+                    taken += 1
+                    return a
+                return nxt
+            return jcc
+
+        def printr(a, b, nxt):
+            out.append(regs[a])
+            return nxt
+
+        def printm(a, b, nxt):
+            out.append(mem[a])
+            return nxt
+
+        def printi(a, b, nxt):
+            out.append(a)
+            return nxt
+
+        table = (load, loadi, store, mov, add, sub, mul, div, neg, cmp, cmpi, jmp,
+                 branch(lambda c: c == 0), branch(lambda c: c != 0),
+                 branch(lambda c: c < 0), branch(lambda c: c > 0),
+                 branch(lambda c: c <= 0), branch(lambda c: c >= 0),
+                 printr, printm, printi)
+        decoded = [(table[h], a, b) for h, a, b in code]
+
+        while pc < n:
+            budget -= 1
+            if budget < 0:
+                raise VMError(f"step limit {self.max_steps} exceeded")
+            hits[pc] += 1
+            h, a, b = decoded[pc]
+            pc = h(a, b, pc + 1)
+
+        memory = {name: mem[s] for name, s in program.slots.items()}
+        return RunStats(program, hits, taken, out, memory)
+
+
+def run(asm, max_steps=10_000_000):
+    return VM(max_steps).run(asm)